@@ -0,0 +1,212 @@
+"""
+CameraTour.py - Automatic tour cycling an output through a sequence of cameras
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import json
+import logging
+import threading
+import time
+
+class CameraTour:
+  DEF_DWELL = 10
+  DEF_RESUME_AFTER = 60
+
+  def __init__(self, manager, sequence = None, dwell = DEF_DWELL, output = None,
+               resumeAfter = DEF_RESUME_AFTER):
+    """CameraTour constructor
+
+    It cycles the non grid outputs (or the given one) of a SecurityManager
+    through a sequence of channels. The switch of each step is built and JSON
+    encoded in advance, and sent as a single message at its scheduled time.
+    Steps are scheduled against the tour start, so delays do not accumulate.
+    After a stall longer than a dwell the missed steps are skipped, not sent
+    back to back.
+
+    A manual commuteChannel pauses the tour, which resumes after resumeAfter
+    seconds. Commutes done by the manager itself, e.g. when a source is added,
+    do not pause it.
+
+    Args:
+      manager: The SecurityManager to drive.
+      sequence: The list of channels to visit. If None all the registered
+      channels are visited in order, following channel additions and removals.
+      dwell: The seconds each channel is shown, or a list with the dwell of each
+      step. Optional parameter.
+      output: The name of the output to drive. By default all non grid outputs.
+      resumeAfter: The seconds to wait after a manual commute before resuming,
+      None to stay paused until resume is called. Optional parameter.
+    """
+    self.manager = manager
+    self.sequence = sequence
+    self.dwell = dwell
+    self.output = output
+    self.resumeAfter = resumeAfter
+    self.payloads = []
+    self.outputNames = []
+    self.channels = None
+    self.step = 0
+    self.thread = None
+    self.stopEvent = threading.Event()
+    self.wakeEvent = threading.Event()
+    self.paused = False
+    self.pausedUntil = None
+    self.switches = 0
+    self.skipped = 0
+    self.totalJitter = 0.0
+    self.maxJitter = 0.0
+
+  def getDwell(self, step):
+    if isinstance(self.dwell, (list, tuple)):
+      return self.dwell[step % len(self.dwell)]
+
+    return self.dwell
+
+  def prepare(self):
+    """Builds and encodes the switch payload of every step.
+
+    It only rebuilds them when the channels of the pipe have changed.
+    """
+    channels = self.manager.registry.getChannels()
+    if channels == self.channels and self.payloads:
+      return
+
+    sequence = self.sequence
+    if sequence == None:
+      sequence = channels
+
+    outputs = self.manager.getCommuteOutputs(self.output)
+    payloads = []
+    for channel in sequence:
+      if channel not in channels:
+        logging.error("Tour channel {} does not exist, skipped".format(*[channel]))
+        continue
+      events = self.manager.getCommuteEvents(channel, channels, outputs)
+      payloads.append((channel, json.dumps({'events': events}).encode()))
+
+    self.channels = channels
+    self.payloads = payloads
+    self.outputNames = [cOutput.name for cOutput in outputs]
+
+  def start(self):
+    """Starts the tour in a background thread."""
+    if self.thread != None:
+      return
+
+    self.prepare()
+    self.stopEvent = threading.Event()
+    self.manager.addCommuteListener(self.onCommute)
+    self.thread = threading.Thread(target = self.run, args = (self.stopEvent,), name = 'CameraTour')
+    self.thread.daemon = True
+    self.thread.start()
+
+  def stop(self):
+    self.manager.removeCommuteListener(self.onCommute)
+    self.stopEvent.set()
+    self.wakeEvent.set()
+    if self.thread != None and self.thread != threading.current_thread():
+      self.thread.join()
+    self.thread = None
+
+  def pause(self, seconds = None):
+    """Pauses the tour, for the given seconds or until resume is called."""
+    self.paused = True
+    self.pausedUntil = None
+    if seconds != None:
+      self.pausedUntil = time.monotonic() + seconds
+    self.wakeEvent.set()
+
+  def resume(self):
+    self.paused = False
+    self.pausedUntil = None
+    self.wakeEvent.set()
+
+  def onCommute(self, channel, output):
+    self.pause(self.resumeAfter)
+
+  def switch(self, step):
+    channel, payload = self.payloads[step % len(self.payloads)]
+    self.manager.lms.sendPayload(payload, what = 'tour')
+    for name in self.outputNames:
+      self.manager.visibleChannels[name] = channel
+    return channel
+
+  def run(self, stopEvent):
+    nextTime = time.monotonic()
+    while not stopEvent.is_set():
+      self.wakeEvent.clear()
+
+      if self.paused:
+        if self.pausedUntil != None and time.monotonic() >= self.pausedUntil:
+          self.paused = False
+          nextTime = time.monotonic()
+        else:
+          timeout = None
+          if self.pausedUntil != None:
+            timeout = self.pausedUntil - time.monotonic()
+          self.wakeEvent.wait(timeout)
+          nextTime = time.monotonic()
+          continue
+
+      delay = nextTime - time.monotonic()
+      if delay > 0:
+        self.wakeEvent.wait(delay)
+        continue
+
+      # The dwell is the one of the step being shown
+      dwell = self.getDwell(self.step)
+      try:
+        # Channels cannot change between checking the payloads and sending them
+        with self.manager.lock:
+          self.prepare()
+          if self.payloads:
+            step = self.step % len(self.payloads)
+            dwell = self.getDwell(step)
+            jitter = time.monotonic() - nextTime
+            if dwell > 0 and jitter > dwell:
+              # After a stall the missed switches are dropped instead of being
+              # sent back to back, and the schedule restarts from now
+              self.skipped += int(jitter // dwell)
+              nextTime += jitter
+              jitter = 0
+            self.switch(step)
+            self.addJitter(jitter)
+            self.step = (step + 1) % len(self.payloads)
+      except Exception as e:
+        logging.error("Error switching tour camera: " + str(e))
+
+      nextTime += dwell
+
+  def addJitter(self, jitter):
+    self.switches += 1
+    self.totalJitter += jitter
+    self.maxJitter = max(self.maxJitter, jitter)
+
+  def getStats(self):
+    """Returns the number of switches done and skipped after stalls, and the
+    mean and max jitter in seconds."""
+    if not self.switches:
+      return {'switches': 0, 'skipped': self.skipped, 'meanJitter': 0, 'maxJitter': 0}
+
+    return {'switches': self.switches,
+            'skipped': self.skipped,
+            'meanJitter': self.totalJitter / self.switches,
+            'maxJitter': self.maxJitter}
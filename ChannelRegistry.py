@@ -0,0 +1,164 @@
+"""
+ChannelRegistry.py - Bidirectional registry of the channels of a pipe and
+                     the LMS resources related to each one of them
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+class ChannelRegistry:
+  # Entry keys indexed for reverse lookups
+  INDEXES = ['source', 'sessionId', 'port', 'inputFilterId', 'decoderId']
+
+  def __init__(self):
+    """ChannelRegistry constructor
+
+    It keeps an entry per channel with the following pattern:
+
+      {'channel': 3, 'source': 'rtsp://10.0.0.5/stream1', 'kind': 'rtsp',
+       'sessionId': 'stream1', 'port': 5004, 'inputFilterId': 1, 'inputWriterId': 5004,
+       'decoderId': 14, 'srcPathId': 6,
+       'outputs': {'output': {'resamplerId': 15, 'pathId': 7}, ...}}
+
+    and reverse indexes from sources, sessions, ports and filters to channels,
+    so every lookup is a dictionary access and needs no LMS state.
+    """
+    self.entries = {}
+    self.indexes = {}
+    self.filters = {}
+    self.paths = {}
+    self.clear()
+
+  def clear(self):
+    self.entries = {}
+    self.indexes = dict((key, {}) for key in self.INDEXES)
+    self.filters = {}
+    self.paths = {}
+
+  def register(self, entry):
+    """Registers a channel entry, replacing any previous entry of the same channel.
+
+    Args:
+      entry: A dictionary describing the channel, see the constructor.
+    """
+    channel = entry['channel']
+    if channel in self.entries:
+      self.unregister(channel)
+
+    entry.setdefault('outputs', {})
+    self.entries[channel] = entry
+    for key in self.INDEXES:
+      if entry.get(key) != None:
+        self.indexes[key].setdefault(entry[key], set()).add(channel)
+
+    # Decoders and source paths are shared by the channels of a source
+    for fId in self.getFilterIds(entry):
+      self.filters.setdefault(fId, set()).add(channel)
+    for pId in self.getPathIds(entry):
+      self.paths.setdefault(pId, set()).add(channel)
+
+  def unregister(self, channel):
+    """Removes a channel from the registry.
+
+    Returns:
+      The removed entry or None if the channel was not registered.
+    """
+    entry = self.entries.pop(channel, None)
+    if entry == None:
+      return None
+
+    for key in self.INDEXES:
+      self.discard(self.indexes[key], entry.get(key), channel)
+    for fId in self.getFilterIds(entry):
+      self.discard(self.filters, fId, channel)
+    for pId in self.getPathIds(entry):
+      self.discard(self.paths, pId, channel)
+
+    return entry
+
+  def discard(self, index, value, channel):
+    channels = index.get(value)
+    if channels != None:
+      channels.discard(channel)
+      if not channels:
+        del index[value]
+
+  def getFilterIds(self, entry):
+    ids = [output['resamplerId'] for output in entry['outputs'].values()]
+    if entry.get('decoderId') != None:
+      ids.append(entry['decoderId'])
+
+    return ids
+
+  def getPathIds(self, entry):
+    ids = [output['pathId'] for output in entry['outputs'].values()]
+    if entry.get('srcPathId') != None:
+      ids.append(entry['srcPathId'])
+
+    return ids
+
+  def getEntry(self, channel):
+    return self.entries.get(channel)
+
+  def hasChannel(self, channel):
+    return channel in self.entries
+
+  def getChannels(self):
+    """Returns the sorted list of registered channels."""
+    return sorted(self.entries)
+
+  def lookup(self, key, value):
+    """Returns the sorted list of channels whose entry has the given value for key.
+
+    Args:
+      key: One of source, sessionId, port, inputFilterId or decoderId.
+      value: The value to look for.
+    """
+    return sorted(self.indexes[key].get(value, ()))
+
+  def getSource(self, channel):
+    """Returns the source (RTSP uri or V4L device) of a channel, None if unknown."""
+    entry = self.entries.get(channel)
+    if entry == None:
+      return None
+
+    return entry.get('source')
+
+  def getChannelsBySource(self, source):
+    return self.lookup('source', source)
+
+  def getChannelsBySession(self, sessionId):
+    return self.lookup('sessionId', sessionId)
+
+  def getChannelsByPort(self, port):
+    return self.lookup('port', port)
+
+  def getChannelsByFilter(self, fId):
+    """Returns the sorted list of channels using a decoder or resampler."""
+    return sorted(self.filters.get(fId, ()))
+
+  def getChannelsByPath(self, pId):
+    """Returns the sorted list of channels using a path."""
+    return sorted(self.paths.get(pId, ()))
+
+  def getSessionByPort(self, port):
+    for channel in self.indexes['port'].get(port, ()):
+      return self.entries[channel].get('sessionId')
+
+    return None
@@ -0,0 +1,141 @@
+"""
+ControlClient.py - Thin command line client for the ControlDaemon
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+
+Usage:
+  python -m LMSPythonManager.ControlClient [--socket PATH] COMMAND [ARGS] [key=value ...]
+
+  Examples:
+    python -m LMSPythonManager.ControlClient add rtsp://10.0.0.5/stream1
+    python -m LMSPythonManager.ControlClient commute 3
+    python -m LMSPythonManager.ControlClient configure output=mobile width=640 height=360
+    python -m LMSPythonManager.ControlClient remove 3
+
+It only depends on socket and json so it starts fast, all the work is done
+by the daemon.
+"""
+
+import json
+import socket
+import sys
+
+DEF_SOCKET = '/tmp/lms-control.sock'
+
+# Names of the positional arguments of each command
+POSITIONAL = {
+  'start': ['grid'],
+  'add': ['uri', 'keepAlive'],
+  'addv4l': ['device', 'width', 'height', 'fps'],
+  'remove': ['channel'],
+  'commute': ['channel', 'output'],
+  'encoder': ['output'],
+  'info': ['channel'],
+}
+
+class ControlClient:
+  def __init__(self, socketPath = DEF_SOCKET):
+    """ControlClient constructor
+
+    Args:
+      socketPath: The path of the Unix socket the daemon listens to. Optional parameter.
+    """
+    self.socketPath = socketPath
+
+  def call(self, command, **args):
+    """Sends a command to the daemon.
+
+    Returns:
+      The result of the command.
+
+    Raises:
+      Exception: The daemon returned an error message. The message is
+      included in the Exception.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(self.socketPath)
+      sock.sendall(json.dumps({'command': command, 'args': args}).encode() + b'\n')
+      data = b''
+      while not data.endswith(b'\n'):
+        chunk = sock.recv(65536)
+        if not chunk:
+          break
+        data += chunk
+    finally:
+      sock.close()
+
+    res = json.loads(data.decode())
+    if res.get('error') != None:
+      raise Exception(res['error'])
+
+    return res.get('result')
+
+def parseValue(value):
+  try:
+    return json.loads(value)
+  except ValueError:
+    if value.lower() in ('true', 'false'):
+      return value.lower() == 'true'
+    return value
+
+def parseArgs(command, argv):
+  args = {}
+  names = POSITIONAL.get(command, [])
+  positional = 0
+  for arg in argv:
+    if '=' in arg and not arg.startswith('rtsp:'):
+      key, value = arg.split('=', 1)
+      args[key] = parseValue(value)
+    elif positional < len(names):
+      args[names[positional]] = parseValue(arg)
+      positional += 1
+    else:
+      raise Exception("Unexpected argument {}".format(*[arg]))
+
+  return args
+
+def main(argv = None):
+  if argv == None:
+    argv = sys.argv[1:]
+
+  socketPath = DEF_SOCKET
+  if len(argv) >= 2 and argv[0] == '--socket':
+    socketPath = argv[1]
+    argv = argv[2:]
+
+  if not argv or argv[0] in ('-h', '--help'):
+    sys.stderr.write(__doc__[__doc__.index('Usage:'):])
+    return 2
+
+  try:
+    command = argv[0]
+    result = ControlClient(socketPath).call(command, **parseArgs(command, argv[1:]))
+  except Exception as e:
+    sys.stderr.write("error: {}\n".format(*[e]))
+    return 1
+
+  if result != None:
+    print(json.dumps(result))
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+ControlDaemon.py - Resident daemon holding a SecurityManager and serving
+                   commands over a local Unix socket
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+
+Usage:
+  python -m LMSPythonManager.ControlDaemon --lms-host 127.0.0.1 --lms-port 7777
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import time
+
+from . import SecurityManager
+
+DEF_SOCKET = '/tmp/lms-control.sock'
+
+class ControlHandler(socketserver.StreamRequestHandler):
+  def handle(self):
+    for line in self.rfile:
+      if not line.strip():
+        continue
+      res = self.server.daemon.dispatch(line)
+      self.wfile.write(json.dumps(res).encode() + b'\n')
+      self.wfile.flush()
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+class ControlDaemon:
+  STATE_TTL = 1
+
+  def __init__(self, host, port, socketPath = DEF_SOCKET, namespace = None):
+    """ControlDaemon constructor
+
+    It creates a SecurityManager for the given LMS instance and serves the
+    commands received through a Unix socket. Each request is a JSON line with
+    the following pattern:
+
+      {'command': 'add', 'args': {'uri': 'rtsp://...'}}
+
+    and it is answered with a JSON line such as {'result': 1, 'error': None}.
+
+    Args:
+      host: The host in which the LiveMediaStreamer is running.
+      port: The port in which the LiveMediaStreamer is listening.
+      socketPath: The path of the Unix socket to listen to. Optional parameter.
+      namespace: The Namespace, or NAME:BASE[:SIZE] string, of the managed pipe, so
+      several daemons can share a LMS instance. Optional parameter.
+    """
+    self.manager = SecurityManager.SecurityManager(host, port, namespace)
+    self.socketPath = socketPath
+    self.server = None
+    self.state = None
+    self.stateTime = 0
+    self.commands = {
+      'ping': self.ping,
+      'start': self.start,
+      'stop': self.stop,
+      'reset': self.reset,
+      'add': self.add,
+      'addv4l': self.addV4L,
+      'remove': self.remove,
+      'commute': self.commute,
+      'configure': self.configure,
+      'encoder': self.encoder,
+      'outputs': self.outputs,
+      'info': self.info,
+      'state': self.getState,
+      'shm': self.sharedMemory,
+    }
+
+  def dispatch(self, line):
+    """Runs the command encoded in the given JSON line.
+
+    Returns:
+      A dictionary with the result of the command and the error message, if any.
+    """
+    try:
+      req = json.loads(line.decode())
+      command = self.commands.get(req.get('command'))
+      if command == None:
+        raise Exception("Unknown command {}".format(*[req.get('command')]))
+      return {'result': command(**req.get('args', {})), 'error': None}
+    except Exception as e:
+      logging.error("Error running command: " + str(e))
+      return {'result': None, 'error': str(e)}
+
+  def mutate(self, method, *args, **kwargs):
+    # SecurityManager serializes the mutations itself, only the cache is handled here
+    self.state = None
+    try:
+      return method(*args, **kwargs)
+    finally:
+      self.state = None
+
+  def ping(self):
+    return 'pong'
+
+  def start(self, grid = False):
+    return self.mutate(self.manager.startPipe, grid)
+
+  def stop(self):
+    self.mutate(self.manager.stopPipe)
+
+  def reset(self, keepSources = True):
+    return self.mutate(self.manager.resetPipe, keepSources = keepSources)
+
+  def add(self, uri, keepAlive = True):
+    return self.mutate(self.manager.addRTSPSource, uri, keepAlive)
+
+  def addV4L(self, device, width, height, fps, pformat = "YUYV", forceformat = True):
+    return self.mutate(self.manager.addV4LSource, device, width, height, fps, pformat, forceformat)
+
+  def remove(self, channel):
+    self.mutate(self.manager.removeInputChannel, channel)
+
+  def commute(self, channel, output = None):
+    self.mutate(self.manager.commuteChannel, channel, output)
+
+  def configure(self, output = None, fps = None, width = None, height = None):
+    if fps != None:
+      self.mutate(self.manager.setOutputFPS, fps, output)
+    if width != None and height != None:
+      self.mutate(self.manager.setOutputResolution, width, height, output)
+
+  def encoder(self, output = None, **params):
+    if not params:
+      return self.manager.getEncoderParams(output)
+
+    # Only the given parameters are sent, the others keep their value
+    names = {'bitrate': 'bitrate', 'gop': 'gop', 'lookahead': 'lookahead', 'bframes': 'bFrames',
+             'threads': 'threads', 'annexb': 'annexb', 'preset': 'preset'}
+    unknown = [key for key in params if key not in names]
+    if unknown:
+      raise Exception("Unknown encoder parameters {}".format(*[', '.join(unknown)]))
+
+    kwargs = dict((names[key], value) for key, value in params.items())
+    self.mutate(self.manager.setEncoderParams, output = output, **kwargs)
+
+  def outputs(self):
+    return [{'name': output.name, 'width': output.width, 'height': output.height,
+             'fps': output.fps, 'grid': output.grid} for output in self.manager.getOutputs()]
+
+  def info(self, channel = None, source = None):
+    if source != None:
+      return self.manager.getSourceChannels(source)
+
+    return self.manager.getChannelInfo(channel)
+
+  def getState(self, fresh = False):
+    """Returns the LMS state, cached for STATE_TTL seconds unless fresh is set."""
+    state = self.state
+    if fresh or state == None or time.monotonic() - self.stateTime > self.STATE_TTL:
+      state = self.manager.getState()
+      self.state = state
+      self.stateTime = time.monotonic()
+
+    return state
+
+  def sharedMemory(self):
+    return self.manager.getSharedMemoryId()
+
+  def serve(self):
+    """Listens to the Unix socket and serves commands until shutdown is called.
+
+    Raises:
+      Exception: In case another daemon is listening to the socket raises an Exception.
+    """
+    if os.path.exists(self.socketPath):
+      if self.isSocketAlive():
+        raise Exception("Another daemon is listening to {}".format(*[self.socketPath]))
+      os.unlink(self.socketPath)
+
+    self.server = ControlServer(self.socketPath, ControlHandler)
+    self.server.daemon = self
+    try:
+      self.server.serve_forever()
+    finally:
+      self.server.server_close()
+      if os.path.exists(self.socketPath):
+        os.unlink(self.socketPath)
+
+  def isSocketAlive(self):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.settimeout(1)
+      sock.connect(self.socketPath)
+      return True
+    except socket.error:
+      # Nobody answers, it is a leftover of a daemon that did not exit cleanly
+      return False
+    finally:
+      sock.close()
+
+  def shutdown(self):
+    if self.server != None:
+      self.server.shutdown()
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = 'LMS security scenario control daemon')
+  parser.add_argument('--lms-host', default = '127.0.0.1')
+  parser.add_argument('--lms-port', type = int, default = 7777)
+  parser.add_argument('--socket', default = DEF_SOCKET)
+  parser.add_argument('--start', action = 'store_true', help = 'start the pipe on launch')
+  parser.add_argument('--grid', action = 'store_true', help = 'enable grid mode on launch')
+  parser.add_argument('--namespace', help = 'NAME:BASE[:SIZE] range of LMS IDs owned by this daemon')
+  args = parser.parse_args(argv)
+
+  daemon = ControlDaemon(args.lms_host, args.lms_port, args.socket, args.namespace)
+  if args.start:
+    daemon.start(args.grid)
+
+  daemon.serve()
+
+if __name__ == '__main__':
+  main()
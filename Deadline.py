@@ -0,0 +1,108 @@
+"""
+Deadline.py - Time budgets propagated through LMS calls and the related
+              timeout errors
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import time
+
+from . import Tracing
+
+class LMSTimeoutError(Exception):
+  """Base class of all the timeout errors."""
+
+class ConnectTimeoutError(LMSTimeoutError):
+  """Connecting to LiveMediaStreamer took too long."""
+
+class SendTimeoutError(LMSTimeoutError):
+  """Sending the events to LiveMediaStreamer took too long."""
+
+class RecvTimeoutError(LMSTimeoutError):
+  """LiveMediaStreamer took too long to answer."""
+
+class DeadlineExceededError(LMSTimeoutError):
+  """The time budget of an operation has been exhausted."""
+
+class Deadline:
+  def __init__(self, timeout = None):
+    """Deadline constructor
+
+    It creates a time budget which is shared by all the sub-calls of an
+    operation, each one of them only gets the remaining budget.
+
+    Args:
+      timeout: The budget in seconds. If None the deadline never expires.
+    """
+    self.timeout = timeout
+    self.expiry = None
+    if timeout != None:
+      self.expiry = time.monotonic() + timeout
+
+  def remaining(self):
+    """Returns the remaining seconds, or None if the deadline never expires."""
+    if self.expiry == None:
+      return None
+
+    return max(self.expiry - time.monotonic(), 0)
+
+  def expired(self):
+    return self.expiry != None and time.monotonic() >= self.expiry
+
+  def check(self, what = 'operation'):
+    """Raises a DeadlineExceededError if the deadline has expired."""
+    if self.expired():
+      raise DeadlineExceededError("Deadline of {}s exceeded in {}".format(*[self.timeout, what]))
+
+  def cap(self, timeout):
+    """Returns the given timeout capped to the remaining budget.
+
+    Args:
+      timeout: A timeout in seconds or None for no timeout.
+
+    Returns:
+      The smallest of timeout and the remaining budget, None if both are unbounded.
+    """
+    remaining = self.remaining()
+    if remaining == None:
+      return timeout
+    if timeout == None:
+      return remaining
+
+    return min(timeout, remaining)
+
+  def sleep(self, seconds):
+    """Sleeps the given seconds or until the deadline expires, whichever comes first."""
+    seconds = self.cap(seconds)
+    if seconds > 0:
+      span = Tracing.begin('sleep', 'wait', seconds = seconds)
+      time.sleep(seconds)
+      Tracing.end(span)
+
+def toDeadline(deadline):
+  """Converts the deadline argument of a public method to a Deadline.
+
+  Args:
+    deadline: A Deadline, a number of seconds or None for no deadline.
+  """
+  if isinstance(deadline, Deadline):
+    return deadline
+
+  return Deadline(deadline)
@@ -0,0 +1,83 @@
+"""
+HashRing.py - Weighted consistent hashing ring
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import bisect
+import hashlib
+
+def hashKey(key):
+  return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+class HashRing:
+  VNODES = 64
+
+  def __init__(self):
+    """HashRing constructor
+
+    It places VNODES virtual points per unit of weight of each node in a ring,
+    so heavier nodes own a bigger share of the keys and adding or removing a
+    node only moves the keys of the ring segments it owns.
+    """
+    self.points = []
+    self.owners = []
+    self.weights = {}
+
+  def addNode(self, name, weight = 1):
+    self.weights[name] = weight
+    self.build()
+
+  def removeNode(self, name):
+    self.weights.pop(name, None)
+    self.build()
+
+  def build(self):
+    ring = []
+    for name, weight in self.weights.items():
+      for vnode in range(max(int(round(weight * self.VNODES)), 1)):
+        ring.append((hashKey('{}#{}'.format(*[name, vnode])), name))
+
+    ring.sort()
+    self.points = [point for point, name in ring]
+    self.owners = [name for point, name in ring]
+
+  def getNodes(self, key):
+    """Returns all the nodes in ring order starting from the owner of the given key."""
+    if not self.points:
+      return []
+
+    idx = bisect.bisect(self.points, hashKey(key)) % len(self.points)
+    nodes = []
+    for i in range(len(self.points)):
+      name = self.owners[(idx + i) % len(self.points)]
+      if name not in nodes:
+        nodes.append(name)
+        if len(nodes) == len(self.weights):
+          break
+
+    return nodes
+
+  def getNode(self, key):
+    nodes = self.getNodes(key)
+    if not nodes:
+      return None
+
+    return nodes[0]
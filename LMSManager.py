@@ -24,27 +24,55 @@ Authors: David Cassany <david.cassany@i2cat.net>
 import socket
 import logging
 import json
+import threading
+
+from . import Deadline
+from . import Tracing
+from . import Transport
+
+# Polls send the same getState many times, so it is encoded once
+GET_STATE = json.dumps({'events': [{'action': 'getState', 'params': {}}]}).encode()
 
 class LMSManager:
-  sock = None
   BUFFER_SIZE = 65536
+  CONNECT_TIMEOUT = 5
+  SEND_TIMEOUT = 5
+  RECV_TIMEOUT = 30
 
-  def __init__(self, host, port):
+  def __init__(self, host, port = None, connectTimeout = CONNECT_TIMEOUT, 
+               sendTimeout = SEND_TIMEOUT, recvTimeout = RECV_TIMEOUT):
     """LMSManager constructor
 
-    It creates a new istance of the LMSManager.
+    It creates a new istance of the LMSManager. Each request uses its own 
+    connection, so an instance can be shared among threads.
 
     Args:
-      host: The host in which the LiveMediaStreamer is running.
+      host: The host in which the LiveMediaStreamer is running. It can also be an
+      URL-style address selecting the transport, in which case port is ignored:
+
+        tcp://host:port?nodelay=1&keepalive=1&sndbuf=65536&rcvbuf=65536
+        unix:///path/to/lms.sock
+
       port: The port in which the LiveMediaStreamer is listening. 
+      connectTimeout: Seconds to wait for the connection to be established, None 
+      to wait forever. Optional parameter.
+      sendTimeout: Seconds to wait for the events to be sent, None to wait forever.
+      Optional parameter.
+      recvTimeout: Seconds to wait for the answer, None to wait forever. Optional parameter.
     """
     self.host = host
     self.port = port
+    self.transport = Transport.createTransport(host, port)
+    self.connectTimeout = connectTimeout
+    self.sendTimeout = sendTimeout
+    self.recvTimeout = recvTimeout
+    self.watchers = {}
+    self.watcherLock = threading.Lock()
 
   def testConnection(self):
     """Tests the connectivity of this LMSManager instance
 
-    It creates a TCP client sockect connection the specified **IP** and **port**.
+    It creates a client sockect connection to the specified address.
     Right after getting a successful connection the socket is closed again. 
     In case of failure logs a message to stderr.
 
@@ -52,19 +80,19 @@ class LMSManager:
       True if the socket connection was successful, False otherwhise. 
     """
     res = True
+    sock = self.transport.createSocket()
     try:
-      self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-      self.sock.connect((self.host, self.port))
+      sock.settimeout(self.connectTimeout)
+      sock.connect(self.transport.getAddress())
     except socket.error:
-      logging.error('couldn\'t connect to {} host and {} port'.format(*[self.host, self.port]))
+      logging.error('couldn\'t connect to {}'.format(*[self.transport]))
       res = False
     finally:
-      self.sock.close()
-      self.sock = None
+      sock.close()
 
     return res
 
-  def sendEvents(self, eJson):
+  def sendEvents(self, eJson, deadline = None):
     """Sends events to a remote LiveMediaStreamer service.
 
     Sends a list of events to a remote LiveMediaStreamer service.
@@ -76,6 +104,8 @@ class LMSManager:
       eJson: it is a dictionary that contains a list of events, each element
       of the list is another dictionary containing all the parameters of 
       an specific event.
+      deadline: A Deadline bounding the whole call. Connect, send and receive
+      timeouts are capped to its remaining budget. Optional parameter.
 
     Returns:
       A dictionary containing the return value of the LiveMediaStreamer. It 
@@ -84,30 +114,93 @@ class LMSManager:
     Raises:
       Exception: LiveMediaStreamer returned an error message. The message is 
       included in the Exception. 
+      LMSTimeoutError: Connecting, sending or receiving took too long. A 
+      DeadlineExceededError is raised if the deadline was the exhausted budget.
+    """
+    payload = json.dumps(eJson)
+    actions = [event['action'] for event in eJson['events']]
+    what = '+'.join(sorted(set(actions), key = actions.index))
+    res = self.sendPayload(payload.encode(), deadline, what, actions)
+
+    print(payload)
+
+    return res
+
+  def sendPayload(self, payload, deadline = None, what = 'request', actions = None):
+    """Sends already encoded events to a remote LiveMediaStreamer service.
+
+    It is the transmission part of sendEvents, so callers sending the same 
+    events many times can encode them once. Nothing is printed to stdout.
+
+    Args:
+      payload: The JSON encoded events, as bytes.
+      deadline: A Deadline bounding the whole call. Optional parameter.
+      what: A description of the request used in timeout messages. Optional parameter.
+      actions: The list of actions of the events, recorded in the trace span.
+      Optional parameter.
+
+    Returns:
+      A dictionary containing the return value of the LiveMediaStreamer.
+
+    Raises:
+      Exception: LiveMediaStreamer returned an error message. The message is 
+      included in the Exception. 
+      LMSTimeoutError: Connecting, sending or receiving took too long.
     """
+    if deadline == None:
+      deadline = Deadline.Deadline()
+    deadline.check(what)
+
+    span = Tracing.begin(what, 'lms', sent = len(payload))
+    if span != None and actions != None:
+      span.args['actions'] = actions
     res = None
+    step = 'connect'
+    sock = self.transport.createSocket()
     try:
-      self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-      self.sock.connect((self.host, self.port))
-      self.sock.send(json.dumps(eJson).encode())
-      res = self.sock.recv(self.BUFFER_SIZE)
+      sock.settimeout(deadline.cap(self.connectTimeout))
+      sock.connect(self.transport.getAddress())
+      step = 'send'
+      sock.settimeout(deadline.cap(self.sendTimeout))
+      sock.sendall(payload)
+      step = 'recv'
+      sock.settimeout(deadline.cap(self.recvTimeout))
+      res = sock.recv(self.BUFFER_SIZE)
+      step = None
+    except socket.timeout:
+      self.raiseTimeout(step, deadline)
     except socket.error:
-      logging.error('couldn\'t connect to {} host and {} port'.format(*[self.host, self.port]))
+      logging.error('couldn\'t connect to {}'.format(*[self.transport]))
     finally:
-      self.sock.close()
-      self.sock = None
+      sock.close()
+      if span != None:
+        span.args['received'] = len(res) if res != None else 0
+        if step != None:
+          span.args['failedStep'] = step
+        Tracing.end(span)
 
     if res != None:
+      span = Tracing.begin('parse', 'lms', size = len(res))
       res = json.loads(res.decode())
+      Tracing.end(span)
       
       if 'error' in res and res['error'] != None:
         raise Exception(res['error'])
 
-    print(json.dumps(eJson))
-
     return res
 
-  def getState(self):
+  def raiseTimeout(self, step, deadline):
+    msg = '{} timeout with {}'.format(*[step, self.transport])
+    logging.error(msg)
+    if deadline.expired():
+      raise Deadline.DeadlineExceededError(msg)
+    if step == 'connect':
+      raise Deadline.ConnectTimeoutError(msg)
+    if step == 'send':
+      raise Deadline.SendTimeoutError(msg)
+    raise Deadline.RecvTimeoutError(msg)
+
+  def getState(self, deadline = None):
     """Gets the current state of the LiveMediaStreamer service.
 
     Gets a dictionary containig the list of filters and paths. For each
@@ -119,14 +212,55 @@ class LMSManager:
         
         {'filters': [*-list of filters with the current status of each one-*], 'paths': [*-list of paths-*]}
 
+    Args:
+      deadline: A Deadline bounding the call. Optional parameter.
+
     Raises:
       Exception: LiveMediaStreamer returned an error message. The message is 
       included in the Exception. 
     """
     eJson = {'events': [{'action': 'getState', 'params': {}}]}
-    return self.sendEvents(eJson)
+    return self.sendEvents(eJson, deadline)
+
+  def pollState(self, deadline = None):
+    """Gets the current state as getState does, for periodic polls.
+
+    The request is encoded once and sent through sendPayload, so nothing is
+    printed to stdout.
+
+    Args:
+      deadline: A Deadline bounding the call. Optional parameter.
+
+    Returns:
+      A dictionary describing the LiveMediaStreamer state, see getState.
+    """
+    return self.sendPayload(GET_STATE, deadline, 'getState', ['getState'])
+
+  def watch(self, interval = 1, timeout = None):
+    """Watches the state of the LiveMediaStreamer service.
 
-  def createFilter(self, fId, fType):
+    All the watchers of this instance with the same interval share a single poll.
+
+    Args:
+      interval: The polling interval in seconds. Optional parameter.
+      timeout: If no change arrives within timeout seconds the generator ends. 
+      Optional parameter.
+
+    Returns:
+      A generator yielding the changes between successive states, see 
+      StateWatcher.diffRecords for the format.
+    """
+    from . import StateWatcher
+
+    with self.watcherLock:
+      watcher = self.watchers.get(interval)
+      if watcher == None:
+        watcher = StateWatcher.StateWatcher(self, interval)
+        self.watchers[interval] = watcher
+
+    return watcher.watch(timeout)
+
+  def createFilter(self, fId, fType, deadline = None):
     """Sends an event to create a filter.
 
     Sends an event to create a filter of the specified type and with the given ID. 
@@ -136,6 +270,7 @@ class LMSManager:
       within the whole pipe.
       fType: An string representing the type of the filter to create. Available types are listed
       in **Types.hh** file within the LiveMediaStreamer code. 
+      deadline: A Deadline bounding the call. Optional parameter.
 
     Returns:
       A dictionary containing the return value of the LiveMediaStreamer. It 
@@ -149,9 +284,9 @@ class LMSManager:
     event = {'action': 'createFilter', 'params': params} 
     eJson = {'events': [event]}
 
-    return self.sendEvents(eJson)
+    return self.sendEvents(eJson, deadline)
 
-  def removePath(self, pId):
+  def removePath(self, pId, deadline = None):
     """Sends an event to delete the path with the specified ID.
 
     Sends an event to remove path with the specified ID. All related filters
@@ -160,6 +295,7 @@ class LMSManager:
 
     Args: 
       pId: An integer representing the ID of the path to remove.  
+      deadline: A Deadline bounding the call. Optional parameter.
 
     .. warning: 
       This method is not stable as it should, be careful while using it, it might cause
@@ -170,11 +306,13 @@ class LMSManager:
     eJson = {'events': [event]}
 
     try:
-      return self.sendEvents(eJson)
+      return self.sendEvents(eJson, deadline)
+    except Deadline.LMSTimeoutError:
+      raise
     except Exception as e:
       logging.error("Error removing path: " + str(e))
 
-  def removeFilter(self, fId):
+  def removeFilter(self, fId, deadline = None):
     """Sends an event to delete the filter with he specified ID.
 
     Sends an event to remove the filter with the specified. It will be removed
@@ -182,17 +320,20 @@ class LMSManager:
 
     Args: 
       fId: An integer representing the ID of the filter to remove.  
+      deadline: A Deadline bounding the call. Optional parameter.
     """
     params = {'id': fId}
     event = {'action': 'removeFilter', 'params': params} 
     eJson = {'events': [event]}
 
     try:
-      return self.sendEvents(eJson)
+      return self.sendEvents(eJson, deadline)
+    except Deadline.LMSTimeoutError:
+      raise
     except Exception as e:
       logging.error("Error removing filter: " + str(e))
 
-  def createPath(self, pId, orgFilterId, dstFilterId, orgWriterId, dstReaderId, filtersIds):
+  def createPath(self, pId, orgFilterId, dstFilterId, orgWriterId, dstReaderId, filtersIds, deadline = None):
     """Sends an event to create a new path.
 
     Sends an event to create a new path with the specified filters, reader and writer. 
@@ -203,6 +344,7 @@ class LMSManager:
       dstfilterId: The ID of the filter in which the path ends. 
       orgWriterId: The ID of the writer to be used in origin filter.
       dstReaderId: The ID of the reader to be used in destination filter.
+      deadline: A Deadline bounding the call. Optional parameter.
 
     Returns:
       A dictionary containing the return value of the LiveMediaStreamer. It 
@@ -218,21 +360,26 @@ class LMSManager:
     event = {'action': 'createPath', 'params': params} 
     eJson = {'events': [event]}
 
-    return self.sendEvents(eJson)
+    return self.sendEvents(eJson, deadline)
         
-  def stop(self):
+  def stop(self, deadline = None):
     """Stops the current pipe.
 
     It deletes all paths and filters, so the pipe is completeley cleared.
+
+    Args:
+      deadline: A Deadline bounding the call. Optional parameter.
     """
     eJson = {'events': [{'action': 'stop', 'params':{}}]}
 
     try:
-      return self.sendEvents(eJson)
+      return self.sendEvents(eJson, deadline)
+    except Deadline.LMSTimeoutError:
+      raise
     except Exception as e:
       logging.error("Error stopping pipe: " + str(e))
 
-  def filterEvent(self, fId, action, params):
+  def filterEvent(self, fId, action, params, deadline = None):
     """Sends an event to a filter.
 
     Sends the specified event to the specified filter. 
@@ -242,6 +389,7 @@ class LMSManager:
       action: An string specifiying the action to trigger.
       params: A dictionary containing all the parameters related to the specified
       action of the specified filter.
+      deadline: A Deadline bounding the call. Optional parameter.
 
     Returns:
       A dictionary containing the return value of the LiveMediaStreamer. It 
@@ -252,6 +400,6 @@ class LMSManager:
       included in the Exception. 
     """
     eJson = {'events': [{'action': action, 'filterId': fId, 'params': params}]}
-    return self.sendEvents(eJson)
+    return self.sendEvents(eJson, deadline)
 
 
@@ -0,0 +1,112 @@
+"""
+Namespace.py - Partition of the LMS filter, path and stream IDs among managers
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+class Namespace:
+  DEF_SIZE = 1000
+
+  def __init__(self, name = None, base = 0, size = DEF_SIZE):
+    """Namespace constructor
+
+    A namespace owns the filter, path and stream IDs in the range
+    (base, base + size]. Managers using disjoint namespaces can share a single
+    LMS instance, as each one only sees and removes its own filters and paths.
+
+    The default namespace, without name, owns every ID and behaves as a
+    manager owning the whole LMS instance.
+
+    Args:
+      name: The name of the namespace, used to prefix its RTSP output names.
+      base: The ID preceding the first ID of the namespace. Optional parameter.
+      size: The number of IDs of the namespace. Optional parameter.
+    """
+    if name != None and (not name or '/' in name):
+      raise Exception("Invalid namespace name {}".format(*[name]))
+    if base < 0 or (size != None and size <= 0):
+      raise Exception("Invalid namespace range")
+
+    self.name = name
+    self.base = base
+    self.size = size if name != None else None
+
+  def isScoped(self):
+    """Returns True unless this is the default namespace owning every ID."""
+    return self.name != None
+
+  def contains(self, fId):
+    return fId > self.base and (self.size == None or fId <= self.base + self.size)
+
+  def overlaps(self, other):
+    if not self.isScoped() or not other.isScoped():
+      return True
+
+    return self.base < other.base + other.size and other.base < self.base + self.size
+
+  def getId(self, offset):
+    """Returns the ID at the given offset (starting at 1) of the namespace."""
+    return self.check(self.base + offset)
+
+  def check(self, fId):
+    """Checks that the given ID belongs to the namespace.
+
+    Returns:
+      The given ID.
+
+    Raises:
+      Exception: In case the namespace has run out of IDs raises an Exception.
+    """
+    if not self.contains(fId):
+      raise Exception("Namespace {} has no free IDs left".format(*[self.name]))
+
+    return fId
+
+  def getStreamName(self, name):
+    """Returns the RTSP name published for the output with the given name."""
+    if not self.isScoped():
+      return name
+
+    return '{}-{}'.format(*[self.name, name])
+
+  def filterState(self, state):
+    """Restricts a getState snapshot to the filters and paths of the namespace."""
+    if state == None or not self.isScoped():
+      return state
+
+    res = dict(state)
+    res['filters'] = [cFilter for cFilter in state.get('filters', []) if self.contains(cFilter['id'])]
+    res['paths'] = [cPath for cPath in state.get('paths', []) if self.contains(cPath['id'])]
+    return res
+
+  def __str__(self):
+    if not self.isScoped():
+      return 'default'
+
+    return '{}:{}:{}'.format(*[self.name, self.base, self.size])
+
+def parseNamespace(spec):
+  """Parses a NAME:BASE[:SIZE] namespace specification."""
+  parts = spec.split(':')
+  if len(parts) not in (2, 3):
+    raise Exception("Invalid namespace {}, expected NAME:BASE[:SIZE]".format(*[spec]))
+
+  size = int(parts[2]) if len(parts) == 3 else Namespace.DEF_SIZE
+  return Namespace(parts[0], int(parts[1]), size)
@@ -0,0 +1,84 @@
+"""
+Output.py - Description of an output rendition of a SecurityManager pipe
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+class Output:
+  DEF_FPS = 25
+  DEF_WIDTH = 1280
+  DEF_HEIGHT = 720
+
+  def __init__(self, name, width = DEF_WIDTH, height = DEF_HEIGHT, fps = DEF_FPS,
+               grid = False, sharedMemory = False, encoderParams = None):
+    """Output constructor
+
+    It describes one rendition published by a pipe. Each output owns a videoMixer,
+    a videoResampler, a videoEncoder and an RTSP connection in the transmitter.
+    Decoded sources are fanned out to every output of the pipe.
+
+    Args:
+      name: The RTSP name of the output stream. It must be unique within the pipe.
+      width: The output width. Optional parameter.
+      height: The output height. Optional parameter.
+      fps: The output frames per second. Optional parameter.
+      grid: If True all channels are shown in a grid, otherwise only the
+      commuted channel is shown. Disabled by default. Optional parameter.
+      sharedMemory: If True a sharedMemory filter is attached to this output.
+      Disabled by default. Optional parameter.
+      encoderParams: A dictionary with extra videoEncoder configuration
+      (i.e. bitrate, gop, preset) applied when the pipe is started. Optional parameter.
+    """
+    self.name = name
+    self.width = width
+    self.height = height
+    self.fps = fps
+    self.grid = grid
+    self.sharedMemory = sharedMemory
+    self.encoderParams = encoderParams or {}
+    self.encoderId = None
+    self.mixerId = None
+    self.resamplerId = None
+    self.sharedMemoryId = None
+    self.pathId = None
+    self.streamId = None
+
+  def assignIds(self, filterId, pathId, streamId):
+    """Assigns the static LMS IDs used by this output.
+
+    Args:
+      filterId: The first filter ID of the block reserved for this output. The
+      encoder, mixer and resampler use three consecutive IDs starting from it.
+      pathId: The ID of the path going from the mixer to the transmitter.
+      streamId: The ID of the transmitter reader and RTSP connection.
+    """
+    self.encoderId = filterId
+    self.mixerId = filterId + 1
+    self.resamplerId = filterId + 2
+    self.pathId = pathId
+    self.streamId = streamId
+
+  def getFilterIds(self):
+    """Returns the list of static filter IDs owned by this output."""
+    ids = [self.encoderId, self.mixerId, self.resamplerId]
+    if self.sharedMemoryId != None:
+      ids.append(self.sharedMemoryId)
+
+    return ids
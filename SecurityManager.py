@@ -22,12 +22,67 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 Authors: David Cassany <david.cassany@i2cat.net>  
 """
 
-import time
 import math
-import urllib3
 import os
+import hashlib
+import logging
+import functools
+import threading
+import time
+import warnings
+import copy
+import collections
 
 from . import LMSManager
+from . import Output
+from . import Deadline
+from . import ChannelRegistry
+from . import Namespace
+from . import Tracing
+
+def parseUrl(uri):
+  # urllib3 is imported lazily, it is only needed when adding RTSP sources
+  import urllib3
+
+  try:
+    return urllib3.util.url.parse_url(uri)
+  except AttributeError:
+    # It seams old versions of urllib3 do not have url submodule
+    return urllib3.util.parse_url(uri) 
+  except:
+    raise Exception("Cannot parse given url")
+
+def normalizeUrl(url):
+  # Identical sources differing only in case, default port or fragment compare equal
+  port = url.port
+  if port == 554:
+    port = None
+
+  netloc = (url.host or '').lower()
+  if port != None:
+    netloc += ':' + str(port)
+  if url.auth:
+    netloc = url.auth + '@' + netloc
+
+  uri = '{}://{}{}'.format(*[(url.scheme or '').lower(), netloc, url.path or '/'])
+  if url.query:
+    uri += '?' + url.query
+
+  return uri
+
+def getSessionId(url, source):
+  # The path basename keeps ids readable, the hash makes them unique per source
+  name = os.path.basename((url.path or '').rstrip('/')) or 'stream'
+  return '{}-{}'.format(*[name, hashlib.md5(source.encode()).hexdigest()[:8]])
+
+def serialized(func):
+  """Decorator running a SecurityManager method with the pipe lock held."""
+  @functools.wraps(func)
+  def wrapper(self, *args, **kwargs):
+    with self.lock:
+      return func(self, *args, **kwargs)
+
+  return wrapper
 
 class SecurityManager:
   lms = None
@@ -36,33 +91,256 @@ class SecurityManager:
   DEF_HEIGHT = 720
   DEF_LOOKAHEAD = 4
   DEF_MAX_FPS = 30
+  OUTPUT_BASE_ID = 3
+  OUTPUT_FILTERS = 3
+  NEGOTIATION_POLL = 0.25
+  NEGOTIATION_TIMEOUT = 10
   
-  def __init__(self, host, port):
+  def __init__(self, host, port = None, namespace = None):
     """SecurityManager constructor
 
     It creates a new istance of the SecurityManager. 
 
+    An instance can be shared among threads. Queries run concurrently, while 
+    the operations modifying the pipe are serialized. RTSP and V4L negotiations
+    are waited without blocking the other operations.
+
     Args:
-      host: The host in which the LiveMediaStreamer is running.
+      host: The host in which the LiveMediaStreamer is running, or an URL-style
+      address as accepted by LMSManager (i.e. unix:///tmp/lms.sock).
       port: The port in which the LiveMediaStreamer is listening. 
+      namespace: A Namespace, or a NAME:BASE[:SIZE] string, with the range of IDs
+      owned by this manager. Managers with disjoint namespaces can share a LMS
+      instance, and publish their outputs through a single transmitter, as it
+      runs the RTSP server. By default the manager owns the whole instance.
+      Optional parameter.
     """
+    if isinstance(namespace, str):
+      namespace = Namespace.parseNamespace(namespace)
+
     self.lms = LMSManager.LMSManager(host, port)
-    self.receiverId = 1
-    self.transmitterId = 2
-    self.videoEncoderId = 3
-    self.videoMixerId = 4
-    self.videoResamplerId = 5
-    self.videoEncoder2Id = 6
-    self.videoMixer2Id = 7
-    self.videoResampler2Id = 8
-    self.sharedMemoryId = 9
-    self.outputPathId = 1
-    self.gridPathId = 2
-    self.mainOutputStreamId = 1
-    self.gridOutputStreamId = 2
+    self.namespace = namespace or Namespace.Namespace()
+    self.receiverId = self.namespace.getId(1)
+    self.transmitterId = self.namespace.getId(2)
+    self.sharedMemoryId = None
+    self.outputs = []
     self.grid = False
-    
-  def startPipe(self, grid = False):
+    self.registry = ChannelRegistry.ChannelRegistry()
+    self.commuteListeners = []
+    self.visibleChannels = {}
+    self.lock = threading.RLock()
+    self.sourcesChanged = threading.Condition(self.lock)
+    self.pendingSources = set()
+
+  def defaultOutputs(self, grid):
+    """Builds the legacy output configuration.
+
+    Args:
+      grid: If True a grid output is added next to the main output.
+
+    Returns:
+      A list of Output objects with the main output and, optionally, the grid output.
+    """
+    outputs = [Output.Output('output', self.DEF_WIDTH, self.DEF_HEIGHT, self.DEF_FPS,
+                             sharedMemory = True)]
+    if grid:
+      outputs.append(Output.Output('grid', self.DEF_WIDTH, self.DEF_HEIGHT, self.DEF_FPS,
+                                   grid = True))
+
+    return outputs
+
+  def assignOutputIds(self, outputs):
+    """Assigns static filter, path and stream IDs to the given outputs.
+
+    Each output gets a block of consecutive filter IDs right after the receiver
+    and the transmitter. The sharedMemory filter, if any, takes the first ID
+    after all output blocks.
+
+    Args:
+      outputs: A list of Output objects.
+
+    Raises:
+      Exception: In case of duplicated output names raises an Exception.
+    """
+    names = [output.name for output in outputs]
+    if len(set(names)) != len(names):
+      raise Exception("Output names must be unique")
+
+    self.sharedMemoryId = None
+    baseId = self.namespace.getId(self.OUTPUT_BASE_ID)
+    nextId = baseId + self.OUTPUT_FILTERS * len(outputs)
+    for idx, output in enumerate(outputs):
+      output.assignIds(baseId + self.OUTPUT_FILTERS * idx, 
+                       self.namespace.getId(idx + 1), self.namespace.getId(idx + 1))
+      output.sharedMemoryId = None
+      if output.sharedMemory:
+        output.sharedMemoryId = nextId
+        if self.sharedMemoryId == None:
+          self.sharedMemoryId = nextId
+        nextId += 1
+
+    self.namespace.check(nextId - 1)
+
+  def getOutput(self, output = None):
+    """Gets the Output object matching the given selector.
+
+    Args:
+      output: The name of the output. If None the main (first) output is returned.
+      For backwards compatibility True selects the main output and False the first 
+      grid output.
+
+    Returns:
+      The matching Output object.
+
+    Raises:
+      Exception: In case there is no matching output raises an Exception.
+    """
+    if not self.outputs:
+      raise Exception("Is there any pipe ready?")
+
+    if output is None or output is True:
+      return self.outputs[0]
+
+    if output is False:
+      for cOutput in self.outputs:
+        if cOutput.grid:
+          return cOutput
+      raise Exception("There is no grid mode enabled")
+
+    for cOutput in self.outputs:
+      if cOutput.name == output:
+        return cOutput
+
+    raise Exception("Unknown output {}".format(*[output]))
+
+  def selectOutput(self, output, main):
+    # main is the boolean selector of the former API, kept as a deprecated alias
+    if main != None:
+      warnings.warn("main is deprecated, use output instead", DeprecationWarning, stacklevel = 5)
+      if output == None:
+        output = bool(main)
+
+    return self.getOutput(output)
+
+  def ensureOutputs(self, state = None, deadline = None):
+    """Makes sure the outputs of the running pipe are known.
+
+    A pipe started by another instance (i.e. a previous run of a script) is
+    adopted from the LMS state.
+
+    Raises:
+      Exception: In case there is no pipe to adopt raises an Exception.
+    """
+    with self.lock:
+      if self.outputs:
+        return
+
+      if state == None:
+        state = self.getPipeState(deadline)
+      if state == None or not self.adoptPipe(state):
+        raise Exception("Is there any pipe ready?")
+
+  def adoptPipe(self, state):
+    """Rebuilds the outputs of a pipe started by another instance.
+
+    Every path going from a videoMixer to the transmitter is an output, its
+    stream ID gives its position and its mid filters its encoder, resampler and
+    sharedMemory filter. A mixer holding several channels is a grid output if
+    more than one of them is enabled. Output names are read from the RTSP
+    connections of the transmitter if LMS reports them.
+
+    Returns:
+      True if the pipe was adopted, False if there is no pipe.
+
+    Raises:
+      Exception: In case the layout of the pipe cannot be identified raises an Exception.
+    """
+    transmitterId = self.transmitterId
+    shared = not self.filterExists(state, transmitterId)
+    paths = []
+    for cPath in state['paths']:
+      if self.getFilterType(state, cPath['originFilter']) != 'videoMixer':
+        continue
+      dstId = cPath['destinationFilter']
+      # A transmitter shared with another namespace is not in the state
+      if dstId == transmitterId or (shared and not self.namespace.contains(dstId)):
+        paths.append(cPath)
+
+    if not paths:
+      return False
+    if len(set(cPath['destinationFilter'] for cPath in paths)) != 1:
+      raise Exception("Cannot identify the layout of the running pipe")
+    transmitterId = paths[0]['destinationFilter']
+
+    paths.sort(key = lambda cPath: cPath['destinationReader'])
+    names = self.getConnectionNames(state, transmitterId)
+    outputs = []
+    for idx, cPath in enumerate(paths):
+      mixerId = cPath['originFilter']
+      size = self.getVideoMixerSize(state, mixerId)
+      name = names.get(cPath['destinationReader'], 'output' if idx == 0 else 'output{}'.format(*[idx + 1]))
+      sharedMemory = any(self.getFilterType(state, fId) == 'sharedMemory' for fId in cPath['filters'])
+      outputs.append(Output.Output(name, size[0], size[1], self.DEF_FPS, grid = self.isGridMixer(state, mixerId),
+                                   sharedMemory = sharedMemory))
+
+    if any(output.grid == None for output in outputs):
+      # Mixers holding a single channel look the same in grid mode, only the
+      # legacy pipe, a main output and optionally a grid output, is recognized
+      legacy = [False, True][:len(outputs)]
+      if [output.name for output in outputs] not in (['output'], ['output', 'grid'], ['output', 'output2']) or \
+         any(output.grid not in (None, grid) for output, grid in zip(outputs, legacy)):
+        raise Exception("Cannot tell the grid outputs of the running pipe, start it again")
+      for output, grid in zip(outputs, legacy):
+        output.grid = grid
+      if len(outputs) == 2:
+        outputs[1].name = 'grid'
+
+    self.assignOutputIds(outputs)
+    for output, cPath in zip(outputs, paths):
+      mids = [fId for fId in cPath['filters'] if fId != output.sharedMemoryId]
+      if (output.mixerId, output.streamId, output.pathId) != \
+         (cPath['originFilter'], cPath['destinationReader'], cPath['id']) or \
+         sorted(mids) != sorted([output.resamplerId, output.encoderId]) or \
+         (output.sharedMemoryId != None and output.sharedMemoryId not in cPath['filters']):
+        raise Exception("Cannot identify the layout of the running pipe")
+
+      for cFilter in state['filters']:
+        if cFilter['id'] == output.encoderId and 'fps' in cFilter:
+          output.fps = cFilter['fps']
+
+    self.transmitterId = transmitterId
+    self.outputs = outputs
+    self.grid = any(output.grid for output in outputs)
+    return True
+
+  def isGridMixer(self, state, mixerId):
+    # A grid shows several channels, a commuted mixer one at most. None if it cannot be told.
+    channels = self.getChannels(state, mixerId)
+    if len(channels) < 2:
+      return None
+
+    return len([chnl for chnl in channels if chnl.get('enabled', True)]) > 1
+
+  def getConnectionNames(self, state, transmitterId):
+    # Output names by stream ID, only known if LMS reports the RTSP connections
+    names = {}
+    for cFilter in state['filters']:
+      if cFilter['id'] == transmitterId:
+        for connection in cFilter.get('connections', []):
+          name = connection.get('name', '')
+          prefix = self.namespace.getStreamName('')
+          if name.startswith(prefix):
+            names[connection['id']] = name[len(prefix):]
+
+    return names
+
+  def getOutputs(self):
+    """Returns the list of Output objects of the current pipe."""
+    return list(self.outputs)
+
+  @Tracing.traced
+  @serialized
+  def startPipe(self, grid = False, outputs = None, deadline = None):
     """Starts a pipe with the appropriate outputs.
 
     It creates all the filters and paths which do not depend on
@@ -71,101 +349,388 @@ class SecurityManager:
 
     Args:
       grid: It is a boolean to enable/disable the grid mode functionality. 
-      Disabled by default. It is an optional parameter.
+      Disabled by default. It is an optional parameter. Ignored if outputs is given.
+      outputs: A list of Output objects describing each rendition to publish
+      (i.e. 1080p main, 720p, 360p mobile and a grid). If None a main output and,
+      if grid is enabled, a grid output are created. Optional parameter.
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
     """
-    self.grid = grid
+    deadline = Deadline.toDeadline(deadline)
+    if outputs == None:
+      outputs = self.defaultOutputs(grid)
+
+    if len(outputs) == 0:
+      raise Exception("At least one output is required")
+
+    self.assignOutputIds(outputs)
+    self.outputs = list(outputs)
+    self.registry.clear()
+    self.visibleChannels = {}
+    self.grid = any(output.grid for output in outputs)
+
+    self.transmitterId, transmitterExists = self.findTransmitter(deadline)
+
+    # The core pipe is built in two messages, filters first and then the paths
+    # feeding the transmitter
+    events = [self.createFilterEvent(self.receiverId, 'receiver')]
+    if not transmitterExists:
+      events.append(self.createFilterEvent(self.transmitterId, 'transmitter'))
+    for output in self.outputs:
+      events.append(self.createFilterEvent(output.encoderId, 'videoEncoder'))
+      events.append(self.createFilterEvent(output.mixerId, 'videoMixer'))
+      events.append(self.createFilterEvent(output.resamplerId, 'videoResampler'))
+      if output.sharedMemoryId != None:
+        events.append(self.createFilterEvent(output.sharedMemoryId, 'sharedMemory'))
+
+    for output in self.outputs:
+      encParams = {'fps': output.fps, 'lookahead': self.DEF_LOOKAHEAD}
+      encParams.update(output.encoderParams)
+      events.append({'action': 'configure', 'filterId': output.resamplerId, 'params': {'pixelFormat': 2}})
+      events.append({'action': 'configure', 'filterId': output.mixerId, 
+                     'params': {'fps': self.DEF_MAX_FPS, 
+                                'width': output.width,
+                                'height': output.height}})
+      events.append({'action': 'configure', 'filterId': output.encoderId, 'params': encParams})
+
     try:
-      self.lms.createFilter(self.receiverId, 'receiver')
-      self.lms.createFilter(self.transmitterId, 'transmitter')
-      self.lms.createFilter(self.videoEncoderId, 'videoEncoder')
-      self.lms.createFilter(self.videoMixerId, 'videoMixer')
-      self.lms.createFilter(self.videoResamplerId, 'videoResampler')
-      self.lms.createFilter(self.sharedMemoryId, 'sharedMemory')
-      if grid:
-        self.lms.createFilter(self.videoEncoder2Id, 'videoEncoder')
-        self.lms.createFilter(self.videoMixer2Id, 'videoMixer')
-        self.lms.createFilter(self.videoResampler2Id, 'videoResampler')
-    except:
-      self.lms.stop()
+      self.lms.sendEvents({'events': events}, deadline)
+    except Exception as e:
+      self.clearPipe()
+      if isinstance(e, Deadline.LMSTimeoutError):
+        raise
       raise Exception("Failed createing filters. Pipe cleared")
 
-    self.lms.filterEvent(self.videoResamplerId, 'configure', {'pixelFormat': 2})
-    if grid:
-      self.lms.filterEvent(self.videoResampler2Id, 'configure', {'pixelFormat': 2})
-
-    self.lms.filterEvent(self.videoMixerId, 
-                         'configure', 
-                         {'fps': self.DEF_MAX_FPS, 
-                           'width': self.DEF_WIDTH,
-                           'height': self.DEF_HEIGHT})
-    self.lms.filterEvent(self.videoEncoderId, 'configure', {'fps': self.DEF_FPS, 'lookahead': self.DEF_LOOKAHEAD})
-
-    if grid:
-      self.lms.filterEvent(self.videoMixer2Id, 
-                           'configure', 
-                           {'fps': self.DEF_MAX_FPS, 
-                             'width': self.DEF_WIDTH,
-                             'height': self.DEF_HEIGHT})
-      self.lms.filterEvent(self.videoEncoder2Id, 'configure', {'fps': self.DEF_FPS, 'lookahead': self.DEF_LOOKAHEAD})
+    events = []
+    for output in self.outputs:
+      midFilters = [output.resamplerId, output.encoderId]
+      if output.sharedMemoryId != None:
+        midFilters.insert(0, output.sharedMemoryId)
+      events.append({'action': 'createPath', 
+                     'params': {'id': output.pathId, 
+                                'orgFilterId': output.mixerId, 
+                                'dstFilterId': self.transmitterId, 
+                                'orgWriterId': -1, 
+                                'dstReaderId': output.streamId, 
+                                'midFiltersIds': midFilters}})
+
+    for output in self.outputs:
+      events.append({'action': 'addRTSPConnection', 
+                     'filterId': self.transmitterId, 
+                     'params': {'id': output.streamId, 
+                                'name': self.namespace.getStreamName(output.name), 
+                                'txFormat': 'std', 
+                                'readers': [output.streamId]}})
 
     try:
-      self.lms.createPath(self.outputPathId, 
-                     self.videoMixerId, 
-                     self.transmitterId, 
-                     -1, self.mainOutputStreamId, 
-                     [self.sharedMemoryId, self.videoResamplerId, self.videoEncoderId])
-
-      if grid:
-        self.lms.createPath(self.gridPathId, 
-                       self.videoMixer2Id, 
-                       self.transmitterId, 
-                       -1, self.gridOutputStreamId, 
-                       [self.videoResampler2Id, self.videoEncoder2Id])
-
-    except: 
-      self.lms.stop()
+      self.lms.sendEvents({'events': events}, deadline)
+    except Exception as e: 
+      self.clearPipe()
+      if isinstance(e, Deadline.LMSTimeoutError):
+        raise
       raise Exception("Failed connecting path. Pipe cleared")
 
-    self.lms.filterEvent(self.transmitterId, 
-                         'addRTSPConnection', 
-                         {'id': self.mainOutputStreamId, 
-                            'name': 'output', 
-                            'txFormat': 'std', 
-                            'readers': [self.mainOutputStreamId]})
-    if grid:
-      self.lms.filterEvent(self.transmitterId, 
-                           'addRTSPConnection', 
-                           {'id': self.gridOutputStreamId, 
-                              'name': 'grid', 
-                              'txFormat': 'std', 
-                              'readers': [self.gridOutputStreamId]})
+  def findTransmitter(self, deadline):
+    """Finds the transmitter the outputs are published with.
+
+    A LMS instance runs a single RTSP server, so the managers of its namespaces
+    share the transmitter created by the first of them.
+
+    Returns:
+      A tuple with the ID of the transmitter and whether it already exists.
+    """
+    if not self.namespace.isScoped():
+      return self.namespace.getId(2), False
+
+    state = self.lms.getState(deadline = deadline)
+    for cFilter in (state or {}).get('filters', []):
+      if cFilter['type'] == 'transmitter':
+        return cFilter['id'], True
+
+    return self.namespace.getId(2), False
+
+  def createFilterEvent(self, fId, fType):
+    return {'action': 'createFilter', 'params': {'id': fId, 'type': fType}}
 
   def findRecvSessionByPort(self, state, port):
-    print("requested port: " + str(port))
+    sessionId = self.registry.getSessionByPort(port)
+    if sessionId != None or state == None:
+      return sessionId
+
     for cFilter in state['filters']:
       if cFilter['id'] == self.receiverId:
         for session in cFilter['sessions']:
-          print(session['id'])
           for subsession in session['subsessions']:
-            print("session port " + str(subsession['port']))
             if port == subsession['port']:
               return session['id']
 
     return None
 
-  def resetPipe(self):
-    self.stopPipe()
-    self.startPipe()
+  @Tracing.traced
+  @serialized
+  def resetPipe(self, deadline = None, keepSources = True):
+    """Rebuilds the current pipe.
+
+    The pipe is rebuilt with the same outputs and grid mode. By default its 
+    sources are re-attached to their former channels: all the RTSP sessions and
+    V4L captures are requested in a single message and negotiate concurrently,
+    and each channel is connected as soon as its source is ready. Channels not
+    registered by this instance (i.e. added by another instance) are rebuilt
+    from the receiver sessions, paths and mixer channels reported by LMS.
+
+    Args:
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
+      keepSources: If False the sources are dropped, as a fresh startPipe would. 
+      Optional parameter.
+
+    Returns:
+      A dictionary reporting the time, in seconds since the reset began, at 
+      which the core pipe was ready and each channel got its source back:
+
+        {'pipeTime': 0.01, 'channels': {1: 1.02, 2: 1.03}, 'failed': {3: 'No successful RTSP negotiation'},
+         'timeToVideo': 1.03}
+
+      timeToVideo is the time at which the last restored channel was connected.
+
+    Raises:
+      Exception: In case the running pipe cannot be identified or holds a channel
+      whose source is unknown raises an Exception, and the pipe is left untouched.
+    """
+    deadline = Deadline.toDeadline(deadline)
+    start = time.monotonic()
+
+    # Without a pipe to adopt, a default pipe is started
+    state = self.getPipeState(deadline)
+    if not self.outputs:
+      self.adoptPipe(state)
+    outputs = copy.deepcopy(self.outputs) or None
+    grid = self.grid
+    entries = [self.registry.getEntry(channel) for channel in self.registry.getChannels()]
+    visible = {}
+    if self.outputs:
+      entries.extend(self.getUnregisteredEntries(state))
+      visible = self.getEnabledChannels(state)
+    visible.update(self.visibleChannels)
+    entries.sort(key = lambda entry: entry['channel'])
+
+    self.stopPipe(deadline = deadline)
+    self.startPipe(grid, outputs, deadline = deadline)
+
+    report = {'pipeTime': time.monotonic() - start, 'channels': {}, 'failed': {}}
+    if keepSources and entries:
+      self.reattachSources(entries, deadline, start, report)
+
+      channels = self.registry.getChannels()
+      if channels:
+        for cOutput in self.getCommuteOutputs():
+          channel = visible.get(cOutput.name)
+          if channel not in channels:
+            channel = channels[-1]
+          try:
+            self.showChannel(channel, cOutput.name, deadline)
+          except Deadline.LMSTimeoutError:
+            raise
+          except Exception as e:
+            logging.error("Error restoring visible channel: " + str(e))
+        if self.grid:
+          self.updateGrid(channels = channels, deadline = deadline)
+
+    report['timeToVideo'] = max(list(report['channels'].values()) + [report['pipeTime']])
+    logging.info("Pipe reset, {} channels restored, {} failed, time to video {:.2f}s".format(
+                 *[len(report['channels']), len(report['failed']), report['timeToVideo']]))
+
+    return report
+
+  def getUnregisteredEntries(self, state):
+    """Builds registry entries for the channels of the pipe unknown to the registry.
+
+    Raises:
+      Exception: In case the source of a channel cannot be found raises an Exception.
+    """
+    entries = []
+    mixerId = self.outputs[0].mixerId
+    for chnl in sorted(channel['id'] for channel in self.getChannels(state, mixerId)):
+      if not self.registry.hasChannel(chnl):
+        entries.append(self.getUnregisteredEntry(state, mixerId, chnl))
+
+    return entries
+
+  def getUnregisteredEntry(self, state, mixerId, chnl):
+    path = self.getPathFromDst(state, mixerId, chnl)
+    orgId = path['originFilter'] if path != None else None
+    orgType = self.getFilterType(state, orgId)
+
+    if orgType == 'videoDecoder':
+      for srcPath in self.getPathsFromDstFilter(state, orgId):
+        if srcPath['originFilter'] != self.receiverId:
+          continue
+        sessionId = self.findRecvSessionByPort(state, srcPath['originWriter'])
+        session = self.findSession(state, sessionId)
+        if session != None and session.get('uri'):
+          return {'channel': chnl, 'source': normalizeUrl(parseUrl(session['uri'])), 
+                  'uri': session['uri'], 'kind': 'rtsp', 'sessionId': sessionId, 
+                  'port': srcPath['originWriter']}
+    elif orgType == 'v4lcapture':
+      for cFilter in state['filters']:
+        if cFilter['id'] == orgId and cFilter.get('device'):
+          entry = {'channel': chnl, 'source': cFilter['device'], 'kind': 'v4l'}
+          for key in ('width', 'height', 'fps'):
+            if key in cFilter:
+              entry[key] = cFilter[key]
+          return entry
+
+    raise Exception("Cannot restore channel {}, its source is unknown".format(*[chnl]))
+
+  def getEnabledChannels(self, state):
+    # The channel shown by each non grid output, if there is a single enabled one
+    visible = {}
+    for cOutput in self.getCommuteOutputs():
+      enabled = [chnl['id'] for chnl in self.getChannels(state, cOutput.mixerId) if chnl.get('enabled', True)]
+      if len(enabled) == 1:
+        visible[cOutput.name] = enabled[0]
+
+    return visible
+
+  def reattachSources(self, entries, deadline, start, report):
+    # Called with the lock held, right after startPipe. Each source is
+    # negotiated once, by its first channel, the rest share it.
+    groups = collections.OrderedDict()
+    for entry in entries:
+      groups.setdefault(entry['source'], []).append(entry)
+
+    state = self.getPipeState(deadline)
+    nextId = self.getMaxFilterId(state) + 1
+    pending = {}
+    events = {}
+    for source, group in groups.items():
+      first = group[0]
+      if first['kind'] == 'rtsp':
+        pending[source] = {'sessionId': first['sessionId']}
+        events[source] = [{'action': 'addSession', 'filterId': self.receiverId,
+                           'params': {'uri': first['uri'], 'progName': '', 
+                                      'keepAlive': first.get('keepAlive', True), 
+                                      'id': first['sessionId']}}]
+      else:
+        capId = self.namespace.check(nextId)
+        nextId += 1
+        pending[source] = {'capId': capId}
+        params = {'device': source}
+        for key in ('width', 'height', 'fps'):
+          if key in first:
+            params[key] = first[key]
+        events[source] = [self.createFilterEvent(capId, 'v4lcapture'),
+                          {'action': 'configure', 'filterId': capId, 'params': params}]
+
+    self.requestSources(events, pending, groups, report, deadline)
+
+    count = 0
+    while pending:
+      deadline.sleep(self.NEGOTIATION_POLL)
+      state = self.pollPipeState(deadline)
+      ready = self.getReadySources(state, pending)
+
+      for source in ready:
+        info = pending.pop(source)
+        self.reattachGroup(groups[source], info, deadline, start, report)
+
+      count += 1
+      if pending and count * self.NEGOTIATION_POLL >= self.NEGOTIATION_TIMEOUT:
+        for source in pending:
+          self.failGroup(groups[source], "No successful source negotiation", report)
+        break
+
+  def requestSources(self, events, pending, groups, report, deadline):
+    batch = [event for sourceEvents in events.values() for event in sourceEvents]
+    try:
+      self.lms.sendEvents({'events': batch}, deadline)
+      return
+    except Deadline.LMSTimeoutError:
+      raise
+    except Exception as e:
+      logging.error("Error requesting sources, retrying one by one: " + str(e))
+
+    # A failed event stops the batch, so find out which sources were requested
+    for source, sourceEvents in events.items():
+      try:
+        self.lms.sendEvents({'events': sourceEvents}, deadline)
+      except Deadline.LMSTimeoutError:
+        raise
+      except Exception as e:
+        if self.isRequested(pending[source], deadline):
+          continue
+        del pending[source]
+        self.failGroup(groups[source], str(e), report)
+
+  def isRequested(self, info, deadline):
+    state = self.getPipeState(deadline)
+    if 'sessionId' in info:
+      return self.findSession(state, info['sessionId']) != None
+
+    return self.filterExists(state, info['capId'])
+
+  def findSession(self, state, sessionId):
+    for cFilter in state['filters']:
+      if cFilter['id'] == self.receiverId:
+        for session in cFilter.get('sessions', []):
+          if session['id'] == sessionId:
+            return session
+
+    return None
+
+  def getReadySources(self, state, pending):
+    ready = []
+    for source, info in pending.items():
+      if 'sessionId' in info:
+        session = self.findSession(state, info['sessionId'])
+        if session != None and session['subsessions']:
+          info['port'] = session['subsessions'][0]['port']
+          ready.append(source)
+      else:
+        for cFilter in state['filters']:
+          if cFilter['id'] == info['capId'] and cFilter.get('status') == 'capture':
+            ready.append(source)
+
+    return ready
+
+  def reattachGroup(self, group, info, deadline, start, report):
+    shared = None
+    for entry in group:
+      if 'sessionId' in info:
+        newInfo = {'source': entry['source'], 'uri': entry['uri'], 'kind': 'rtsp',
+                   'sessionId': info['sessionId'], 'port': info['port'],
+                   'keepAlive': entry.get('keepAlive', True)}
+        inputFilterId, writerId, raw = self.receiverId, info['port'], False
+      else:
+        newInfo = self.getV4LInfo(entry)
+        inputFilterId, writerId, raw = info['capId'], -1, True
+
+      try:
+        state = self.getPipeState(deadline)
+        self.connectInputSource(state, inputFilterId, writerId, raw, newInfo, shared = shared,
+                                deadline = deadline, channel = entry['channel'])
+      except Deadline.LMSTimeoutError:
+        raise
+      except Exception as e:
+        report['failed'][entry['channel']] = str(e)
+        continue
+
+      report['channels'][entry['channel']] = time.monotonic() - start
+      if shared == None:
+        shared = self.registry.getEntry(entry['channel'])
+
+  def failGroup(self, group, error, report):
+    logging.error("Source {} not restored: {}".format(*[group[0]['source'], error]))
+    for entry in group:
+      report['failed'][entry['channel']] = error
 
   def getMaxFilterId(self, state):
-    maxFilterId = 0
+    maxFilterId = self.namespace.base
     for cFilter in state['filters']:
       maxFilterId = max(cFilter['id'], maxFilterId)
 
     return maxFilterId
 
   def getMaxPathId(self, state):
-    maxPathId = 0
+    maxPathId = self.namespace.base
     for cPath in state['paths']:
       maxPathId = max(cPath['id'], maxPathId)
 
@@ -202,6 +767,13 @@ class SecurityManager:
       if path['destinationFilter'] == dstFId and path['destinationReader'] == dstRId:
         return path
 
+  def getPathFromOrg(self, state, orgFId):
+    for path in state['paths']:
+      if path['originFilter'] == orgFId:
+        return path
+
+    return None
+
   def getPathsFromDstFilter(self, state, dstFId):
     paths = []
     for path in state['paths']:
@@ -226,107 +798,177 @@ class SecurityManager:
 
     return False
 
-  def connectInputSource(self, state, inputFilterId, inputWriterId, raw):
-    if not raw:
-      decId = self.getMaxFilterId(state) + 1
-      resId = decId + 1
-    else:
-      resId = self.getMaxFilterId(state) + 1
-    
-    res2Id = resId + 1
+  def pipeReady(self, state):
+    if not self.outputs and not self.adoptPipe(state):
+      return False
+    # A transmitter shared with another namespace is not in the state
+    if self.namespace.contains(self.transmitterId) and not self.filterExists(state, self.transmitterId):
+      return False
 
-    srcPathId = self.getMaxPathId(state) + 1
-    mainPathId = srcPathId + 1
-    gridPathId = mainPathId + 1
+    for output in self.outputs:
+      if not self.filterExists(state, output.mixerId):
+        return False
 
-    outputReaderId = self.getMaxVideoChannel(state, self.videoMixerId) + 1
+    return True
 
-    try:
-      if not raw: 
-        self.lms.createFilter(decId, "videoDecoder")
-      self.lms.createFilter(resId, "videoResampler") 
-      if self.grid:
-        self.lms.createFilter(res2Id, "videoResampler")
-    except: 
-      self.lms.removeFilter(resId)
-      if not raw:
-        self.lms.removeFilter(decId)
-      if self.grid:
-        self.lms.removeFilter(res2Id)
-      raise Exception("Failed creating filters")
+  def getMaxOutputChannel(self, state):
+    maxChannelId = 0
+    for output in self.outputs:
+      maxChannelId = max(self.getMaxVideoChannel(state, output.mixerId), maxChannelId)
 
-    size = self.getVideoMixerSize(state, self.videoMixerId)
+    return maxChannelId
+
+  def getResamplerSize(self, state, output, extraChannels = 0):
+    size = self.getVideoMixerSize(state, output.mixerId)
     if size == None:
-      raise Exception("Could not load main videoMixer size!")
+      raise Exception("Could not load {} videoMixer size!".format(*[output.name]))
 
-    self.lms.filterEvent(resId, 'configure', {'fps': self.DEF_FPS, 
-                                              'pixelFormat': 0,
-                                              'width': size[0],
-                                              'height': size[1]})
+    if not output.grid:
+      return size
 
-    if self.grid:
-      size = self.getVideoMixerSize(state, self.videoMixer2Id)
-      if size == None:
-        raise Exception("Could not load grid videoMixer size!") 
+    channels = self.getChannels(state, output.mixerId)
+    mixCols = math.ceil(math.sqrt(len(channels) + extraChannels))
+    return [size[0] // mixCols, size[1] // mixCols]
+
+  def connectInputSource(self, state, inputFilterId, inputWriterId, raw, info = None, shared = None, 
+                         deadline = None, channel = None):
+    """Connects an input filter to every output of the pipe.
+
+    Non raw inputs are decoded once and the decoded frames are fanned out to
+    one videoResampler per output, each one feeding its output videoMixer.
+
+    Args:
+      state: The current LMS state.
+      inputFilterId: The ID of the filter producing the source frames.
+      inputWriterId: The writer of the input filter to use.
+      raw: If True the input filter already produces raw frames and no decoder is created.
+      info: A dictionary describing the source (i.e. source, kind, sessionId, port) stored
+      in the channel registry entry. Optional parameter.
+      shared: The registry entry of a channel of the same source. If given its decoder
+      (or raw input filter) is reused and only the output paths are created. Optional parameter.
+      channel: The channel to assign. By default the next free channel. Optional parameter.
+
+    Returns:
+      The channel assigned to the source.
 
-      channels = self.getChannels(state, self.videoMixer2Id)
-      mixCols = math.ceil(math.sqrt(len(channels) + 1))
+    Raises:
+      Exception: In case of failure raises an Exception. 
+    """
+    nextId = self.getMaxFilterId(state) + 1
+    nextPathId = self.getMaxPathId(state) + 1
+    decId = None
+    srcPathId = None
+    if shared != None:
+      decId = shared['decoderId']
+      srcPathId = shared['srcPathId']
+    elif not raw:
+      decId = nextId
+      nextId += 1
+      srcPathId = nextPathId
+      nextPathId += 1
+
+    createDecoder = shared == None and not raw
+
+    resIds = {}
+    pathIds = {}
+    for output in self.outputs:
+      resIds[output.name] = nextId
+      nextId += 1
+      pathIds[output.name] = nextPathId
+      nextPathId += 1
+
+    self.namespace.check(nextId - 1)
+    self.namespace.check(nextPathId - 1)
+
+    if channel == None:
+      outputReaderId = self.getMaxOutputChannel(state) + 1
+    elif self.registry.hasChannel(channel):
+      raise Exception("Channel {} is already in use".format(*[channel]))
+    else:
+      outputReaderId = channel
 
-      self.lms.filterEvent(res2Id, 'configure', {'fps': self.DEF_FPS, 
-                                              'pixelFormat': 0,
-                                              'width': size[0] // mixCols,
-                                              'height': size[1] // mixCols})
+    try:
+      if createDecoder: 
+        self.lms.createFilter(decId, "videoDecoder", deadline = deadline)
+      for output in self.outputs:
+        self.lms.createFilter(resIds[output.name], "videoResampler", deadline = deadline) 
+    except Exception as e: 
+      for output in self.outputs:
+        self.lms.removeFilter(resIds[output.name])
+      if createDecoder:
+        self.lms.removeFilter(decId)
+      if isinstance(e, Deadline.LMSTimeoutError):
+        raise
+      raise Exception("Failed creating filters")
+
+    for output in self.outputs:
+      size = self.getResamplerSize(state, output, 1)
+      self.lms.filterEvent(resIds[output.name], 'configure', {'fps': output.fps, 
+                                                              'pixelFormat': 0,
+                                                              'width': size[0],
+                                                              'height': size[1]}, deadline = deadline)
 
     try:
-      if not raw:
+      if createDecoder:
         self.lms.createPath(srcPathId, 
                             inputFilterId,
                             decId,
-                            inputWriterId, -1, [])
-
-        self.lms.createPath(mainPathId, 
-                            decId,
-                            self.videoMixerId,
-                            -1, outputReaderId,
-                            [resId])
-        if self.grid:
-          self.lms.createPath(gridPathId, 
-                              decId,
-                              self.videoMixer2Id,
-                              -1, outputReaderId,
-                              [res2Id])
+                            inputWriterId, -1, [], deadline = deadline)
 
+      if decId != None:
+        orgFilterId = decId
       else:
-        self.lms.createPath(mainPathId, 
-                            inputFilterId,
-                            self.videoMixerId,
+        orgFilterId = inputFilterId
+
+      for output in self.outputs:
+        self.lms.createPath(pathIds[output.name], 
+                            orgFilterId,
+                            output.mixerId,
                             -1, outputReaderId,
-                            [resId])
-        if self.grid:
-          self.lms.createPath(gridPathId, 
-                              inputFilterId,
-                              self.videoMixer2Id,
-                              -1, outputReaderId,
-                              [res2Id])
+                            [resIds[output.name]], deadline = deadline)
 
-    except:
-      self.lms.removePath(srcPathId)
-      self.lms.removePath(mainPathId)
-      self.lms.removePath(gridPathId)
+    except Exception as e:
+      if createDecoder:
+        self.lms.removePath(srcPathId)
+      for output in self.outputs:
+        self.lms.removePath(pathIds[output.name])
+        self.lms.removeFilter(resIds[output.name])
 
-      self.lms.removeFilter(resId)
-      if not raw:
+      if createDecoder:
         self.lms.removeFilter(decId)
-      if self.grid:
-        self.lms.removeFilter(res2Id)
+      if isinstance(e, Deadline.LMSTimeoutError):
+        raise
       raise Exception("Failed creating input paths")
 
+    entry = dict(info or {})
+    entry.update({'channel': outputReaderId, 
+                  'inputFilterId': inputFilterId, 
+                  'inputWriterId': inputWriterId,
+                  'decoderId': decId,
+                  'srcPathId': srcPathId,
+                  'outputs': {}})
+    for output in self.outputs:
+      entry['outputs'][output.name] = {'resamplerId': resIds[output.name], 
+                                       'pathId': pathIds[output.name]}
+    self.registry.register(entry)
+
     return outputReaderId
 
-  def getState(self):
-    return self.lms.getState()
+  @Tracing.traced
+  def getState(self, deadline = None):
+    """Gets the filters and paths of the pipe, those of the namespace of this manager."""
+    deadline = Deadline.toDeadline(deadline)
+    return self.getPipeState(deadline)
 
-  def addRTSPSource(self, uri, keepAlive = True):
+  def getPipeState(self, deadline = None):
+    return self.namespace.filterState(self.lms.getState(deadline = deadline))
+
+  def pollPipeState(self, deadline = None):
+    # Negotiations poll the state every second, polls are not printed
+    return self.namespace.filterState(self.lms.pollState(deadline = deadline))
+
+  @Tracing.traced
+  def addRTSPSource(self, uri, keepAlive = True, deadline = None):
     """Sends required events to add a new RTSP stream as input.
 
     This method initiates an RTSP negotionation, if the negotiation does not conclude
@@ -334,11 +976,16 @@ class SecurityManager:
     method registers the new input and creates all required filters (i.e. decoders) and 
     paths to start processing this input.
 
+    If the same source (compared by its normalized uri) is already present, its RTSP
+    session and decoder are shared and only a new channel with its own output paths
+    is created. The session and decoder are removed with the last channel using them.
+
     Args: 
       uri: The RTSP uri of the input source (i.e. the URL of an IP camera)
       keepAlive: A boolean to enable/disable the keep alive messages form the client
       to the server. Some RTSP server require periodic GET_PAMETERS messages in order
       to keep the session alive. Enbled by default. Optional parameter.  
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
 
     Returns:
       The channel assigned to the source. This channel ID will be needed for later management 
@@ -346,66 +993,130 @@ class SecurityManager:
 
     Raises:
       Exception: In case of failure raises an Exception. 
+      LMSTimeoutError: In case a LMS call or the whole operation took too long.
     """
-    state = self.lms.getState()
-    if not self.filterExists(state, self.videoMixerId) or not self.filterExists(state, self.transmitterId):
-      raise Exception("Is there any pipe ready?")
+    deadline = Deadline.toDeadline(deadline)
+    sourceUrl = parseUrl(uri)
+
+    if sourceUrl.scheme != 'rtsp':
+      raise Exception("Given url is no RTSP")
+
+    source = normalizeUrl(sourceUrl)
+    with self.lock:
+      shared = self.reserveSource(source, deadline)
+      if shared != None:
+        return self.addSharedSource(shared, {'source': source, 'uri': uri, 'kind': 'rtsp', 
+                                             'sessionId': shared['sessionId'], 'port': shared['port'],
+                                             'keepAlive': shared.get('keepAlive', keepAlive)},
+                                    False, deadline)
 
-    if not self.filterExists(state, self.receiverId):
       try:
-        self.lms.createFilter(self.receiverId, 'receiver')
+        state = self.getPipeState(deadline)
+        if not self.pipeReady(state):
+          raise Exception("Is there any pipe ready?")
+
+        if not self.filterExists(state, self.receiverId):
+          try:
+            self.lms.createFilter(self.receiverId, 'receiver', deadline = deadline)
+          except Deadline.LMSTimeoutError:
+            raise
+          except:
+            raise Exception("Failed creating receiver")
+
+        sourceId = getSessionId(sourceUrl, source)
+
+        self.lms.filterEvent(self.receiverId, 'addSession', {'uri': uri, 
+                             'progName': '', 'keepAlive': keepAlive, 'id': sourceId}, deadline = deadline)
       except:
-        raise Exception("Failed creating receiver")
+        self.releaseSource(source)
+        raise
 
+    # The negotiation is waited without the lock, so other operations can go on meanwhile
     try:
-      sourceUrl = urllib3.util.url.parse_url(uri)
-    except AttributeError:
-      # It seams old versions of urllib3 do not have url submodule
-      sourceUrl = urllib3.util.parse_url(uri) 
-    except:
-      raise Exception("Cannot parse given url")
+      port = self.waitRTSPSession(sourceId, deadline)
 
-    if sourceUrl.scheme != 'rtsp':
-      raise Exception("Given url is no RTSP")
+      with self.lock:
+        state = self.getPipeState(deadline)
+        chnl = self.connectInputSource(state, self.receiverId, port, False,
+                                       {'source': source, 'uri': uri, 'kind': 'rtsp', 
+                                        'sessionId': sourceId, 'port': port, 'keepAlive': keepAlive},
+                                       deadline = deadline)
 
-    sourceId = os.path.basename(sourceUrl.path)
-    if not sourceId:
-      raise Exception("Error, given url may have an empty path")
+        self.showChannel(chnl, None, deadline)
+
+        if self.grid:
+          self.updateGrid(deadline = deadline) 
+    except:
+      self.removeRTSPSession(sourceId)
+      raise
+    finally:
+      self.releaseSource(source)
 
-    self.lms.filterEvent(self.receiverId, 'addSession', {'uri': uri, 
-                         'progName': '', 'keepAlive': keepAlive, 'id': sourceId})
+    return chnl
 
-    port = None
+  def removeRTSPSession(self, sourceId):
+    # Removes the receiver session of a failed addition unless a channel got to
+    # use it. The caller deadline may be exhausted, so it is not used here.
+    with self.lock:
+      if self.registry.getChannelsBySession(sourceId):
+        return
+      try:
+        self.lms.filterEvent(self.receiverId, 'removeSession', {'id': sourceId})
+      except Exception as e:
+        logging.error("Error removing RTSP session {}: {}".format(*[sourceId, e]))
+
+  def waitRTSPSession(self, sourceId, deadline):
     count = 0
-    search = True
-    mixerCh = []
-    state = None
-    while search:
-      time.sleep(1)
-      state = self.lms.getState()
+    while True:
+      deadline.sleep(1)
+      state = self.pollPipeState(deadline)
       for cFilter in state['filters']:
         if cFilter['id'] == self.receiverId:
           for session in cFilter['sessions']:
             if session['id'] == sourceId:
               for subsession in session['subsessions']:
-                port = subsession['port']
-                search = False
+                return subsession['port']
 
       count += 1
-      if count >= 10 and search:
+      if count >= 10:
         raise Exception("No successful RTSP negotiation")
 
-    chnl = self.connectInputSource(state, self.receiverId, port, False)
-      
-
-    self.commuteChannel(chnl)
+  def reserveSource(self, source, deadline):
+    # Called with the lock held. Concurrent additions of a source wait for the
+    # first one to negotiate it, and then share it.
+    while source in self.pendingSources:
+      if deadline.expired():
+        raise Deadline.DeadlineExceededError("Waiting for {} negotiation".format(*[source]))
+      self.sourcesChanged.wait(deadline.cap(None))
+
+    shared = self.getSharedEntry(source)
+    if shared == None:
+      self.pendingSources.add(source)
+
+    return shared
+
+  def releaseSource(self, source):
+    with self.lock:
+      self.pendingSources.discard(source)
+      self.sourcesChanged.notify_all()
+
+  def addSharedSource(self, shared, info, raw, deadline):
+    # Called with the lock held
+    state = self.getPipeState(deadline)
+    if not self.pipeReady(state):
+      raise Exception("Is there any pipe ready?")
 
+    writerId = -1 if raw else shared['inputWriterId']
+    chnl = self.connectInputSource(state, shared['inputFilterId'], writerId, raw, info,
+                                   shared = shared, deadline = deadline)
+    self.showChannel(chnl, None, deadline)
     if self.grid:
-      self.updateGrid() 
+      self.updateGrid(deadline = deadline)
 
     return chnl
 
-  def addV4LSource(self, device, width, height, fps, pformat = "YUYV", forceformat = True):
+  @Tracing.traced
+  def addV4LSource(self, device, width, height, fps, pformat = "YUYV", forceformat = True, deadline = None):
     """Sends required events to add a new Video 4 Linux source.
 
     This method configures a V4L device, if the configuration does not conclude 
@@ -426,6 +1137,7 @@ class SecurityManager:
       forceformat: If this is set to True, in case the V4L driver cannot set the desired pixel format, 
       LiveMediaStreamer will treat is as an error and not use the default value. Default value is True.
       Optional parameter.
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
 
     Returns:
       The channel assigned to the source. This channel ID will be needed for later management 
@@ -438,53 +1150,85 @@ class SecurityManager:
     Raises:
       Exception: In case of failure raises an Exception. 
     """
-    state = self.lms.getState()
-    if not self.filterExists(state, self.videoMixerId) or not self.filterExists(state, self.transmitterId):
-      raise Exception("Is there any pipe ready?")
+    deadline = Deadline.toDeadline(deadline)
+    with self.lock:
+      shared = self.reserveSource(device, deadline)
+      if shared != None:
+        return self.addSharedSource(shared, self.getV4LInfo(shared), True, deadline)
+
+      try:
+        state = self.getPipeState(deadline)
+        if not self.pipeReady(state):
+          raise Exception("Is there any pipe ready?")
+
+        capId = self.namespace.check(self.getMaxFilterId(state) + 1)
         
+        try:
+          self.lms.createFilter(capId, "v4lcapture", deadline = deadline)
+        except Deadline.LMSTimeoutError:
+          raise
+        except:
+          raise Exception("Failed creating V4LFilter")
+
+        self.lms.filterEvent(capId, 'configure', {'fps': fps,
+                                                  'device': device,
+                                                  'width': width,
+                                                  'height': height}, deadline = deadline)
+      except:
+        self.releaseSource(device)
+        raise
 
-    capId = self.getMaxFilterId(state) + 1
-    
     try:
-      self.lms.createFilter(capId, "v4lcapture")
-    except:
-      raise Exception("Failed creating V4LFilter")
+      self.waitV4LCapture(capId, deadline)
 
-    self.lms.filterEvent(capId, 'configure', {'fps': fps,
-                                              'device': device,
-                                              'width': width,
-                                              'height': height})
+      with self.lock:
+        state = self.getPipeState(deadline)
+        chnl = self.connectInputSource(state, capId, -1, True, 
+                                       {'source': device, 'kind': 'v4l', 
+                                        'width': width, 'height': height, 'fps': fps},
+                                       deadline = deadline)
 
-    count = 0
-    wait = True
-    while wait:
-      time.sleep(1)
-      state = self.lms.getState()
-      for cFilter in state['filters']:
-        if cFilter['id'] == capId:
-          if cFilter['status'] == 'capture':
-            wait = False
+        self.showChannel(chnl, None, deadline)
 
-      count += 1
-      if count >= 10 and search:
-        raise Exception("No successful V4L filter configuration")
+        if self.grid:
+          self.updateGrid(deadline = deadline)
+    finally:
+      self.releaseSource(device)
 
-    chnl = self.connectInputSource(state, capId, -1, True)
+    return chnl
 
-    self.commuteChannel(chnl)
+  def getV4LInfo(self, entry):
+    info = {'source': entry['source'], 'kind': 'v4l'}
+    for key in ('width', 'height', 'fps'):
+      if key in entry:
+        info[key] = entry[key]
 
-    if self.grid:
-      self.updateGrid()
+    return info
 
-    return chnl
+  def waitV4LCapture(self, capId, deadline):
+    count = 0
+    while True:
+      deadline.sleep(1)
+      state = self.pollPipeState(deadline)
+      for cFilter in state['filters']:
+        if cFilter['id'] == capId and cFilter['status'] == 'capture':
+          return
 
-  def removeInputChannel(self, chnl):
+      count += 1
+      if count >= 10:
+        raise Exception("No successful V4L filter configuration")
+
+  @Tracing.traced
+  @serialized
+  def removeInputChannel(self, chnl, deadline = None):
     """Sends required events to remove an input channel
 
-    This method removes all related filters and paths to the given channel. 
+    This method removes all related filters and paths to the given channel
+    in every output. 
 
     Args: 
       chnl: An Integer representing the ID of the desired channel to remove. 
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
 
     .. warning: 
       This method is not stable as it should, be careful while using it, it might cause
@@ -493,105 +1237,294 @@ class SecurityManager:
     Raises:
       Exception: In case of failure raises an Exception. 
     """
-    state = self.lms.getState()
-
-    path = self.getPathFromDst(state, self.videoMixerId, chnl)
-    if path != None:
-      origFId = path['originFilter']
-      self.lms.removePath(path['id'])
-      if origFId != self.receiverId and not self.grid:
-        paths = self.getPathsFromDstFilter(state, origFId)
-        for relatedPath in paths:
-          self.lms.removePath(relatedPath['id'])
-          if path['originFilter'] == self.receiverId:
-            sourceId = self.findRecvSessionByPort(state, relatedPath['originWriter'])
-            if sourceId != None:
-              self.lms.filterEvent(self.receiverId, 'removeSession', {'id': sourceId})
+    deadline = Deadline.toDeadline(deadline)
+    entry = self.registry.unregister(chnl)
+    if entry == None:
+      self.removeUnregisteredChannel(chnl, deadline)
+      return
+
+    for output in entry['outputs'].values():
+      self.lms.removePath(output['pathId'], deadline = deadline)
+
+    # The source is shared with other channels, keep its session and decoder
+    if self.registry.getChannelsBySource(entry.get('source')) or \
+       self.registry.getChannelsByFilter(entry.get('decoderId')):
+      if self.grid:
+        self.updateGrid(channels = self.registry.getChannels(), deadline = deadline)
+      return
+
+    if entry.get('srcPathId') != None:
+      self.lms.removePath(entry['srcPathId'], deadline = deadline)
+
+    if entry.get('sessionId') != None:
+      self.lms.filterEvent(self.receiverId, 'removeSession', {'id': entry['sessionId']}, deadline = deadline)
+
+    if entry.get('kind') == 'v4l':
+      self.lms.removeFilter(entry['inputFilterId'], deadline = deadline)
 
     if self.grid:
-      path = self.getPathFromDst(state, self.videoMixer2Id, chnl)
+      self.updateGrid(channels = self.registry.getChannels(), deadline = deadline)
+
+  def removeUnregisteredChannel(self, chnl, deadline):
+    # Channels not created by this instance are found by scanning the LMS state
+    state = self.getPipeState(deadline)
+    self.ensureOutputs(state)
+
+    origFIds = []
+    for output in self.outputs:
+      path = self.getPathFromDst(state, output.mixerId, chnl)
       if path != None:
-        origFId = path['originFilter']
-        self.lms.removePath(path['id'])
-        if origFId != self.receiverId:
-          paths = self.getPathsFromDstFilter(state, origFId)
-          for relatedPath in paths:
-            self.lms.removePath(relatedPath['id'])
-            if relatedPath['originFilter'] == self.receiverId:
-              sourceId = self.findRecvSessionByPort(state, relatedPath['originWriter'])
-              if sourceId != None:
-                self.lms.filterEvent(self.receiverId, 'removeSession', {'id': sourceId})
-
-      self.updateGrid()
+        self.lms.removePath(path['id'], deadline = deadline)
+        if path['originFilter'] not in origFIds:
+          origFIds.append(path['originFilter'])
+
+    for origFId in origFIds:
+      if origFId == self.receiverId:
+        continue
+      for relatedPath in self.getPathsFromDstFilter(state, origFId):
+        self.lms.removePath(relatedPath['id'], deadline = deadline)
+        if relatedPath['originFilter'] == self.receiverId:
+          sourceId = self.findRecvSessionByPort(state, relatedPath['originWriter'])
+          if sourceId != None:
+            self.lms.filterEvent(self.receiverId, 'removeSession', {'id': sourceId}, deadline = deadline)
 
-    
-  def commuteChannel(self, channel):
+    if self.grid:
+      self.updateGrid(deadline = deadline)
+
+  def getSharedEntry(self, source):
+    channels = self.registry.getChannelsBySource(source)
+    if not channels:
+      return None
+
+    return self.registry.getEntry(channels[0])
+
+  def getChannelSource(self, chnl):
+    """Gets the source of a channel.
+
+    Args:
+      chnl: An Integer representing the ID of the channel.
+
+    Returns:
+      The normalized RTSP uri or V4L device of the channel, None if the channel is unknown.
+    """
+    with self.lock:
+      return self.registry.getSource(chnl)
+
+  def getSourceChannels(self, source):
+    """Gets the channels of a source.
+
+    Args:
+      source: The RTSP uri or V4L device of the source.
+
+    Returns:
+      The sorted list of channels fed by the given source.
+    """
+    if source.lower().startswith('rtsp:'):
+      source = normalizeUrl(parseUrl(source))
+
+    with self.lock:
+      return self.registry.getChannelsBySource(source)
+
+  def getChannelInfo(self, chnl):
+    """Gets the registry entry of a channel.
+
+    Returns:
+      A dictionary with the source, receiver session and port, decoder and, for 
+      each output, the resampler and path IDs of the channel. None if the channel
+      is unknown. The dictionary is a copy, changing it does not affect the manager.
+    """
+    with self.lock:
+      return copy.deepcopy(self.registry.getEntry(chnl))
+
+  @Tracing.traced
+  @serialized
+  def commuteChannel(self, channel, output = None, deadline = None):
     """Makes the desired channel visible.
 
-    This methond enables/disables the desired channel in main output.
+    This methond enables/disables the desired channel in the non grid outputs.
 
     Args: 
       chnl: An Integer representing the ID of the desired channel to remove. 
+      output: The name of the output to commute. If None all non grid outputs 
+      are commuted. Optional parameter.
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
+
+    Commute listeners are notified, as this is an operator commute. Channels
+    shown by the manager itself, e.g. when a source is added, do not notify them.
 
     Raises:
       Exception: In case of failure or in case of providing a non existing 
       channel, it raises an Exception. 
     """
-    state = self.lms.getState()
-    mixerCh = self.getChannels(state, self.videoMixerId)
+    deadline = Deadline.toDeadline(deadline)
+    self.showChannel(channel, output, deadline)
 
-    hasChnl = False
-    for chnl in mixerCh:    
-      if chnl['id'] == channel:
-        hasChnl = True
-        break
+    for listener in list(self.commuteListeners):
+      listener(channel, output)
 
-    if not hasChnl:
-      raise Exception("The specified channel does not exist")
-
-    for chnl in mixerCh:
-      if chnl['id'] == channel:
-        self.lms.filterEvent(self.videoMixerId, 'configChannel', 
-                             {'id': channel, 
-                               'width': 1, 'height': 1,
-                               'x': 0, 'y': 0,
-                               'layer': 0, 'enabled': True, 
-                               'opacity': 1})
-      else:
-        self.lms.filterEvent(self.videoMixerId, 'configChannel', 
-                             {'id': chnl['id'], 
-                               'width': 1, 'height': 1,
-                               'x': 0, 'y': 0,
-                               'layer': 1, 'enabled': False,
-                               'opacity': 1})
-
-  def updateGrid(self):
-    state = self.lms.getState()
-    channels = self.getChannels(state, self.videoMixer2Id)
-    mixCols = math.ceil(math.sqrt(len(channels)))
+  def showChannel(self, channel, output, deadline):
+    # Called with the lock held, commutes without notifying the listeners
+    state = self.getPipeState(deadline)
+    self.ensureOutputs(state)
 
-    layer = 0
-    for channel in channels:
-      self.lms.filterEvent(self.videoMixer2Id, 'configChannel', 
-                           {'id': channel['id'], 
-                             'width': 1 / mixCols, 'height': 1 / mixCols,
-                             'x': (layer % mixCols) / mixCols, 
-                             'y': (layer // mixCols) / mixCols,
-                             'layer': layer, 'enabled': True, 
-                             'opacity': 1})
-      layer += 1
-
-  def stopPipe(self):
+    outputs = self.getCommuteOutputs(output)
+
+    events = []
+    for cOutput in outputs:
+      mixerCh = [chnl['id'] for chnl in self.getChannels(state, cOutput.mixerId)]
+
+      if channel not in mixerCh:
+        raise Exception("The specified channel does not exist")
+
+      events.extend(self.getCommuteEvents(channel, mixerCh, [cOutput]))
+
+    if events:
+      self.lms.sendEvents({'events': events}, deadline)
+
+    for cOutput in outputs:
+      self.visibleChannels[cOutput.name] = channel
+
+  def getCommuteOutputs(self, output = None):
+    if output == None:
+      return [cOutput for cOutput in self.outputs if not cOutput.grid]
+
+    return [self.getOutput(output)]
+
+  def getCommuteEvents(self, channel, channels, outputs):
+    """Builds the events making a channel visible.
+
+    Args:
+      channel: The channel to show.
+      channels: The list of all the channels of the mixers.
+      outputs: The list of Output objects to commute.
+
+    Returns:
+      A list of configChannel events, to be sent in a single message.
+    """
+    events = []
+    for cOutput in outputs:
+      for chnl in channels:
+        if chnl == channel:
+          params = {'id': channel, 
+                    'width': 1, 'height': 1,
+                    'x': 0, 'y': 0,
+                    'layer': 0, 'enabled': True, 
+                    'opacity': 1}
+        else:
+          params = {'id': chnl, 
+                    'width': 1, 'height': 1,
+                    'x': 0, 'y': 0,
+                    'layer': 1, 'enabled': False,
+                    'opacity': 1}
+        events.append({'action': 'configChannel', 'filterId': cOutput.mixerId, 'params': params})
+
+    return events
+
+  def addCommuteListener(self, listener):
+    """Registers a function called as listener(channel, output) after every commuteChannel call."""
+    self.commuteListeners.append(listener)
+
+  def removeCommuteListener(self, listener):
+    if listener in self.commuteListeners:
+      self.commuteListeners.remove(listener)
+
+  @Tracing.traced
+  @serialized
+  def updateGrid(self, output = None, channels = None, deadline = None):
+    deadline = Deadline.toDeadline(deadline)
+    self.ensureOutputs(deadline = deadline)
+    if output == None:
+      outputs = [cOutput for cOutput in self.outputs if cOutput.grid]
+    else:
+      outputs = [self.getOutput(output)]
+
+    state = None
+    if channels == None:
+      state = self.getPipeState(deadline)
+    else:
+      channels = [{'id': channel} for channel in channels]
+
+    for cOutput in outputs:
+      if state != None:
+        channels = self.getChannels(state, cOutput.mixerId)
+      mixCols = math.ceil(math.sqrt(len(channels)))
+
+      layer = 0
+      for channel in channels:
+        self.lms.filterEvent(cOutput.mixerId, 'configChannel', 
+                             {'id': channel['id'], 
+                               'width': 1 / mixCols, 'height': 1 / mixCols,
+                               'x': (layer % mixCols) / mixCols, 
+                               'y': (layer // mixCols) / mixCols,
+                               'layer': layer, 'enabled': True, 
+                               'opacity': 1}, deadline = deadline)
+        layer += 1
+
+  @Tracing.traced
+  @serialized
+  def stopPipe(self, deadline = None):
     """Clears all data present in the current pipe.
 
-    This method deletes all the filters and paths of the current pipe. 
+    This method deletes all the filters and paths of the current pipe. Within
+    a namespace only its own filters and paths are deleted.
     
+    Args:
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
+
     Raises:
       Exception: In case of failure raises an Exception. 
     """
-    self.lms.stop()
+    deadline = Deadline.toDeadline(deadline)
+    self.registry.clear()
+    self.clearPipe(deadline)
+
+  def clearPipe(self, deadline = None):
+    if not self.namespace.isScoped():
+      self.lms.stop(deadline = deadline)
+      return
+
+    # Paths go first, as filters in use by a path are not removed
+    state = self.getPipeState(deadline)
+    events = [{'action': 'removePath', 'params': {'id': cPath['id']}} for cPath in state['paths']]
+    self.sendCleanupEvents(events, deadline)
+
+    # The transmitter is kept while other namespaces publish through it
+    fullState = self.lms.getState(deadline = deadline) or {'filters': [], 'paths': []}
+    state = self.namespace.filterState(fullState)
+    shared = any(cPath['destinationFilter'] == self.transmitterId for cPath in fullState['paths'])
+    if shared:
+      # Its RTSP connections would clash with those of a later startPipe
+      events = [{'action': 'removeRTSPConnection', 'filterId': self.transmitterId, 'params': {'id': streamId}}
+                for streamId in self.getConnectionIds(fullState)]
+      self.sendCleanupEvents(events, deadline)
+
+    events = [{'action': 'removeFilter', 'params': {'id': cFilter['id']}} for cFilter in state['filters']
+              if not (shared and cFilter['id'] == self.transmitterId)]
+    self.sendCleanupEvents(events, deadline)
+
+  def getConnectionIds(self, state):
+    # The RTSP connections of the namespace on the transmitter, those of its outputs if LMS does not report them
+    for cFilter in state['filters']:
+      if cFilter['id'] == self.transmitterId and 'connections' in cFilter:
+        return [connection['id'] for connection in cFilter['connections']
+                if self.namespace.contains(connection['id'])]
+
+    return [output.streamId for output in self.outputs]
 
-  def setOutputFPS(self, fps, main = True):
+  def sendCleanupEvents(self, events, deadline):
+    if not events:
+      return
+
+    try:
+      self.lms.sendEvents({'events': events}, deadline)
+    except Deadline.LMSTimeoutError:
+      raise
+    except Exception as e:
+      logging.error("Error clearing namespace {}: {}".format(*[self.namespace, e]))
+
+  @Tracing.traced
+  @serialized
+  def setOutputFPS(self, fps, output = None, deadline = None, main = None):
     """Sets the upper threshold of the output frames per second.
 
     This methods sets the minimum allowed distance (measured in time) between two 
@@ -599,38 +1532,39 @@ class SecurityManager:
 
     Args:
       fps: Frames per second limit.
-      main: if True apply limitation to main output or apply it to the grid output otherwise.
+      output: The name of the output to apply the limitation to. If None the main 
+      output is used. Optional parameter.
+      main: Deprecated, use output. True selects the main output and False the
+      grid output. Optional parameter.
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
     
     Raises:
       Exception: In case of failure raises an Exception. 
     """
+    deadline = Deadline.toDeadline(deadline)
     if fps > self.DEF_MAX_FPS:
       raise Exception("Maximum fps is {}, you entered {}.".format(*[self.DEF_MAX_FPS, fps]))
 
-    state = self.lms.getState()
+    self.ensureOutputs(deadline = deadline)
+    cOutput = self.selectOutput(output, main)
+    state = self.getPipeState(deadline)
 
-    if main:
-      mixId = self.videoMixerId
-      encId = self.videoEncoderId
-    elif self.grid:
-      mixId = self.videoMixer2Id
-      encId = self.videoEncoder2Id
-    else:
-      raise Exception("Grid mode is not enabled")
-
-    channels = self.getChannels(state, mixId)
+    channels = self.getChannels(state, cOutput.mixerId)
 
     for channel in channels:
-      path = self.getPathFromDst(state, mixId, channel['id'])
+      path = self.getPathFromDst(state, cOutput.mixerId, channel['id'])
       if path == None:
         raise Exception("Path not found for channel {}".format(*[channel['id']]))
       for fId in path['filters']:
         if self.getFilterType(state, fId) == 'videoResampler':
-          self.lms.filterEvent(fId, 'configure', {'fps': fps})
+          self.lms.filterEvent(fId, 'configure', {'fps': fps}, deadline = deadline)
 
-    self.lms.filterEvent(encId, 'configure', {'fps': fps})
+    self.lms.filterEvent(cOutput.encoderId, 'configure', {'fps': fps}, deadline = deadline)
+    cOutput.fps = fps
 
-  def setOutputResolution(self, width, height, main = True):
+  @Tracing.traced
+  @serialized
+  def setOutputResolution(self, width, height, output = None, deadline = None, main = None):
     """Sets the output stream resolution.
 
     Sets the output stream resolution to the given parameters.
@@ -638,44 +1572,50 @@ class SecurityManager:
     Args:
       width: desired output width.
       height: desired output height.
-      main: if True apply the resolution change to main output, otherwise apply it to the grid output.
+      output: The name of the output to apply the resolution change to. If None the main 
+      output is used. Optional parameter.
+      main: Deprecated, use output. True selects the main output and False the
+      grid output. Optional parameter.
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
     
     Raises:
       Exception: In case of failure raises an Exception. 
     """
-    state = self.lms.getState()
+    deadline = Deadline.toDeadline(deadline)
+    self.ensureOutputs(deadline = deadline)
+    cOutput = self.selectOutput(output, main)
+    state = self.getPipeState(deadline)
 
-    if main:
-      mixId = self.videoMixerId
-    elif self.grid:
-      mixId = self.videoMixer2Id
-    else:
-      raise Exception("There is no grid mode enabled")
-
-    channels = self.getChannels(state, mixId)
+    channels = self.getChannels(state, cOutput.mixerId)
     mixCols = math.ceil(math.sqrt(len(channels)))
 
     for channel in channels:
-      path = self.getPathFromDst(state, mixId, channel['id'])
+      path = self.getPathFromDst(state, cOutput.mixerId, channel['id'])
       if path == None:
         raise Exception("Path not found for channel {}".format(*[channel['id']]))
       for fId in path['filters']:
         if self.getFilterType(state, fId) == 'videoResampler':
-          if main: 
-            self.lms.filterEvent(fId, 'configure', {'width': width, 'height': height})
+          if not cOutput.grid: 
+            self.lms.filterEvent(fId, 'configure', {'width': width, 'height': height}, deadline = deadline)
           else:
             self.lms.filterEvent(fId, 
                                  'configure', 
                                  {'width': width // mixCols,
-                                  'height': height // mixCols})
+                                  'height': height // mixCols}, deadline = deadline)
 
-    self.lms.filterEvent(mixId, 'configure', {'width': width, 'height': height})
+    self.lms.filterEvent(cOutput.mixerId, 'configure', {'width': width, 'height': height}, deadline = deadline)
+    cOutput.width = width
+    cOutput.height = height
 
 
-  def setEncoderParams(self, bitrate, gop, lookahead, bFrames, threads, annexb, preset, main = True):
+  @Tracing.traced
+  @serialized
+  def setEncoderParams(self, bitrate = None, gop = None, lookahead = None, bFrames = None, threads = None, 
+                       annexb = None, preset = None, output = None, deadline = None, main = None):
     """Sets the output stream encoder configuration.
 
     Sets the output stream encoder (coupled with x264 implementation) configuration.
+    Parameters left to None keep their current value.
 
     Args:
       bitrate: desired output bitrate in kbps.
@@ -686,65 +1626,99 @@ class SecurityManager:
       annexb: codification flavour with or without start codes.
       preset: the configuration preset to be used. All other parameters are set, 
       after applying the preset.
-      main: if True apply the configuration change to main output, otherwise apply it to grid output.
+      output: The name of the output to apply the configuration change to. If None 
+      the main output is used. Optional parameter.
+      main: Deprecated, use output. True selects the main output and False the
+      grid output. Optional parameter.
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
     
     Raises:
       Exception: In case of failure raises an Exception. 
     """
-    if main:
-      encId = self.videoEncoderId
-    elif self.grid:
-      encId = self.videoEncoder2Id 
-    else:
-      raise Exception("There is no grid mode enabled")
-
-    self.lms.filterEvent(encId, 'configure', {'bitrate': bitrate, 'gop': gop, 
-                                                'lookahead': lookahead, 'bframes': bFrames, 
-                                                'threads': threads, 'annexb': annexb, 
-                                                'preset': preset})
-
-  def getEncoderParams(self, main = True):
+    deadline = Deadline.toDeadline(deadline)
+    self.ensureOutputs(deadline = deadline)
+    cOutput = self.selectOutput(output, main)
+
+    params = {'bitrate': bitrate, 'gop': gop, 
+              'lookahead': lookahead, 'bframes': bFrames, 
+              'threads': threads, 'annexb': annexb, 
+              'preset': preset}
+    params = dict((key, value) for key, value in params.items() if value != None)
+    if not params:
+      raise Exception("No encoder parameter given")
+
+    self.lms.filterEvent(cOutput.encoderId, 'configure', params, deadline = deadline)
+    cOutput.encoderParams.update(params)
+
+  @Tracing.traced
+  def getEncoderParams(self, output = None, deadline = None, main = None):
     """Gets the output stream encoder configuration.
 
     Gets the output stream encoder (coupled with x264 implementation) configuration.
 
     Args:
-      main: if True get the configuration of the main output, otherwise 
-      get the configuration of the grid output.
+      output: The name of the output to get the configuration from. If None 
+      the main output is used. Optional parameter.
+      main: Deprecated, use output. True selects the main output and False the
+      grid output. Optional parameter.
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
     
     Raises:
       Exception: In case of failure raises an Exception. 
     """
-    if main:
-      encId = self.videoEncoderId
-    elif self.grid:
-      encId = self.videoEncoder2Id
-    else:
-      raise Exception("There is no grid mode enabled")
+    deadline = Deadline.toDeadline(deadline)
+    self.ensureOutputs(deadline = deadline)
+    cOutput = self.selectOutput(output, main)
 
-    state = self.lms.getState()
+    state = self.getPipeState(deadline)
     
     for cFilter in state['filters']:
-      if cFilter['id'] == encId:
+      if cFilter['id'] == cOutput.encoderId:
         return cFilter
 
     return None
 
-  def getSharedMemoryId(self):
+  @Tracing.traced
+  def getSharedMemoryId(self, deadline = None):
     """Get the Shared Memory Id of the current pipe.
 
     
     The main output can be accessed by another process by using this shared memory key.
 
+    Args:
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
+
     Returns:
       The shared memory ID.
 
     Raises:
       Exception: In case of failure raises an Exception. 
     """
-    state = self.lms.getState()
+    deadline = Deadline.toDeadline(deadline)
+    state = self.getPipeState(deadline)
+    self.ensureOutputs(state)
     
     for cFilter in state['filters']:
       if cFilter['id'] == self.sharedMemoryId:
         return cFilter['memoryId']
 
+  def getSharedMemoryReader(self, deadline = None):
+    """Attaches a reader to the shared memory of the current pipe.
+
+    Args:
+      deadline: A Deadline or a number of seconds bounding the whole operation. Optional parameter.
+
+    Returns:
+      A SharedMemoryReader exposing the main output frames as NumPy arrays 
+      backed by the shared buffer.
+
+    Raises:
+      Exception: In case of failure or if the pipe has no shared memory raises an Exception. 
+    """
+    from . import SharedMemoryReader
+
+    memoryId = self.getSharedMemoryId(deadline)
+    if memoryId == None:
+      raise Exception("There is no shared memory in the current pipe")
+
+    return SharedMemoryReader.SharedMemoryReader(key = memoryId)
@@ -0,0 +1,346 @@
+"""
+ShardedSecurityManager.py - Spreads the cameras of a security scenario
+                            across a pool of LMS instances
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import copy
+import logging
+
+from . import SecurityManager
+from . import HashRing
+
+class ShardedSecurityManager:
+  DEF_CAPACITY = 16
+  REF_PIXELS = 1920 * 1080
+
+  def __init__(self):
+    """ShardedSecurityManager constructor
+
+    It places RTSP sources on a pool of LMS instances using a consistent
+    hashing ring weighted by the capacity of each node, and exposes a single
+    logical channel namespace. Logical channels never change, even when their
+    source is moved to another node.
+
+    Capacities and source costs are measured in decoders of REF_PIXELS pixels,
+    so a 1080p source costs 1 and a 720p one costs about 0.44. Channels of the
+    same source placed on a node share its decoder, so they are counted once.
+    """
+    self.nodes = {}
+    self.ring = HashRing.HashRing()
+    self.channels = {}
+    self.nextChannel = 1
+    self.started = False
+    self.grid = False
+    self.outputs = None
+
+  def addNode(self, name, host, port, capacity = DEF_CAPACITY, rebalance = True, namespace = None):
+    """Adds a LMS instance to the pool.
+
+    Args:
+      name: A unique name for the node.
+      host: The host in which the LiveMediaStreamer is running.
+      port: The port in which the LiveMediaStreamer is listening.
+      capacity: The decoding capacity of the node. Optional parameter.
+      rebalance: If True, sources whose ring position now belongs to the new
+      node are moved to it. Enabled by default. Optional parameter.
+      namespace: The Namespace of the node manager, so several nodes can be 
+      hosted by a single LMS instance. Optional parameter.
+
+    Raises:
+      Exception: In case the name is in use or the namespace overlaps the one of
+      another node of the same LMS instance raises an Exception.
+    """
+    if name in self.nodes:
+      raise Exception("Node {} already exists".format(*[name]))
+
+    manager = SecurityManager.SecurityManager(host, port, namespace)
+    for other in self.nodes.values():
+      if other['address'] == (host, port) and other['manager'].namespace.overlaps(manager.namespace):
+        raise Exception("Namespace {} of node {} overlaps the one of node {}".format(*[manager.namespace, 
+                                                                                      name, other['name']]))
+
+    node = {'name': name,
+            'address': (host, port),
+            'manager': manager,
+            'capacity': capacity,
+            'load': 0,
+            'channels': set(),
+            'sources': {}}
+    if self.started:
+      node['manager'].startPipe(self.grid, copy.deepcopy(self.outputs))
+
+    self.nodes[name] = node
+    self.ring.addNode(name, capacity)
+
+    if rebalance:
+      self.rebalance()
+
+  def removeNode(self, name, stop = True):
+    """Removes a LMS instance from the pool.
+
+    Its sources are placed on the remaining nodes, keeping their logical channels.
+
+    Args:
+      name: The name of the node to remove.
+      stop: If True the pipe of the removed node is stopped, otherwise only its
+      channels are removed from it. Optional parameter.
+    """
+    node = self.getNode(name)
+    self.ring.removeNode(name)
+    del self.nodes[name]
+
+    for channel in sorted(node['channels']):
+      entry = self.channels[channel]
+      localChannel = entry['localChannel']
+      entry['node'] = None
+      entry['localChannel'] = None
+      try:
+        self.place(channel)
+      except Exception as e:
+        # It stays unplaced until a later rebalance finds room for it
+        logging.error("Error moving channel {}: {}".format(*[channel, e]))
+
+      if not stop:
+        try:
+          self.release(channel, node, localChannel)
+        except Exception as e:
+          logging.error("Error removing channel {} from node {}: {}".format(*[channel, name, e]))
+
+    if stop:
+      node['manager'].stopPipe()
+
+  def getNode(self, name):
+    node = self.nodes.get(name)
+    if node == None:
+      raise Exception("Unknown node {}".format(*[name]))
+
+    return node
+
+  def getEntry(self, channel):
+    entry = self.channels.get(channel)
+    if entry == None:
+      raise Exception("The specified channel does not exist")
+
+    return entry
+
+  def sourceCost(self, width = None, height = None):
+    if width == None or height == None:
+      return 1
+
+    return max(width * height / self.REF_PIXELS, 0.1)
+
+  def getCost(self, node, entry):
+    # A source already decoded in the node adds no load
+    if entry['source'] in node['sources']:
+      return 0
+
+    return entry['cost']
+
+  def choose(self, entry, exclude = None):
+    for name in self.ring.getNodes(entry['source']):
+      node = self.nodes[name]
+      if name == exclude:
+        continue
+      if node['load'] + self.getCost(node, entry) <= node['capacity']:
+        return node
+
+    return None
+
+  def attach(self, channel, node):
+    entry = self.channels[channel]
+    localChannel = node['manager'].addRTSPSource(entry['uri'], entry['keepAlive'])
+    source = node['sources'].get(entry['source'])
+    if source == None:
+      source = {'cost': entry['cost'], 'channels': set()}
+      node['sources'][entry['source']] = source
+      node['load'] += source['cost']
+    source['channels'].add(channel)
+    node['channels'].add(channel)
+    entry['node'] = node['name']
+    entry['localChannel'] = localChannel
+
+  def release(self, channel, node, localChannel):
+    """Removes a channel from the given node, freeing its load with the last
+    channel of its source."""
+    entry = self.channels[channel]
+    try:
+      node['manager'].removeInputChannel(localChannel)
+    finally:
+      node['channels'].discard(channel)
+      source = node['sources'].get(entry['source'])
+      if source != None:
+        source['channels'].discard(channel)
+        if not source['channels']:
+          del node['sources'][entry['source']]
+          node['load'] -= source['cost']
+
+  def detach(self, channel):
+    entry = self.channels[channel]
+    node = self.nodes.get(entry['node'])
+    try:
+      if node != None:
+        self.release(channel, node, entry['localChannel'])
+    finally:
+      entry['node'] = None
+      entry['localChannel'] = None
+
+  def place(self, channel):
+    entry = self.channels[channel]
+    node = self.choose(entry)
+    if node == None:
+      raise Exception("No LMS node has capacity left for {}".format(*[entry['uri']]))
+
+    self.attach(channel, node)
+
+  def rebalance(self):
+    """Moves the sources whose preferred node has changed.
+
+    A source is moved only if the first node of its ring position is not the
+    current one and has capacity left, so adding a node only moves the sources
+    of the ring segments it takes over. Sources left unplaced by a node removal
+    are placed again if there is room for them.
+
+    Returns:
+      The list of moved logical channels.
+    """
+    moved = []
+    for channel in sorted(self.channels):
+      entry = self.channels[channel]
+      if entry['node'] == None:
+        node = self.choose(entry)
+      else:
+        node = self.nodes.get(self.ring.getNode(entry['source']))
+        if node == None or node['name'] == entry['node']:
+          continue
+        if node['load'] + self.getCost(node, entry) > node['capacity']:
+          continue
+
+      if node == None:
+        continue
+
+      # The source is added to the new node before leaving the old one, so it
+      # keeps being decoded somewhere if the move fails
+      old = self.nodes.get(entry['node'])
+      localChannel = entry['localChannel']
+      try:
+        self.attach(channel, node)
+      except Exception as e:
+        logging.error("Error moving channel {}: {}".format(*[channel, e]))
+        continue
+
+      moved.append(channel)
+      if old != None:
+        try:
+          self.release(channel, old, localChannel)
+        except Exception as e:
+          logging.error("Error removing channel {} from node {}: {}".format(*[channel, old['name'], e]))
+
+    return moved
+
+  def startPipe(self, grid = False, outputs = None):
+    """Starts the pipe in every node.
+
+    Args:
+      grid: It is a boolean to enable/disable the grid mode functionality. Optional parameter.
+      outputs: A list of Output objects, each node gets its own copy. Optional parameter.
+    """
+    self.grid = grid
+    self.outputs = outputs
+    for node in self.nodes.values():
+      node['manager'].startPipe(grid, copy.deepcopy(outputs))
+      node['load'] = 0
+      node['channels'] = set()
+      node['sources'] = {}
+
+    self.channels = {}
+    self.started = True
+
+  def stopPipe(self):
+    for node in self.nodes.values():
+      node['manager'].stopPipe()
+      node['load'] = 0
+      node['channels'] = set()
+      node['sources'] = {}
+
+    self.channels = {}
+    self.started = False
+
+  def addRTSPSource(self, uri, keepAlive = True, width = None, height = None):
+    """Adds a RTSP source to the node chosen by the placement.
+
+    Args:
+      uri: The RTSP uri of the input source.
+      keepAlive: A boolean to enable/disable the keep alive messages. Optional parameter.
+      width: The source width, used to compute its decoding cost. Optional parameter.
+      height: The source height, used to compute its decoding cost. Optional parameter.
+
+    Returns:
+      The logical channel assigned to the source.
+
+    Raises:
+      Exception: In case of failure or if no node has capacity left raises an Exception.
+    """
+    channel = self.nextChannel
+    self.channels[channel] = {'uri': uri, 'keepAlive': keepAlive,
+                              'source': SecurityManager.normalizeUrl(SecurityManager.parseUrl(uri)),
+                              'cost': self.sourceCost(width, height),
+                              'node': None, 'localChannel': None}
+    try:
+      self.place(channel)
+    except:
+      del self.channels[channel]
+      raise
+
+    self.nextChannel += 1
+    return channel
+
+  def removeInputChannel(self, channel):
+    self.getEntry(channel)
+    try:
+      self.detach(channel)
+    finally:
+      del self.channels[channel]
+
+  def commuteChannel(self, channel, output = None):
+    """Makes the desired logical channel visible in the output of its node."""
+    entry = self.getEntry(channel)
+    if entry['node'] == None:
+      raise Exception("Channel {} is not placed in any node".format(*[channel]))
+
+    self.nodes[entry['node']]['manager'].commuteChannel(entry['localChannel'], output)
+
+  def getChannelNode(self, channel):
+    """Returns the node name and the local channel of a logical channel."""
+    entry = self.getEntry(channel)
+    return entry['node'], entry['localChannel']
+
+  def getChannels(self):
+    return sorted(self.channels)
+
+  def getLoads(self):
+    """Returns a dictionary with the load and capacity of each node."""
+    loads = {}
+    for name, node in self.nodes.items():
+      loads[name] = {'load': node['load'], 'capacity': node['capacity'],
+                     'channels': sorted(node['channels'])}
+
+    return loads
@@ -0,0 +1,278 @@
+"""
+SharedMemoryReader.py - Zero-copy reader of the frames published by the LMS
+                        sharedMemory filter through SysV or mmap shared memory
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import ctypes
+import ctypes.util
+import mmap
+import os
+import struct
+import time
+
+import numpy
+
+# Segment layout of the LMS sharedMemory filter. The filter keeps a single
+# frame slot, handed over between LMS and one reader through the sync byte:
+#
+#   offset 0   sync      uint8   WRITE_ENABLED once the reader is done with the
+#                                frame, LMS then writes the next one and sets
+#                                FRAME_READY. Frames arriving meanwhile are skipped.
+#   offset 1   seqNum    uint16  The frame sequence number, it wraps around.
+#   offset 3   width     uint16  The frame width.
+#   offset 5   height    uint16  The frame height.
+#   offset 7   dataSize  uint32  The number of bytes of frame data.
+#   offset 11  data              The RGB24 frame, as produced by the mixer.
+#
+# A freshly created segment is zeroed, i.e. FRAME_READY with no data, so LMS
+# waits for a reader to enable writing.
+HEADER_FMT = '<BHHHI'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+FRAME_READY = 0x00
+WRITE_ENABLED = 0x01
+MAX_FRAME_SIZE = 3840 * 2160 * 3
+SEGMENT_SIZE = HEADER_SIZE + MAX_FRAME_SIZE
+COMPONENTS = 3
+
+IPC_RMID = 0
+IPC_CREAT = 0o1000
+
+_libc = None
+
+def getLibc():
+  global _libc
+  if _libc == None:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+    _libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+    _libc.shmget.restype = ctypes.c_int
+    _libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    _libc.shmat.restype = ctypes.c_void_p
+    _libc.shmdt.argtypes = [ctypes.c_void_p]
+    _libc.shmdt.restype = ctypes.c_int
+    _libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+    _libc.shmctl.restype = ctypes.c_int
+
+  return _libc
+
+def segmentSize(maxFrameSize):
+  return HEADER_SIZE + maxFrameSize
+
+def attachSysV(key, size, create):
+  """Attaches a SysV shared memory segment for reading and writing.
+
+  Args:
+    key: The SysV key of the segment.
+    size: The size of the segment, 0 to attach an existing segment.
+    create: If True the segment is created if needed.
+
+  Returns:
+    The address in which the segment is attached.
+
+  Raises:
+    Exception: In case of failure raises an Exception.
+  """
+  libc = getLibc()
+  flags = IPC_CREAT | 0o666 if create else 0
+  shmId = libc.shmget(key, size, flags)
+  if shmId < 0:
+    raise Exception("Cannot get shared memory {}: {}".format(*[key, os.strerror(ctypes.get_errno())]))
+
+  # Readers write the sync byte, so segments are never attached read only
+  addr = libc.shmat(shmId, None, 0)
+  if addr == None or addr == ctypes.c_void_p(-1).value:
+    raise Exception("Cannot attach shared memory {}: {}".format(*[key, os.strerror(ctypes.get_errno())]))
+
+  return addr
+
+def detachSysV(addr):
+  getLibc().shmdt(addr)
+
+def removeSysV(key):
+  """Marks a SysV segment for removal, it is destroyed once every process detaches."""
+  libc = getLibc()
+  shmId = libc.shmget(key, 0, 0)
+  if shmId >= 0:
+    libc.shmctl(shmId, IPC_RMID, None)
+
+class Frame:
+  def __init__(self, seqNum, width, height, data):
+    """Frame constructor
+
+    A frame read from the shared memory segment. The data array is a view of
+    the shared buffer, no copy is done. It is valid until the reader hands the
+    segment back to LMS, use SharedMemoryReader.isValid to check it, or copy it.
+
+    Args:
+      seqNum: The sequence number written by LMS.
+      width: The frame width.
+      height: The frame height.
+      data: A NumPy array backed by the shared buffer, shaped (height, width, 3)
+      if its size matches an RGB24 frame.
+    """
+    self.seqNum = seqNum
+    self.width = width
+    self.height = height
+    self.data = data
+
+class SharedMemoryReader:
+  POLL_INTERVAL = 0.002
+
+  def __init__(self, key = None, path = None, maxFrameSize = MAX_FRAME_SIZE):
+    """SharedMemoryReader constructor
+
+    It attaches to the segment of a LMS sharedMemory filter, either the SysV
+    segment identified by its key (the memoryId reported by LMS) or a file
+    mapped with mmap (i.e. a file in /dev/shm). A segment has a single reader,
+    as reading hands the segment back to LMS.
+
+    Args:
+      key: The SysV shared memory key.
+      path: The path of a file holding the segment. Used when key is None.
+      maxFrameSize: The largest frame the segment can hold. Optional parameter.
+
+    Raises:
+      Exception: In case of failure or in case of an unknown segment layout
+      raises an Exception.
+    """
+    if key == None and path == None:
+      raise Exception("A shared memory key or path is required")
+
+    self.key = key
+    self.path = path
+    self.maxFrameSize = maxFrameSize
+    self.addr = None
+    self.mmap = None
+    self.buffer = None
+    self.lastSeqNum = None
+    self.attach()
+
+  def attach(self):
+    if self.key != None:
+      self.addr = attachSysV(self.key, 0, False)
+      size = segmentSize(self.maxFrameSize)
+      self.buffer = memoryview((ctypes.c_ubyte * size).from_address(self.addr)).cast('B')
+    else:
+      fd = os.open(self.path, os.O_RDWR)
+      try:
+        self.mmap = mmap.mmap(fd, 0)
+      finally:
+        os.close(fd)
+      self.buffer = self.mmap
+      self.maxFrameSize = min(self.maxFrameSize, len(self.mmap) - HEADER_SIZE)
+
+    self.checkHeader()
+
+  def checkHeader(self):
+    if self.maxFrameSize < 0:
+      self.close()
+      raise Exception("Not a LMS sharedMemory segment")
+
+    sync, seqNum, width, height, dataSize = self.readHeader()
+    if sync not in (FRAME_READY, WRITE_ENABLED) or dataSize > self.maxFrameSize:
+      self.close()
+      raise Exception("Not a LMS sharedMemory segment")
+
+  def readHeader(self):
+    """Returns the sync byte, sequence number, width, height and data size."""
+    return struct.unpack_from(HEADER_FMT, self.buffer, 0)
+
+  def close(self):
+    """Detaches from the segment.
+
+    All frames obtained from this reader must be released before closing it,
+    otherwise their data would point to unmapped memory.
+    """
+    self.buffer = None
+    if self.addr != None:
+      detachSysV(self.addr)
+      self.addr = None
+    if self.mmap != None:
+      try:
+        self.mmap.close()
+      except BufferError:
+        pass
+      self.mmap = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def release(self):
+    """Hands the segment back to LMS so it writes the next frame.
+
+    Frames obtained before are not valid anymore.
+    """
+    self.buffer[0] = WRITE_ENABLED
+
+  def getLatestFrame(self):
+    """Returns the frame held in the segment or None if there is none.
+
+    It does not wait nor hand the segment back to LMS.
+    """
+    sync, seqNum, width, height, dataSize = self.readHeader()
+    if sync != FRAME_READY or dataSize == 0 or dataSize > self.maxFrameSize:
+      return None
+
+    data = numpy.frombuffer(self.buffer, dtype = numpy.uint8, count = dataSize, offset = HEADER_SIZE)
+    if dataSize == width * height * COMPONENTS:
+      data = data.reshape((height, width, COMPONENTS))
+
+    self.lastSeqNum = seqNum
+    return Frame(seqNum, width, height, data)
+
+  def isValid(self, frame):
+    """Checks whether the data of a frame has not been overwritten by LMS."""
+    sync, seqNum, width, height, dataSize = self.readHeader()
+    return sync == FRAME_READY and seqNum == frame.seqNum
+
+  def waitFrame(self, timeout = None, block = True):
+    """Waits for a frame newer than the last one returned by this reader.
+
+    The segment is handed back to LMS once the last frame has been returned, so
+    frames obtained before are not valid anymore.
+
+    Args:
+      timeout: The maximum number of seconds to wait. Wait forever if None. Optional parameter.
+      block: If False returns immediately. Enabled by default. Optional parameter.
+
+    Returns:
+      The new Frame or None if no new frame arrived in time.
+    """
+    deadline = None
+    if timeout != None:
+      deadline = time.monotonic() + timeout
+
+    while True:
+      sync, seqNum, width, height, dataSize = self.readHeader()
+      if sync == FRAME_READY:
+        if dataSize > 0 and seqNum != self.lastSeqNum:
+          frame = self.getLatestFrame()
+          if frame != None:
+            return frame
+        self.release()
+
+      if not block or (deadline != None and time.monotonic() >= deadline):
+        return None
+
+      time.sleep(self.POLL_INTERVAL)
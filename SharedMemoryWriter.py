@@ -0,0 +1,112 @@
+"""
+SharedMemoryWriter.py - Local stand-in of the LMS sharedMemory filter writing
+                        the same segment layout, used for tests and demos
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import ctypes
+import mmap
+import os
+import struct
+
+from . import SharedMemoryReader as shm
+
+class SharedMemoryWriter:
+  def __init__(self, key = None, path = None, maxFrameSize = shm.MAX_FRAME_SIZE, remove = True):
+    """SharedMemoryWriter constructor
+
+    It stands in for the LMS sharedMemory filter: it creates (or truncates) a
+    zeroed segment with the same layout, either a SysV segment or a file mapped
+    with mmap, and writes frames following the same sync byte handshake.
+
+    Args:
+      key: The SysV shared memory key.
+      path: The path of the file holding the segment. Used when key is None.
+      maxFrameSize: The maximum size in bytes of a frame. Optional parameter.
+      remove: If True the SysV segment is removed on close. Enabled by default.
+      Optional parameter.
+
+    Raises:
+      Exception: In case of failure raises an Exception.
+    """
+    if key == None and path == None:
+      raise Exception("A shared memory key or path is required")
+
+    self.key = key
+    self.remove = remove
+    self.maxFrameSize = maxFrameSize
+    self.seqNum = 0
+    self.addr = None
+    self.mmap = None
+    size = shm.segmentSize(maxFrameSize)
+
+    if key != None:
+      self.addr = shm.attachSysV(key, size, True)
+      self.buffer = memoryview((ctypes.c_ubyte * size).from_address(self.addr)).cast('B')
+    else:
+      fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+      try:
+        os.ftruncate(fd, size)
+        self.mmap = mmap.mmap(fd, size)
+      finally:
+        os.close(fd)
+      self.buffer = self.mmap
+
+    struct.pack_into(shm.HEADER_FMT, self.buffer, 0, shm.FRAME_READY, 0, 0, 0, 0)
+
+  def writeFrame(self, data, width, height):
+    """Writes a frame if the reader has enabled writing, as LMS does.
+
+    Args:
+      data: A bytes-like object (or NumPy array) with the RGB24 frame data.
+      width: The frame width.
+      height: The frame height.
+
+    Returns:
+      The sequence number of the written frame, or None if the reader still
+      holds the previous frame and this one was skipped.
+    """
+    data = memoryview(data).cast('B')
+    if len(data) > self.maxFrameSize:
+      raise Exception("Frame of {} bytes does not fit in a {} bytes segment".format(*[len(data), self.maxFrameSize]))
+
+    if self.buffer[0] != shm.WRITE_ENABLED:
+      return None
+
+    self.seqNum = (self.seqNum + 1) & 0xffff
+    start = shm.HEADER_SIZE
+    self.buffer[start:start + len(data)] = data
+    struct.pack_into(shm.HEADER_FMT, self.buffer, 0, shm.WRITE_ENABLED, self.seqNum, width, height, len(data))
+    # The sync byte goes last, the reader does not look at the frame before
+    self.buffer[0] = shm.FRAME_READY
+
+    return self.seqNum
+
+  def close(self):
+    self.buffer = None
+    if self.addr != None:
+      shm.detachSysV(self.addr)
+      self.addr = None
+      if self.remove:
+        shm.removeSysV(self.key)
+    if self.mmap != None:
+      self.mmap.close()
+      self.mmap = None
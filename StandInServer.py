@@ -0,0 +1,178 @@
+"""
+StandInServer.py - Local stand-in for a LMS instance, used to benchmark
+                   the available transports
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+
+Usage:
+  python -m LMSPythonManager.StandInServer [COUNT]
+
+It benchmarks COUNT getState round trips over TCP and over a Unix socket.
+"""
+
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+from . import LMSManager
+from . import Transport
+
+class StandInHandler(socketserver.BaseRequestHandler):
+  def handle(self):
+    data = b''
+    while True:
+      chunk = self.request.recv(65536)
+      if not chunk:
+        return
+      data += chunk
+      try:
+        req = json.loads(data.decode())
+        break
+      except ValueError:
+        continue
+
+    # Events are handled in order and a batch stops at the first error, as LMS does
+    res = None
+    error = None
+    with self.server.lock:
+      for event in req.get('events', []):
+        ret = self.server.state.handle(event)
+        if isinstance(ret, str):
+          error = ret
+          break
+        if ret != None:
+          res = ret
+
+    out = dict(res or {})
+    out['error'] = error
+    self.request.sendall(json.dumps(out).encode())
+
+class IdleState:
+  def __init__(self, filters):
+    self.state = {'filters': [{'id': i, 'type': 'videoResampler'} for i in range(filters)],
+                  'paths': []}
+
+  def handle(self, event):
+    """Returns the result of an event, a dictionary, None or an error message."""
+    if event.get('action') == 'getState':
+      return self.state
+
+    return None
+
+class StandInTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+  allow_reuse_address = True
+  daemon_threads = True
+
+class StandInUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+class StandInServer:
+  def __init__(self, address, filters = 10, state = None):
+    """StandInServer constructor
+
+    It listens to the given address and answers every request as an idle LMS
+    would: getState returns a fixed state and any other event succeeds.
+
+    Args:
+      address: An URL-style address as accepted by LMSManager. Use port 0 to
+      get a free TCP port.
+      filters: The number of filters of the returned state. Optional parameter.
+      state: An object whose handle(event) method returns the result of each
+      event, a dictionary, None or an error message. It replaces the idle state,
+      e.g. to emulate filters and paths in tests. Optional parameter.
+    """
+    transport = Transport.createTransport(address)
+    if isinstance(transport, Transport.UnixTransport):
+      if os.path.exists(transport.path):
+        os.unlink(transport.path)
+      self.server = StandInUnixServer(transport.path, StandInHandler)
+      self.address = address
+    else:
+      self.server = StandInTCPServer(transport.getAddress(), StandInHandler)
+      # Keep the transport options, with the actual port when 0 was given
+      self.address = 'tcp://{}:{}'.format(*self.server.server_address[:2])
+      if '?' in address:
+        self.address += address[address.index('?'):]
+
+    self.server.state = state if state != None else IdleState(filters)
+    self.server.lock = threading.Lock()
+    self.thread = None
+
+  def start(self):
+    self.thread = threading.Thread(target = self.server.serve_forever, name = 'StandInServer')
+    self.thread.daemon = True
+    self.thread.start()
+    return self.address
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+    if isinstance(self.server, StandInUnixServer) and os.path.exists(self.server.server_address):
+      os.unlink(self.server.server_address)
+
+def benchmark(address, count = 1000):
+  """Measures getState round trips against the given address.
+
+  Returns:
+    A dictionary with the mean, median and 99th percentile latencies in microseconds.
+  """
+  lms = LMSManager.LMSManager(address)
+  eJson = {'events': [{'action': 'getState', 'params': {}}]}
+  samples = []
+  for i in range(count):
+    start = time.perf_counter()
+    lms.sendEvents(eJson)
+    samples.append((time.perf_counter() - start) * 1e6)
+
+  samples.sort()
+  return {'mean': sum(samples) / count,
+          'p50': samples[count // 2],
+          'p99': samples[min(int(count * 0.99), count - 1)]}
+
+def main(argv = None):
+  if argv == None:
+    argv = sys.argv[1:]
+  count = int(argv[0]) if argv else 1000
+
+  # sendEvents echoes every request, keep the report readable
+  stdout = sys.stdout
+  devnull = open(os.devnull, 'w')
+  addresses = ['tcp://127.0.0.1:0?nodelay=0', 'tcp://127.0.0.1:0?nodelay=1',
+               'unix://' + os.path.join(tempfile.gettempdir(), 'lms-standin.sock')]
+  try:
+    for address in addresses:
+      server = StandInServer(address)
+      sys.stdout = devnull
+      try:
+        res = benchmark(server.start(), count)
+      finally:
+        sys.stdout = stdout
+        server.stop()
+      print('{:<40} mean {:8.1f}us  p50 {:8.1f}us  p99 {:8.1f}us'.format(*[address, res['mean'],
+                                                                         res['p50'], res['p99']]))
+  finally:
+    devnull.close()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,292 @@
+"""
+StateHistory.py - Columnar history of the numeric fields of the LMS state
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import csv
+import logging
+import math
+import threading
+import time
+from array import array
+
+NAN = float('nan')
+
+# Global columns, always present
+TIME = 'time'
+TOTALS = ['filters', 'paths', 'channels', 'sessions']
+
+def flattenState(state):
+  """Extracts the numeric fields of a getState snapshot.
+
+  Returns:
+    A dictionary mapping column names to floats. Filter fields are named
+    '<filterId>.<field>', nested channels and sessions are counted as
+    '<filterId>.channels' and '<filterId>.sessions'. Non numeric fields are
+    ignored.
+  """
+  values = dict((name, 0.0) for name in TOTALS)
+  if not state:
+    return values
+
+  filters = state.get('filters', [])
+  values['filters'] = float(len(filters))
+  values['paths'] = float(len(state.get('paths', [])))
+
+  for cFilter in filters:
+    prefix = '{}.'.format(*[cFilter['id']])
+    for key, value in cFilter.items():
+      if key == 'id':
+        continue
+      if key in ('channels', 'sessions') and isinstance(value, list):
+        values[key] += len(value)
+        values[prefix + key] = float(len(value))
+      elif isinstance(value, (int, float)):
+        values[prefix + key] = float(value)
+
+  return values
+
+def columnFilter(name):
+  if '.' not in name:
+    return None
+  return int(name.split('.', 1)[0])
+
+class StateHistory:
+  DEF_INTERVAL = 60
+  DEF_CAPACITY = 10080
+  DEF_MAX_COLUMNS = 256
+
+  def __init__(self, lms, interval = DEF_INTERVAL, capacity = DEF_CAPACITY,
+               maxColumns = DEF_MAX_COLUMNS, downsample = 1):
+    """StateHistory constructor
+
+    It samples LMSManager.pollState periodically and keeps the numeric fields
+    in fixed size ring buffers of doubles, one per column, so memory is bounded
+    by capacity * (maxColumns + 1) * 8 bytes whatever the uptime. Filters not
+    present in a sample are stored as NaN.
+
+    Args:
+      lms: The LMSManager to sample.
+      interval: The sampling interval in seconds. Optional parameter.
+      capacity: The number of rows kept, older rows are overwritten. By default
+      a week of samples, one per minute. Optional parameter.
+      maxColumns: The maximum number of columns besides time. Once reached,
+      columns holding only NaN, i.e. of filters gone for a whole ring, are
+      reclaimed, and fields of new filters are dropped if there are none.
+      Optional parameter.
+      downsample: The number of samples averaged into each stored row.
+      Optional parameter.
+    """
+    self.lms = lms
+    self.interval = interval
+    self.capacity = capacity
+    self.maxColumns = maxColumns
+    self.downsample = max(1, downsample)
+    self.lock = threading.Lock()
+    self.columns = {TIME: array('d', [NAN]) * capacity}
+    self.names = [TIME]
+    self.head = 0
+    self.size = 0
+    self.pending = {}
+    self.pendingCount = 0
+    self.dropped = set()
+    self.thread = None
+    self.stopEvent = threading.Event()
+
+  def getColumnNames(self):
+    return list(self.names)
+
+  def addColumn(self, name, row):
+    column = None
+    if len(self.names) > self.maxColumns:
+      column = self.reclaimColumn(row)
+      if column == None:
+        if not self.dropped:
+          logging.warning("History column limit reached, new columns are dropped")
+        self.dropped.add(name)
+        return False
+
+    if column == None:
+      column = array('d', [NAN]) * self.capacity
+    self.columns[name] = column
+    self.names.append(name)
+    self.dropped.discard(name)
+    return True
+
+  def reclaimColumn(self, row):
+    # Called with the lock held. An all NaN column is already blank, so it is reused as is.
+    # Columns of the row being appended are still all NaN but must be kept.
+    for name in self.names[1:]:
+      column = self.columns[name]
+      if name not in row and all(math.isnan(value) for value in column):
+        del self.columns[name]
+        self.names.remove(name)
+        return column
+
+    return None
+
+  def append(self, timestamp, values):
+    """Stores a row. Columns missing from values get NaN."""
+    with self.lock:
+      for name in values:
+        if name not in self.columns:
+          self.addColumn(name, values)
+
+      for name, column in self.columns.items():
+        column[self.head] = values.get(name, NAN)
+      self.columns[TIME][self.head] = timestamp
+
+      self.head = (self.head + 1) % self.capacity
+      self.size = min(self.size + 1, self.capacity)
+
+  def sample(self, state = None, timestamp = None):
+    """Records a sample of the given state, or of a freshly polled one.
+
+    When downsampling, the sample is accumulated and a row holding the mean of
+    each column is stored every downsample samples.
+
+    Returns:
+      True if a row was stored.
+    """
+    if state == None:
+      state = self.lms.pollState()
+      if state == None:
+        return False
+    if timestamp == None:
+      timestamp = time.time()
+
+    values = flattenState(state)
+    if self.downsample == 1:
+      self.append(timestamp, values)
+      return True
+
+    for name, value in values.items():
+      total, count = self.pending.get(name, (0.0, 0))
+      self.pending[name] = (total + value, count + 1)
+    self.pendingCount += 1
+    if self.pendingCount < self.downsample:
+      return False
+
+    means = dict((name, total / count) for name, (total, count) in self.pending.items())
+    self.pending = {}
+    self.pendingCount = 0
+    self.append(timestamp, means)
+    return True
+
+  def start(self):
+    """Starts sampling in a background thread."""
+    if self.thread != None:
+      return
+
+    self.stopEvent = threading.Event()
+    self.thread = threading.Thread(target = self.run, args = (self.stopEvent,), name = 'StateHistory')
+    self.thread.daemon = True
+    self.thread.start()
+
+  def stop(self):
+    self.stopEvent.set()
+    self.thread = None
+
+  def run(self, stopEvent):
+    while not stopEvent.is_set():
+      try:
+        self.sample()
+      except Exception as e:
+        logging.error("Error sampling state: " + str(e))
+      stopEvent.wait(self.interval)
+
+  def getRows(self, start = None, end = None):
+    """Returns the ring indexes of the stored rows, oldest first, within [start, end)."""
+    first = (self.head - self.size) % self.capacity
+    rows = [(first + i) % self.capacity for i in range(self.size)]
+    if start == None and end == None:
+      return rows
+
+    times = self.columns[TIME]
+    return [i for i in rows if (start == None or times[i] >= start) and
+                               (end == None or times[i] < end)]
+
+  def selectColumns(self, filterId = None, fields = None):
+    names = []
+    for name in self.names[1:]:
+      if filterId != None and columnFilter(name) != filterId:
+        continue
+      if fields != None and name.split('.')[-1] not in fields:
+        continue
+      names.append(name)
+
+    return names
+
+  def query(self, start = None, end = None, filterId = None, fields = None):
+    """Queries the history.
+
+    Args:
+      start: The first timestamp, inclusive. Optional parameter.
+      end: The last timestamp, exclusive. Optional parameter.
+      filterId: Only return the columns of this filter. Optional parameter.
+      fields: Only return these fields, e.g. ['bitrate', 'channels'] or
+      ['filters']. Optional parameter.
+
+    Returns:
+      A dictionary mapping column names, 'time' included, to arrays of values
+      in chronological order.
+    """
+    with self.lock:
+      rows = self.getRows(start, end)
+      res = {}
+      for name in [TIME] + self.selectColumns(filterId, fields):
+        column = self.columns[name]
+        res[name] = array('d', (column[i] for i in rows))
+
+    return res
+
+  def toNumpy(self, start = None, end = None, filterId = None, fields = None):
+    """Exports the history as NumPy arrays.
+
+    Returns:
+      A tuple with the list of column names and a 2D float64 array with one
+      row per sample and one column per name.
+    """
+    import numpy
+
+    res = self.query(start, end, filterId, fields)
+    names = list(res)
+    data = numpy.empty((len(res[TIME]), len(names)))
+    for j, name in enumerate(names):
+      data[:, j] = numpy.frombuffer(res[name], dtype = numpy.float64)
+
+    return names, data
+
+  def toCSV(self, fileobj, start = None, end = None, filterId = None, fields = None):
+    """Writes the history as CSV to the given file object or path.
+
+    NaN values are written as empty cells.
+    """
+    if isinstance(fileobj, str):
+      with open(fileobj, 'w', newline = '') as f:
+        return self.toCSV(f, start, end, filterId, fields)
+
+    res = self.query(start, end, filterId, fields)
+    names = list(res)
+    writer = csv.writer(fileobj)
+    writer.writerow(names)
+    for row in zip(*[res[name] for name in names]):
+      writer.writerow(['' if math.isnan(v) else repr(v) for v in row])
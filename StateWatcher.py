@@ -0,0 +1,226 @@
+"""
+StateWatcher.py - Polls the state of a LMS instance and streams the
+                  differences between successive snapshots
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+
+# Filter fields holding nested records, diffed on their own
+NESTED = {'channels': 'channel', 'sessions': 'session'}
+
+def indexState(state):
+  """Indexes a getState snapshot by record key.
+
+  Returns:
+    A dictionary mapping (kind, id) or (kind, filterId, id) keys to records.
+    Filter records do not include their nested channels and sessions.
+  """
+  records = {}
+  if not state:
+    return records
+
+  for cFilter in state.get('filters', []):
+    fId = cFilter['id']
+    flat = {}
+    for key, value in cFilter.items():
+      if key in NESTED:
+        for record in value:
+          records[(NESTED[key], fId, record['id'])] = record
+      else:
+        flat[key] = value
+    records[('filter', fId)] = flat
+
+  for cPath in state.get('paths', []):
+    records[('path', cPath['id'])] = cPath
+
+  return records
+
+def makeChange(change, key, changes = None):
+  res = {'type': change, 'kind': key[0], 'id': key[-1]}
+  if len(key) == 3:
+    res['filterId'] = key[1]
+  if changes != None:
+    res['changes'] = changes
+
+  return res
+
+def diffRecords(old, new):
+  """Computes the changes between two indexed snapshots.
+
+  Only records whose value differs are compared field by field, unchanged
+  records cost a single dictionary comparison.
+
+  Returns:
+    A list of changes with the following pattern:
+
+      {'type': 'added'|'removed'|'changed', 'kind': 'filter'|'path'|'channel'|'session',
+       'id': 3, 'filterId': 4, 'changes': {'status': ['connecting', 'capture']}}
+
+    filterId is only present for channels and sessions, changes only for changed records.
+  """
+  changes = []
+  for key, record in new.items():
+    oldRecord = old.get(key)
+    if oldRecord == None:
+      changes.append(makeChange('added', key, dict((f, [None, v]) for f, v in record.items())))
+    elif oldRecord != record:
+      fields = {}
+      for field in set(oldRecord) | set(record):
+        if oldRecord.get(field) != record.get(field):
+          fields[field] = [oldRecord.get(field), record.get(field)]
+      changes.append(makeChange('changed', key, fields))
+
+  for key in old:
+    if key not in new:
+      changes.append(makeChange('removed', key))
+
+  return changes
+
+class StateWatcher:
+  DEF_INTERVAL = 1
+
+  def __init__(self, lms, interval = DEF_INTERVAL):
+    """StateWatcher constructor
+
+    It polls LMSManager.pollState every interval seconds from a single thread
+    and hands the differences to all the subscribers, so many consumers share
+    one poll. The thread runs only while there are subscribers.
+
+    Args:
+      lms: The LMSManager to poll.
+      interval: The polling interval in seconds. Optional parameter.
+    """
+    self.lms = lms
+    self.interval = interval
+    self.lock = threading.Lock()
+    self.pollLock = threading.Lock()
+    self.subscribers = []
+    self.thread = None
+    self.stopEvent = threading.Event()
+    self.state = None
+    self.records = {}
+
+  def subscribe(self):
+    """Registers a new subscriber.
+
+    Returns:
+      A queue receiving lists of changes. If a snapshot is already known, the
+      first list describes it as added records.
+    """
+    q = queue.Queue()
+    with self.lock:
+      if self.records:
+        q.put(diffRecords({}, self.records))
+      self.subscribers.append(q)
+      if self.thread == None:
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target = self.run, args = (self.stopEvent,), 
+                                       name = 'StateWatcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    return q
+
+  def unsubscribe(self, q):
+    thread = None
+    with self.lock:
+      if q in self.subscribers:
+        self.subscribers.remove(q)
+      if not self.subscribers and self.thread != None:
+        self.stopEvent.set()
+        thread = self.thread
+        self.thread = None
+
+    # Joined without the lock, as the thread takes it to publish
+    if thread != None and thread != threading.current_thread():
+      thread.join()
+
+  def poll(self):
+    """Polls the state once and publishes the changes, if any.
+
+    Polls are serialized, so each snapshot is diffed against the previous one
+    exactly once.
+
+    Returns:
+      The list of changes.
+    """
+    with self.pollLock:
+      state = self.lms.pollState()
+      if state == None or state == self.state:
+        return []
+
+      records = indexState(state)
+      changes = diffRecords(self.records, records)
+      self.state = state
+      self.records = records
+
+      if changes:
+        with self.lock:
+          for q in self.subscribers:
+            q.put(changes)
+
+    return changes
+
+  def run(self, stopEvent):
+    while not stopEvent.is_set():
+      try:
+        self.poll()
+      except Exception as e:
+        logging.error("Error polling state: " + str(e))
+      stopEvent.wait(self.interval)
+
+  def watch(self, timeout = None):
+    """Generator yielding the changes of the watched state.
+
+    Args:
+      timeout: If no change arrives within timeout seconds the generator ends.
+      Wait forever if None. Optional parameter.
+    """
+    q = self.subscribe()
+    try:
+      while True:
+        try:
+          changes = q.get(timeout = timeout)
+        except queue.Empty:
+          return
+        for change in changes:
+          yield change
+    finally:
+      self.unsubscribe(q)
+
+  async def awatch(self):
+    """Async iterator yielding the changes of the watched state."""
+    q = self.subscribe()
+    loop = asyncio.get_running_loop()
+    try:
+      while True:
+        try:
+          changes = await loop.run_in_executor(None, q.get, True, self.interval)
+        except queue.Empty:
+          continue
+        for change in changes:
+          yield change
+    finally:
+      self.unsubscribe(q)
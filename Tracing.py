@@ -0,0 +1,190 @@
+"""
+Tracing.py - Opt-in tracing of manager operations, exported as Chrome trace events
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+
+Usage:
+  tracer = Tracing.enable(sampleRate = 0.1)
+  ...
+  tracer.export('/tmp/lms-trace.json')
+  Tracing.disable()
+
+The exported file can be opened with chrome://tracing or Perfetto.
+"""
+
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+# The active Tracer, None while tracing is disabled
+tracer = None
+
+class Span:
+  __slots__ = ('name', 'cat', 'args', 'start', 'sampled')
+
+  def __init__(self, name, cat, args, sampled):
+    self.name = name
+    self.cat = cat
+    self.args = args
+    self.sampled = sampled
+    self.start = time.perf_counter()
+
+class Tracer:
+  DEF_MAX_EVENTS = 100000
+
+  def __init__(self, sampleRate = 1.0, maxEvents = DEF_MAX_EVENTS):
+    """Tracer constructor
+
+    Spans are recorded as Chrome trace complete events, nested by time within
+    each thread. Sampling is decided on root spans, so a sampled operation
+    keeps all its children and a discarded one costs no recording at all.
+
+    Args:
+      sampleRate: The fraction of root spans recorded, from 0 to 1. Optional parameter.
+      maxEvents: The maximum number of events kept, later ones are dropped.
+      Optional parameter.
+    """
+    self.sampleRate = sampleRate
+    self.maxEvents = maxEvents
+    self.lock = threading.Lock()
+    self.local = threading.local()
+    self.events = []
+    self.dropped = 0
+    self.pid = os.getpid()
+
+  def begin(self, name, cat, args):
+    stack = getattr(self.local, 'stack', None)
+    if stack == None:
+      stack = self.local.stack = []
+
+    if stack:
+      sampled = stack[-1].sampled
+    else:
+      sampled = self.sampleRate >= 1 or random.random() < self.sampleRate
+
+    span = Span(name, cat, args, sampled)
+    stack.append(span)
+    return span
+
+  def end(self, span, args):
+    end = time.perf_counter()
+    # The span may come from another Tracer, e.g. if tracing was enabled again
+    # meanwhile. It is not recorded and the open spans of this one are kept.
+    stack = getattr(self.local, 'stack', [])
+    if not any(cSpan is span for cSpan in stack):
+      return
+    while stack.pop() is not span:
+      pass
+
+    if not span.sampled:
+      return
+    if args:
+      span.args.update(args)
+
+    event = {'name': span.name, 'cat': span.cat, 'ph': 'X',
+             'ts': span.start * 1e6, 'dur': (end - span.start) * 1e6,
+             'pid': self.pid, 'tid': threading.get_ident(), 'args': span.args}
+    with self.lock:
+      if len(self.events) < self.maxEvents:
+        self.events.append(event)
+      else:
+        self.dropped += 1
+
+  def getEvents(self):
+    with self.lock:
+      return list(self.events)
+
+  def clear(self):
+    with self.lock:
+      self.events = []
+      self.dropped = 0
+
+  def export(self, fileobj):
+    """Writes the recorded spans as Chrome trace-event JSON to a file object or path."""
+    if isinstance(fileobj, str):
+      with open(fileobj, 'w') as f:
+        return self.export(f)
+
+    trace = {'traceEvents': self.getEvents(), 'displayTimeUnit': 'ms',
+             'otherData': {'sampleRate': self.sampleRate, 'dropped': self.dropped}}
+    json.dump(trace, fileobj)
+
+def enable(sampleRate = 1.0, maxEvents = Tracer.DEF_MAX_EVENTS):
+  """Enables tracing process wide.
+
+  Returns:
+    The new active Tracer.
+  """
+  global tracer
+  tracer = Tracer(sampleRate, maxEvents)
+  return tracer
+
+def disable():
+  """Disables tracing.
+
+  Returns:
+    The Tracer that was active, if any, so its spans can still be exported.
+  """
+  global tracer
+  res = tracer
+  tracer = None
+  return res
+
+def begin(name, cat = 'call', **args):
+  """Opens a span. Returns None, at the cost of a single check, if tracing is disabled."""
+  t = tracer
+  if t == None:
+    return None
+  return t.begin(name, cat, args)
+
+def end(span, **args):
+  """Closes a span opened with begin, adding the given args to it."""
+  if span == None:
+    return
+  t = tracer
+  if t != None:
+    t.end(span, args)
+
+def traced(func):
+  """Decorator recording a span for each call of the decorated method."""
+  name = func.__qualname__
+
+  @functools.wraps(func)
+  def wrapper(*args, **kwargs):
+    if tracer == None:
+      return func(*args, **kwargs)
+
+    span = begin(name)
+    error = None
+    try:
+      return func(*args, **kwargs)
+    except Exception as e:
+      error = str(e)
+      raise
+    finally:
+      if error != None:
+        end(span, error = error)
+      else:
+        end(span)
+
+  return wrapper
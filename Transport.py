@@ -0,0 +1,136 @@
+"""
+Transport.py - Socket transports used to reach a LMS instance
+
+Copyright (C) 2016  Fundació i2CAT, Internet i Innovació digital a Catalunya
+
+This file is part of media-streamer.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Authors: David Cassany <david.cassany@i2cat.net>
+"""
+
+import socket
+from urllib.parse import urlsplit, parse_qs
+
+def parseFlag(value):
+  return value.lower() in ('1', 'true', 'yes', 'on')
+
+class TCPTransport:
+  def __init__(self, host, port, nodelay = True, keepalive = False, sndbuf = None, rcvbuf = None):
+    """TCPTransport constructor
+
+    Args:
+      host: The host in which the LiveMediaStreamer is running.
+      port: The port in which the LiveMediaStreamer is listening.
+      nodelay: If True Nagle's algorithm is disabled (TCP_NODELAY), so small
+      requests are not delayed. Enabled by default. Optional parameter.
+      keepalive: If True TCP keepalive probes are enabled. Optional parameter.
+      sndbuf: The socket send buffer size in bytes. Optional parameter.
+      rcvbuf: The socket receive buffer size in bytes. Optional parameter.
+    """
+    self.host = host
+    self.port = port
+    self.nodelay = nodelay
+    self.keepalive = keepalive
+    self.sndbuf = sndbuf
+    self.rcvbuf = rcvbuf
+
+  def createSocket(self):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if self.nodelay:
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if self.keepalive:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if self.sndbuf != None:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+    if self.rcvbuf != None:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+
+    return sock
+
+  def getAddress(self):
+    return (self.host, self.port)
+
+  def __str__(self):
+    return 'tcp://{}:{}'.format(*[self.host, self.port])
+
+class UnixTransport:
+  def __init__(self, path, sndbuf = None, rcvbuf = None):
+    """UnixTransport constructor
+
+    Args:
+      path: The path of the Unix domain socket LiveMediaStreamer listens to.
+      sndbuf: The socket send buffer size in bytes. Optional parameter.
+      rcvbuf: The socket receive buffer size in bytes. Optional parameter.
+    """
+    self.path = path
+    self.sndbuf = sndbuf
+    self.rcvbuf = rcvbuf
+
+  def createSocket(self):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if self.sndbuf != None:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+    if self.rcvbuf != None:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+
+    return sock
+
+  def getAddress(self):
+    return self.path
+
+  def __str__(self):
+    return 'unix://{}'.format(*[self.path])
+
+def createTransport(address, port = None):
+  """Creates the transport for the given address.
+
+  Args:
+    address: Either a host name, used together with port, or an URL-style address:
+
+      tcp://host:port?nodelay=1&keepalive=1&sndbuf=65536&rcvbuf=65536
+      unix:///path/to/lms.sock?sndbuf=65536
+
+    port: The TCP port, only used when address is a plain host name.
+
+  Returns:
+    A TCPTransport or a UnixTransport.
+
+  Raises:
+    Exception: In case of an invalid address raises an Exception.
+  """
+  if '://' not in address:
+    return TCPTransport(address, port)
+
+  url = urlsplit(address)
+  params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+  sndbuf = int(params['sndbuf']) if 'sndbuf' in params else None
+  rcvbuf = int(params['rcvbuf']) if 'rcvbuf' in params else None
+
+  if url.scheme == 'tcp':
+    if not url.hostname or url.port == None:
+      raise Exception("TCP address needs a host and a port: {}".format(*[address]))
+    return TCPTransport(url.hostname, url.port,
+                        parseFlag(params.get('nodelay', '1')),
+                        parseFlag(params.get('keepalive', '0')),
+                        sndbuf, rcvbuf)
+
+  if url.scheme == 'unix':
+    path = url.netloc + url.path
+    if not path:
+      raise Exception("Unix address needs a path: {}".format(*[address]))
+    return UnixTransport(path, sndbuf, rcvbuf)
+
+  raise Exception("Unsupported transport {}".format(*[url.scheme]))
@@ -0,0 +1,16 @@
+import pytest
+
+import lmstest
+
+@pytest.fixture
+def lms():
+  server = lmstest.FakeLMS()
+  yield server
+  server.close()
+
+@pytest.fixture(autouse = True)
+def fastNegotiation(monkeypatch):
+  # Negotiations poll every second, the fake LMS answers at once
+  Deadline = lmstest.load('Deadline')
+  sleep = Deadline.Deadline.sleep
+  monkeypatch.setattr(Deadline.Deadline, 'sleep', lambda self, seconds: sleep(self, min(seconds, 0.01)))
@@ -0,0 +1,151 @@
+"""
+lmstest.py - Helpers shared by the test suite: package loading and an in-memory LMS
+"""
+
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(ROOT))
+PACKAGE = os.path.basename(ROOT)
+
+def load(name):
+  """Imports a module of the package under test."""
+  return importlib.import_module(PACKAGE + '.' + name)
+
+StandInServer = load('StandInServer')
+
+class FakeState:
+  def __init__(self):
+    self.filters = {}
+    self.paths = {}
+    self.nextPort = 5000
+    self.nextMemoryId = 1000
+    self.log = []
+    self.negotiate = True
+
+  def getActions(self, action):
+    return [event for event in self.log if event['action'] == action]
+
+  def handle(self, event):
+    action = event['action']
+    params = event.get('params', {})
+    self.log.append(event)
+
+    if action == 'getState':
+      return {'filters': [dict(f) for f in self.filters.values()], 'paths': list(self.paths.values())}
+    if action == 'stop':
+      self.filters.clear()
+      self.paths.clear()
+      return None
+    if action == 'createFilter':
+      return self.createFilter(params)
+    if action == 'removeFilter':
+      self.filters.pop(params['id'], None)
+      return None
+    if action == 'createPath':
+      return self.createPath(params)
+    if action == 'removePath':
+      return self.removePath(params)
+
+    cFilter = self.filters.get(event.get('filterId'))
+    if cFilter == None:
+      return 'no filter {}'.format(event.get('filterId'))
+    if action == 'configure':
+      for key, value in params.items():
+        if key in ('width', 'height', 'fps', 'bitrate', 'gop', 'device'):
+          cFilter[key] = value
+      return None
+    if action == 'addSession':
+      if any(session['id'] == params['id'] for session in cFilter['sessions']):
+        return 'session exists {}'.format(params['id'])
+      subsessions = []
+      if self.negotiate:
+        self.nextPort += 2
+        subsessions = [{'port': self.nextPort}]
+      cFilter['sessions'].append({'id': params['id'], 'uri': params['uri'], 'subsessions': subsessions})
+      return None
+    if action == 'removeSession':
+      cFilter['sessions'] = [s for s in cFilter['sessions'] if s['id'] != params['id']]
+      return None
+    if action == 'addRTSPConnection':
+      connections = cFilter.setdefault('connections', [])
+      if any(c['id'] == params['id'] or c['name'] == params['name'] for c in connections):
+        return 'connection exists {}'.format(params['id'])
+      connections.append({'id': params['id'], 'name': params['name']})
+      return None
+    if action == 'removeRTSPConnection':
+      cFilter['connections'] = [c for c in cFilter.get('connections', []) if c['id'] != params['id']]
+      return None
+    if action == 'configChannel':
+      for channel in cFilter['channels']:
+        if channel['id'] == params['id']:
+          channel.update(params)
+      return None
+
+    return None
+
+  def createFilter(self, params):
+    if params['id'] in self.filters:
+      return 'filter exists {}'.format(params['id'])
+    if params['type'] == 'transmitter' and any(f['type'] == 'transmitter' for f in self.filters.values()):
+      # A single RTSP server can listen to the RTSP port
+      return 'RTSP port already in use'
+
+    cFilter = {'id': params['id'], 'type': params['type']}
+    if params['type'] == 'videoMixer':
+      cFilter.update(channels = [], width = 1280, height = 720)
+    elif params['type'] == 'receiver':
+      cFilter['sessions'] = []
+    elif params['type'] == 'sharedMemory':
+      self.nextMemoryId += 1
+      cFilter['memoryId'] = self.nextMemoryId
+    elif params['type'] == 'v4lcapture':
+      cFilter['status'] = 'capture'
+    self.filters[params['id']] = cFilter
+    return None
+
+  def createPath(self, params):
+    if params['id'] in self.paths:
+      return 'path exists {}'.format(params['id'])
+    for fId in [params['orgFilterId'], params['dstFilterId']] + params['midFiltersIds']:
+      if fId not in self.filters:
+        return 'no filter {}'.format(fId)
+
+    self.paths[params['id']] = {'id': params['id'], 
+                                'originFilter': params['orgFilterId'],
+                                'destinationFilter': params['dstFilterId'],
+                                'originWriter': params['orgWriterId'],
+                                'destinationReader': params['dstReaderId'],
+                                'filters': params['midFiltersIds']}
+    dst = self.filters[params['dstFilterId']]
+    if dst['type'] == 'videoMixer':
+      dst['channels'].append({'id': params['dstReaderId'], 'enabled': True})
+    return None
+
+  def removePath(self, params):
+    path = self.paths.pop(params['id'], None)
+    if path == None:
+      return None
+
+    dst = self.filters.get(path['destinationFilter'])
+    if dst != None and dst['type'] == 'videoMixer':
+      dst['channels'] = [c for c in dst['channels'] if c['id'] != path['destinationReader']]
+    for fId in path['filters']:
+      if not any(fId in p['filters'] for p in self.paths.values()):
+        self.filters.pop(fId, None)
+    return None
+
+class FakeLMS(StandInServer.StandInServer):
+  """LMS stand-in keeping filters, paths, mixer channels and receiver sessions."""
+  def __init__(self, address = 'tcp://127.0.0.1:0'):
+    StandInServer.StandInServer.__init__(self, address, state = FakeState())
+    self.state = self.server.state
+    self.start()
+    self.port = None
+    if not isinstance(self.server, StandInServer.StandInUnixServer):
+      self.port = self.server.server_address[1]
+
+  def close(self):
+    self.stop()
@@ -0,0 +1,79 @@
+import time
+
+from lmstest import load
+
+SecurityManager = load('SecurityManager')
+CameraTour = load('CameraTour')
+
+def newManager(lms, count):
+  manager = SecurityManager.SecurityManager('127.0.0.1', lms.port)
+  manager.startPipe()
+  channels = [manager.addRTSPSource('rtsp://cam{}/stream'.format(*[i])) for i in range(count)]
+  return manager, channels
+
+def recordSwitches(tour):
+  times = []
+  switch = tour.switch
+  def record(step):
+    times.append((time.monotonic(), step))
+    return switch(step)
+  tour.switch = record
+  return times
+
+def waitFor(condition, timeout = 2):
+  end = time.monotonic() + timeout
+  while not condition() and time.monotonic() < end:
+    time.sleep(0.01)
+  return condition()
+
+def test_dwell_of_each_step(lms):
+  manager, channels = newManager(lms, 2)
+  tour = CameraTour.CameraTour(manager, dwell = [0.1, 0.6])
+  times = recordSwitches(tour)
+  tour.start()
+  try:
+    assert waitFor(lambda: len(times) >= 2)
+  finally:
+    tour.stop()
+
+  assert [step for t, step in times[:2]] == [0, 1]
+  assert times[1][0] - times[0][0] < 0.4
+  assert manager.visibleChannels['output'] == channels[1]
+
+  stats = tour.getStats()
+  assert stats['switches'] == len(times)
+  assert 0 <= stats['meanJitter'] <= stats['maxJitter']
+
+def test_only_operator_commutes_pause(lms):
+  manager, channels = newManager(lms, 2)
+  tour = CameraTour.CameraTour(manager, dwell = 10)
+  tour.start()
+  try:
+    manager.addRTSPSource('rtsp://cam9/stream')
+    manager.resetPipe()
+    assert not tour.paused
+
+    manager.commuteChannel(channels[0])
+    assert tour.paused
+    assert manager.visibleChannels['output'] == channels[0]
+  finally:
+    tour.stop()
+
+def test_stall_skips_missed_steps(lms):
+  manager, channels = newManager(lms, 3)
+  tour = CameraTour.CameraTour(manager, dwell = 0.2)
+  times = recordSwitches(tour)
+  tour.start()
+  try:
+    assert waitFor(lambda: len(times) >= 1)
+    with manager.lock:
+      time.sleep(1)
+    count = len(times)
+    assert waitFor(lambda: len(times) >= count + 2)
+  finally:
+    tour.stop()
+
+  # A single late switch after the stall, then the regular cadence
+  assert times[count][0] - times[count - 1][0] > 0.1
+  assert times[count + 1][0] - times[count][0] > 0.1
+  assert tour.getStats()['skipped'] >= 3
@@ -0,0 +1,61 @@
+from lmstest import load
+
+ChannelRegistry = load('ChannelRegistry')
+
+def newEntry(channel, source, port, decoderId):
+  return {'channel': channel, 'source': source, 'kind': 'rtsp', 'sessionId': source.split('/')[-1],
+          'port': port, 'inputFilterId': 1, 'decoderId': decoderId, 'srcPathId': channel,
+          'outputs': {'output': {'resamplerId': decoderId + 1, 'pathId': channel + 100}}}
+
+def test_lookups():
+  registry = ChannelRegistry.ChannelRegistry()
+  registry.register(newEntry(3, 'rtsp://cam1/stream1', 5004, 14))
+  registry.register(newEntry(4, 'rtsp://cam1/stream1', 5004, 14))
+  registry.register(newEntry(5, 'rtsp://cam2/stream2', 5006, 16))
+
+  assert registry.getChannels() == [3, 4, 5]
+  assert registry.getChannelsBySource('rtsp://cam1/stream1') == [3, 4]
+  assert registry.getChannelsByPort(5006) == [5]
+  assert registry.getSessionByPort(5006) == 'stream2'
+  assert registry.getChannelsByFilter(17) == [5]
+  assert registry.getChannelsByPath(105) == [5]
+
+def test_unregister_cleans_indexes():
+  registry = ChannelRegistry.ChannelRegistry()
+  registry.register(newEntry(3, 'rtsp://cam1/stream1', 5004, 14))
+  registry.register(newEntry(4, 'rtsp://cam1/stream1', 5004, 14))
+
+  assert registry.unregister(3)['channel'] == 3
+  assert registry.getChannelsBySource('rtsp://cam1/stream1') == [4]
+  assert registry.unregister(4) != None
+  assert registry.getChannelsBySource('rtsp://cam1/stream1') == []
+  assert registry.getChannelsByFilter(14) == []
+  assert registry.getChannelsByPath(103) == []
+  assert registry.unregister(4) == None
+
+def test_register_replaces_entry():
+  registry = ChannelRegistry.ChannelRegistry()
+  registry.register(newEntry(3, 'rtsp://cam1/stream1', 5004, 14))
+  registry.register(newEntry(3, 'rtsp://cam2/stream2', 5006, 16))
+
+  assert registry.getChannelsBySource('rtsp://cam1/stream1') == []
+  assert registry.getChannelsByFilter(14) == []
+  assert registry.getSource(3) == 'rtsp://cam2/stream2'
+
+def test_shared_decoder():
+  registry = ChannelRegistry.ChannelRegistry()
+  first = newEntry(3, 'rtsp://cam1/stream1', 5004, 14)
+  second = newEntry(4, 'rtsp://cam1/stream1', 5004, 14)
+  second['srcPathId'] = first['srcPathId']
+  second['outputs']['output'] = {'resamplerId': 16, 'pathId': 104}
+  registry.register(first)
+  registry.register(second)
+
+  assert registry.getChannelsByFilter(14) == [3, 4]
+  assert registry.getChannelsByPath(3) == [3, 4]
+
+  registry.unregister(4)
+  assert registry.getChannelsByFilter(14) == [3]
+  assert registry.getChannelsByPath(3) == [3]
+  assert registry.getChannelsByFilter(16) == []
+  assert registry.getChannelsByPath(104) == []
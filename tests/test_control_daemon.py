@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from lmstest import load
+
+ControlDaemon = load('ControlDaemon')
+ControlClient = load('ControlClient')
+
+@pytest.fixture
+def daemon(lms, tmp_path):
+  daemon = ControlDaemon.ControlDaemon('127.0.0.1', lms.port, str(tmp_path / 'control.sock'))
+  thread = threading.Thread(target = daemon.serve)
+  thread.daemon = True
+  thread.start()
+  while daemon.server == None:
+    time.sleep(0.01)
+  yield daemon
+  daemon.shutdown()
+  thread.join()
+
+def test_encoder_sends_only_given_params(lms, daemon):
+  client = ControlClient.ControlClient(daemon.socketPath)
+  client.call('start')
+  client.call('encoder', bitrate = 2000)
+
+  params = [e['params'] for e in lms.state.getActions('configure') if e['filterId'] == 3][-1]
+  assert params == {'bitrate': 2000}
+  assert daemon.manager.getOutput().encoderParams == {'bitrate': 2000}
+
+  with pytest.raises(Exception):
+    client.call('encoder', bitrat = 2000)
+
+def test_second_daemon_refuses_live_socket(lms, daemon):
+  other = ControlDaemon.ControlDaemon('127.0.0.1', lms.port, daemon.socketPath)
+  with pytest.raises(Exception, match = 'Another daemon'):
+    other.serve()
+
+  assert ControlClient.ControlClient(daemon.socketPath).call('ping') == 'pong'
+
+def test_stale_socket_is_replaced(lms, tmp_path):
+  import socket
+  path = str(tmp_path / 'stale.sock')
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.bind(path)
+  sock.close()
+
+  daemon = ControlDaemon.ControlDaemon('127.0.0.1', lms.port, path)
+  thread = threading.Thread(target = daemon.serve)
+  thread.daemon = True
+  thread.start()
+  while daemon.server == None:
+    time.sleep(0.01)
+  assert ControlClient.ControlClient(path).call('ping') == 'pong'
+  daemon.shutdown()
+  thread.join()
@@ -0,0 +1,58 @@
+import socket
+import time
+
+import pytest
+
+from lmstest import load
+
+Deadline = load('Deadline')
+LMSManager = load('LMSManager')
+SecurityManager = load('SecurityManager')
+
+def test_deadline_budget():
+  deadline = Deadline.Deadline(0.05)
+  assert not deadline.expired()
+  assert deadline.cap(10) <= 0.05
+  assert deadline.cap(0.01) == 0.01
+
+  time.sleep(0.06)
+  assert deadline.expired()
+  with pytest.raises(Deadline.DeadlineExceededError):
+    deadline.check('test')
+
+def test_unbounded_deadline():
+  deadline = Deadline.toDeadline(None)
+  assert not deadline.expired()
+  assert deadline.cap(3) == 3
+  assert Deadline.toDeadline(deadline) is deadline
+
+def test_exhausted_deadline_skips_the_call(lms):
+  manager = LMSManager.LMSManager('127.0.0.1', lms.port)
+  deadline = Deadline.Deadline(0)
+  with pytest.raises(Deadline.LMSTimeoutError):
+    manager.getState(deadline = deadline)
+  assert lms.state.log == []
+
+def test_hung_server_times_out_on_receive():
+  # Connections are queued by the backlog but nothing is ever answered
+  server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  server.bind(('127.0.0.1', 0))
+  server.listen(1)
+  try:
+    manager = LMSManager.LMSManager('127.0.0.1', server.getsockname()[1], recvTimeout = 0.1)
+    start = time.monotonic()
+    with pytest.raises(Deadline.RecvTimeoutError):
+      manager.getState()
+    assert time.monotonic() - start < 1
+  finally:
+    server.close()
+
+def test_exhausted_deadline_stops_the_negotiation(lms):
+  manager = SecurityManager.SecurityManager('127.0.0.1', lms.port)
+  manager.startPipe()
+
+  lms.state.negotiate = False
+  with pytest.raises(Deadline.DeadlineExceededError):
+    manager.addRTSPSource('rtsp://cam1/stream', deadline = 0.05)
+  assert lms.state.filters[1]['sessions'] == []
+  assert manager.registry.getChannels() == []
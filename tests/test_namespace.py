@@ -0,0 +1,61 @@
+import pytest
+
+from lmstest import load
+
+Namespace = load('Namespace')
+SecurityManager = load('SecurityManager')
+ShardedSecurityManager = load('ShardedSecurityManager')
+
+def test_ranges():
+  a = Namespace.parseNamespace('a:0:100')
+  b = Namespace.parseNamespace('b:100')
+  assert a.getId(1) == 1 and a.contains(100) and not a.contains(101)
+  assert b.size == Namespace.Namespace.DEF_SIZE
+  assert not a.overlaps(b)
+  assert a.overlaps(Namespace.Namespace('c', 50, 100))
+  assert a.overlaps(Namespace.Namespace())
+  with pytest.raises(Exception):
+    a.check(101)
+  with pytest.raises(Exception):
+    Namespace.parseNamespace('a')
+
+def test_namespaces_share_the_transmitter(lms):
+  first = SecurityManager.SecurityManager('127.0.0.1', lms.port, 'a:0:100')
+  second = SecurityManager.SecurityManager('127.0.0.1', lms.port, 'b:100:100')
+  first.startPipe()
+  second.startPipe()
+
+  transmitters = [f['id'] for f in lms.state.filters.values() if f['type'] == 'transmitter']
+  assert transmitters == [2]
+  assert second.transmitterId == 2
+  chnl = second.addRTSPSource('rtsp://cam1/stream')
+
+  # The owner keeps the transmitter while the other namespace publishes through it
+  first.stopPipe()
+  assert lms.state.filters[2]['type'] == 'transmitter'
+  assert all(f['id'] > 100 for f in lms.state.filters.values() if f['id'] != 2)
+
+  adopted = SecurityManager.SecurityManager('127.0.0.1', lms.port, 'b:100:100')
+  adopted.commuteChannel(chnl)
+  assert adopted.transmitterId == 2
+
+  # The stopped namespace leaves no RTSP connection behind, so it can start again
+  assert [c['name'] for c in lms.state.filters[2]['connections']] == ['b-output']
+  first.startPipe()
+  assert [f['id'] for f in lms.state.filters.values() if f['type'] == 'transmitter'] == [2]
+  assert sorted(c['name'] for c in lms.state.filters[2]['connections']) == ['a-output', 'b-output']
+
+  second.stopPipe()
+  first.stopPipe()
+  assert lms.state.filters == {}
+
+def test_sharded_rejects_overlapping_namespaces(lms):
+  sharded = ShardedSecurityManager.ShardedSecurityManager()
+  sharded.addNode('a', '127.0.0.1', lms.port, namespace = 'a:0:100')
+  with pytest.raises(Exception, match = 'overlaps'):
+    sharded.addNode('b', '127.0.0.1', lms.port, namespace = 'b:50:100')
+  with pytest.raises(Exception, match = 'overlaps'):
+    sharded.addNode('c', '127.0.0.1', lms.port)
+
+  sharded.addNode('b', '127.0.0.1', lms.port, namespace = 'b:100:100')
+  assert sorted(sharded.nodes) == ['a', 'b']
@@ -0,0 +1,85 @@
+import pytest
+
+from lmstest import load
+
+SecurityManager = load('SecurityManager')
+
+def newManager(lms):
+  return SecurityManager.SecurityManager('127.0.0.1', lms.port)
+
+def getMixerChannels(lms, mixerId):
+  return sorted(c['id'] for c in lms.state.filters[mixerId]['channels'])
+
+def getEnabled(lms, mixerId):
+  return [c['id'] for c in lms.state.filters[mixerId]['channels'] if c.get('enabled')]
+
+def buildPipe(lms):
+  manager = newManager(lms)
+  manager.startPipe(grid = True)
+  chnl1 = manager.addRTSPSource('rtsp://cam1/stream')
+  chnl2 = manager.addRTSPSource('rtsp://cam2/stream')
+  chnl3 = manager.addRTSPSource('rtsp://CAM1/stream')
+  chnl4 = manager.addRTSPSource('rtsp://cam4/stream')
+  manager.removeInputChannel(chnl2)
+  manager.commuteChannel(chnl3)
+  return manager, [chnl1, chnl3, chnl4]
+
+def checkRestored(lms, manager, channels, report):
+  assert sorted(report['channels']) == channels
+  assert report['failed'] == {}
+  assert report['timeToVideo'] >= report['pipeTime']
+
+  assert manager.grid
+  assert [o.name for o in manager.getOutputs()] == ['output', 'grid']
+  assert manager.registry.getChannels() == channels
+  assert getMixerChannels(lms, 4) == channels
+  assert getMixerChannels(lms, 7) == channels
+  assert getEnabled(lms, 4) == [channels[1]]
+  assert sorted(getEnabled(lms, 7)) == channels
+
+  # The channels of cam1 share one session and one decoder
+  sessions = lms.state.filters[1]['sessions']
+  assert len(sessions) == 2
+  info1 = manager.getChannelInfo(channels[0])
+  info3 = manager.getChannelInfo(channels[1])
+  assert info1['decoderId'] == info3['decoderId']
+  assert info1['sessionId'] == info3['sessionId']
+
+def test_reset_keeps_sources(lms):
+  manager, channels = buildPipe(lms)
+  report = manager.resetPipe()
+  checkRestored(lms, manager, channels, report)
+
+def test_fresh_instance_reset_keeps_sources(lms):
+  manager, channels = buildPipe(lms)
+
+  fresh = newManager(lms)
+  report = fresh.resetPipe()
+  checkRestored(lms, fresh, channels, report)
+
+def test_reset_reports_failed_sources(lms):
+  manager, channels = buildPipe(lms)
+  lms.state.negotiate = False
+
+  report = manager.resetPipe()
+  assert report['channels'] == {}
+  assert sorted(report['failed']) == channels
+  assert all('negotiation' in error for error in report['failed'].values())
+  assert manager.grid
+  assert getMixerChannels(lms, 4) == []
+
+def test_reset_refuses_unknown_sources(lms):
+  manager, channels = buildPipe(lms)
+  lms.state.filters[1]['sessions'] = []
+  filters = dict(lms.state.filters)
+
+  with pytest.raises(Exception, match = 'source is unknown'):
+    newManager(lms).resetPipe()
+  assert sorted(lms.state.filters) == sorted(filters)
+
+def test_reset_without_sources(lms):
+  manager, channels = buildPipe(lms)
+  report = manager.resetPipe(keepSources = False)
+  assert report['channels'] == {}
+  assert getMixerChannels(lms, 4) == []
+  assert manager.grid
@@ -0,0 +1,192 @@
+import threading
+import warnings
+
+import pytest
+
+from lmstest import load
+
+SecurityManager = load('SecurityManager')
+Output = load('Output')
+
+def newManager(lms):
+  return SecurityManager.SecurityManager('127.0.0.1', lms.port)
+
+def test_legacy_ids(lms):
+  manager = newManager(lms)
+  manager.startPipe(grid = True)
+
+  ids = sorted(lms.state.filters)
+  assert ids == list(range(1, 10))
+  assert sorted(lms.state.paths) == [1, 2]
+  assert manager.sharedMemoryId == 9
+
+def test_fresh_instance_adopts_running_pipe(lms):
+  newManager(lms).startPipe(grid = True)
+  first = newManager(lms)
+  chnl1 = first.addRTSPSource('rtsp://cam1/stream')
+  chnl2 = first.addRTSPSource('rtsp://cam2/stream')
+
+  manager = newManager(lms)
+  manager.commuteChannel(chnl1)
+  assert lms.state.getActions('configChannel')[-1]['filterId'] == 4
+  with pytest.raises(Exception):
+    manager.commuteChannel(99)
+
+  assert manager.getSharedMemoryId() == lms.state.filters[9]['memoryId']
+  assert manager.grid
+
+  manager.removeInputChannel(chnl2)
+  assert [c['id'] for c in lms.state.filters[4]['channels']] == [chnl1]
+
+  manager.setOutputFPS(20)
+  assert lms.state.filters[3]['fps'] == 20
+
+def test_fresh_instance_without_pipe_raises(lms):
+  manager = newManager(lms)
+  with pytest.raises(Exception, match = 'pipe ready'):
+    manager.commuteChannel(1)
+  with pytest.raises(Exception, match = 'pipe ready'):
+    manager.setOutputFPS(20)
+
+def test_main_alias(lms):
+  manager = newManager(lms)
+  manager.startPipe(grid = True)
+
+  with warnings.catch_warnings(record = True) as caught:
+    warnings.simplefilter('always')
+    manager.setOutputFPS(20, main = False)
+  assert lms.state.filters[6]['fps'] == 20
+  assert caught and caught[0].category == DeprecationWarning
+
+  manager.setOutputFPS(15, main = True)
+  assert lms.state.filters[3]['fps'] == 15
+
+def test_channel_info_is_a_copy(lms):
+  manager = newManager(lms)
+  manager.startPipe()
+  chnl = manager.addRTSPSource('rtsp://cam1/stream')
+
+  info = manager.getChannelInfo(chnl)
+  info['outputs'].clear()
+  info['source'] = 'rtsp://other/stream'
+
+  assert manager.getChannelInfo(chnl)['outputs']
+  assert manager.getSourceChannels('rtsp://cam1/stream') == [chnl]
+  assert manager.getChannelInfo(99) == None
+
+def test_failed_negotiation_removes_session(lms):
+  manager = newManager(lms)
+  manager.startPipe()
+
+  lms.state.negotiate = False
+  with pytest.raises(Exception, match = 'RTSP negotiation'):
+    manager.addRTSPSource('rtsp://cam1/stream')
+  assert lms.state.filters[1]['sessions'] == []
+
+  lms.state.negotiate = True
+  chnl = manager.addRTSPSource('rtsp://cam1/stream')
+  assert len(lms.state.filters[1]['sessions']) == 1
+  assert manager.getChannelInfo(chnl)['sessionId'] == lms.state.filters[1]['sessions'][0]['id']
+
+def test_failed_connection_removes_session(lms, monkeypatch):
+  manager = newManager(lms)
+  manager.startPipe()
+
+  def fail(*args, **kwargs):
+    raise Exception("Failed creating filters")
+  monkeypatch.setattr(manager, 'connectInputSource', fail)
+  with pytest.raises(Exception, match = 'Failed creating filters'):
+    manager.addRTSPSource('rtsp://cam1/stream')
+  assert lms.state.filters[1]['sessions'] == []
+
+def newOutputs():
+  return [Output.Output('main', 1920, 1080, sharedMemory = True), Output.Output('hd', 1280, 720),
+          Output.Output('mobile', 640, 360), Output.Output('grid', 1280, 720, grid = True)]
+
+def test_fresh_instance_adopts_every_output(lms):
+  first = newManager(lms)
+  first.startPipe(outputs = newOutputs())
+  first.addRTSPSource('rtsp://cam1/stream')
+  first.addRTSPSource('rtsp://cam2/stream')
+
+  manager = newManager(lms)
+  chnl = manager.addRTSPSource('rtsp://cam3/stream')
+  assert [(o.name, o.mixerId, o.grid) for o in manager.getOutputs()] == \
+         [('main', 4, False), ('hd', 7, False), ('mobile', 10, False), ('grid', 13, True)]
+  assert manager.getSharedMemoryId() == lms.state.filters[15]['memoryId']
+  for mixerId in (4, 7, 10, 13):
+    assert chnl in [c['id'] for c in lms.state.filters[mixerId]['channels']]
+
+def test_fresh_instance_refuses_undecidable_grid(lms):
+  newManager(lms).startPipe(outputs = newOutputs())
+  del lms.state.filters[2]['connections']
+
+  with pytest.raises(Exception, match = 'grid outputs'):
+    newManager(lms).setOutputFPS(20)
+
+def test_fresh_instance_refuses_unknown_layout(lms):
+  newManager(lms).startPipe(grid = True)
+  path = lms.state.paths.pop(2)
+  path['id'] = 7
+  lms.state.paths[7] = path
+
+  with pytest.raises(Exception, match = 'layout'):
+    newManager(lms).setOutputFPS(20)
+
+def runThreads(targets):
+  errors = []
+  def run(target):
+    try:
+      target()
+    except Exception as e:
+      errors.append(e)
+
+  threads = [threading.Thread(target = run, args = (target,)) for target in targets]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join(30)
+  return errors
+
+def test_concurrent_adds_removes_and_queries(lms):
+  manager = newManager(lms)
+  manager.startPipe(grid = True)
+  done = threading.Event()
+
+  def churn(idx):
+    for j in range(4):
+      source = 'rtsp://cam{}/stream{}'.format(*[idx, j])
+      chnl = manager.addRTSPSource(source)
+      assert manager.getSourceChannels(source) == [chnl]
+      manager.removeInputChannel(chnl)
+
+  def query():
+    while not done.is_set():
+      for chnl in range(1, 10):
+        manager.getChannelSource(chnl)
+        manager.getChannelInfo(chnl)
+      manager.getSourceChannels('rtsp://cam0/stream0')
+
+  workers = [lambda idx = idx: churn(idx) for idx in range(3)]
+  def churnAll():
+    try:
+      assert not runThreads(workers)
+    finally:
+      done.set()
+
+  assert runThreads([churnAll, query, query]) == []
+  assert manager.registry.getChannels() == []
+
+def test_concurrent_queries_adopt_once(lms):
+  newManager(lms).startPipe(grid = True)
+  manager = newManager(lms)
+  adopted = []
+  adoptPipe = manager.adoptPipe
+  def record(state):
+    adopted.append(state)
+    return adoptPipe(state)
+  manager.adoptPipe = record
+
+  assert runThreads([manager.getEncoderParams, manager.getSharedMemoryId, manager.updateGrid] * 2) == []
+  assert len(adopted) == 1
+  assert len(manager.outputs) == 2
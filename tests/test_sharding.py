@@ -0,0 +1,100 @@
+import pytest
+
+import lmstest
+from lmstest import load
+
+HashRing = load('HashRing')
+ShardedSecurityManager = load('ShardedSecurityManager')
+
+@pytest.fixture
+def pool():
+  servers = [lmstest.FakeLMS() for i in range(3)]
+  yield servers
+  for server in servers:
+    server.close()
+
+def newSharded(pool, count, capacity = 16):
+  sharded = ShardedSecurityManager.ShardedSecurityManager()
+  for i in range(count):
+    sharded.addNode('node{}'.format(*[i]), '127.0.0.1', pool[i].port, capacity)
+  sharded.startPipe()
+  return sharded
+
+def getSessions(server):
+  return [session['id'] for session in server.state.filters.get(1, {}).get('sessions', [])]
+
+def test_ring_moves_only_taken_keys():
+  ring = HashRing.HashRing()
+  ring.addNode('a')
+  ring.addNode('b')
+  keys = ['rtsp://cam{}/stream'.format(*[i]) for i in range(200)]
+  before = dict((key, ring.getNode(key)) for key in keys)
+
+  ring.addNode('c')
+  after = dict((key, ring.getNode(key)) for key in keys)
+  moved = [key for key in keys if before[key] != after[key]]
+  assert moved
+  assert all(after[key] == 'c' for key in moved)
+  assert sorted(ring.getNodes(keys[0])) == ['a', 'b', 'c']
+
+  ring.removeNode('c')
+  assert dict((key, ring.getNode(key)) for key in keys) == before
+
+def test_duplicate_source_counted_once(pool):
+  sharded = newSharded(pool, 1, capacity = 1)
+  chnl1 = sharded.addRTSPSource('rtsp://cam1/stream')
+  chnl2 = sharded.addRTSPSource('rtsp://CAM1:554/stream')
+
+  assert sharded.getLoads()['node0']['load'] == 1
+  with pytest.raises(Exception):
+    sharded.addRTSPSource('rtsp://cam2/stream')
+
+  sharded.removeInputChannel(chnl1)
+  assert sharded.getLoads()['node0']['load'] == 1
+  sharded.removeInputChannel(chnl2)
+  assert sharded.getLoads()['node0']['load'] == 0
+
+def test_rebalance_attaches_before_detaching(pool):
+  sharded = newSharded(pool, 1)
+  channels = [sharded.addRTSPSource('rtsp://cam{}/stream'.format(*[i])) for i in range(8)]
+
+  calls = []
+  manager = sharded.nodes['node0']['manager']
+  removeInputChannel = manager.removeInputChannel
+  def recordRemove(localChannel):
+    calls.append(('remove', localChannel))
+    return removeInputChannel(localChannel)
+  manager.removeInputChannel = recordRemove
+
+  sharded.addNode('node1', '127.0.0.1', pool[1].port, rebalance = False)
+  manager = sharded.nodes['node1']['manager']
+  addRTSPSource = manager.addRTSPSource
+  def recordAdd(uri, keepAlive):
+    calls.append(('add', uri))
+    return addRTSPSource(uri, keepAlive)
+  manager.addRTSPSource = recordAdd
+
+  sharded.rebalance()
+  moved = [c for c in channels if sharded.getChannelNode(c)[0] == 'node1']
+  assert moved
+  assert [call[0] for call in calls] == ['add', 'remove'] * len(moved)
+
+  for channel in moved:
+    node, localChannel = sharded.getChannelNode(channel)
+    assert sharded.nodes['node1']['manager'].getChannelInfo(localChannel) != None
+
+  assert len(getSessions(pool[0])) + len(getSessions(pool[1])) == len(channels)
+  loads = sharded.getLoads()
+  assert loads['node0']['load'] + loads['node1']['load'] == len(channels)
+
+def test_remove_node_without_stop_clears_it(pool):
+  sharded = newSharded(pool, 2)
+  channels = [sharded.addRTSPSource('rtsp://cam{}/stream'.format(*[i])) for i in range(6)]
+  removed = sharded.getLoads()['node1']['channels']
+  assert removed
+
+  sharded.removeNode('node1', stop = False)
+  assert getSessions(pool[1]) == []
+  assert len(getSessions(pool[0])) == len(channels)
+  assert all(sharded.getChannelNode(c)[0] == 'node0' for c in channels)
+  assert sharded.getLoads()['node0']['load'] == len(channels)
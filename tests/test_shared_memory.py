@@ -0,0 +1,135 @@
+import random
+import struct
+
+import numpy
+import pytest
+
+from lmstest import load
+
+SharedMemoryReader = load('SharedMemoryReader')
+SharedMemoryWriter = load('SharedMemoryWriter')
+SecurityManager = load('SecurityManager')
+
+MAX_FRAME = 64
+
+def makeFrame(value, width = 4, height = 2):
+  return numpy.full((height, width, 3), value, dtype = numpy.uint8)
+
+@pytest.fixture
+def mmapPath(tmp_path):
+  return str(tmp_path / 'segment')
+
+@pytest.fixture
+def sysvKey():
+  key = random.randint(0x10000000, 0x7fffffff)
+  try:
+    writer = SharedMemoryWriter.SharedMemoryWriter(key = key, maxFrameSize = 16)
+  except Exception as e:
+    pytest.skip('SysV shared memory unavailable: {}'.format(e))
+  writer.close()
+  return key
+
+def test_lms_header_layout(mmapPath):
+  writer = SharedMemoryWriter.SharedMemoryWriter(path = mmapPath, maxFrameSize = MAX_FRAME)
+  writer.buffer[0] = SharedMemoryReader.WRITE_ENABLED
+  writer.writeFrame(makeFrame(5), 4, 2)
+
+  with open(mmapPath, 'rb') as f:
+    raw = f.read()
+  assert len(raw) == 11 + MAX_FRAME
+  assert struct.unpack('<BHHHI', raw[:11]) == (0, 1, 4, 2, 24)
+  assert raw[11:35] == bytes([5]) * 24
+  writer.close()
+
+def test_mmap_round_trip(mmapPath):
+  writer = SharedMemoryWriter.SharedMemoryWriter(path = mmapPath, maxFrameSize = MAX_FRAME)
+  with SharedMemoryReader.SharedMemoryReader(path = mmapPath) as reader:
+    assert reader.getLatestFrame() == None
+    # LMS skips frames until a reader enables writing
+    assert writer.writeFrame(makeFrame(6), 4, 2) == None
+
+    assert reader.waitFrame(block = False) == None
+    assert writer.writeFrame(makeFrame(7), 4, 2) == 1
+    frame = reader.waitFrame(timeout = 1)
+    assert (frame.seqNum, frame.width, frame.height) == (1, 4, 2)
+    assert frame.data.shape == (2, 4, 3)
+    assert (frame.data == 7).all()
+    assert reader.waitFrame(block = False) == None
+    del frame
+  writer.close()
+
+def test_sysv_round_trip(sysvKey):
+  writer = SharedMemoryWriter.SharedMemoryWriter(key = sysvKey, maxFrameSize = MAX_FRAME)
+  reader = SharedMemoryReader.SharedMemoryReader(key = sysvKey, maxFrameSize = MAX_FRAME)
+  try:
+    reader.release()
+    writer.writeFrame(makeFrame(3), 4, 2)
+    frame = reader.getLatestFrame()
+    assert frame.seqNum == 1
+    assert (frame.data == 3).all()
+    del frame
+  finally:
+    reader.close()
+    writer.close()
+
+  # The writer removes the segment on close
+  with pytest.raises(Exception):
+    SharedMemoryReader.SharedMemoryReader(key = sysvKey)
+
+def test_frame_held_until_released(mmapPath):
+  writer = SharedMemoryWriter.SharedMemoryWriter(path = mmapPath, maxFrameSize = MAX_FRAME)
+  reader = SharedMemoryReader.SharedMemoryReader(path = mmapPath)
+
+  reader.release()
+  writer.writeFrame(makeFrame(1), 4, 2)
+  first = reader.waitFrame(timeout = 1)
+  assert reader.isValid(first)
+
+  # The segment belongs to the reader, LMS skips frames meanwhile
+  assert writer.writeFrame(makeFrame(2), 4, 2) == None
+  assert reader.isValid(first)
+  assert int(first.data[0, 0, 0]) == 1
+
+  assert reader.waitFrame(block = False) == None
+  assert not reader.isValid(first)
+  assert writer.writeFrame(makeFrame(3), 4, 2) == 2
+  second = reader.waitFrame(timeout = 1)
+  assert (second.seqNum, int(second.data[0, 0, 0])) == (2, 3)
+
+  del first, second
+  reader.close()
+  writer.close()
+
+def test_oversized_frame(mmapPath):
+  writer = SharedMemoryWriter.SharedMemoryWriter(path = mmapPath, maxFrameSize = 8)
+  with pytest.raises(Exception):
+    writer.writeFrame(bytes(9), 3, 3)
+  writer.close()
+
+def test_unknown_layout_rejected(mmapPath):
+  with open(mmapPath, 'wb') as f:
+    f.write(struct.pack('<BHHHI', 7, 1, 4, 2, 24) + bytes(32))
+  with pytest.raises(Exception, match = 'LMS sharedMemory'):
+    SharedMemoryReader.SharedMemoryReader(path = mmapPath)
+
+  with open(mmapPath, 'wb') as f:
+    f.write(struct.pack('<BHHHI', 0, 1, 4, 2, 1000) + bytes(32))
+  with pytest.raises(Exception, match = 'LMS sharedMemory'):
+    SharedMemoryReader.SharedMemoryReader(path = mmapPath)
+
+def test_manager_reader_attaches_to_pipe_segment(lms, sysvKey):
+  manager = SecurityManager.SecurityManager('127.0.0.1', lms.port)
+  manager.startPipe()
+  lms.state.filters[manager.sharedMemoryId]['memoryId'] = sysvKey
+
+  writer = SharedMemoryWriter.SharedMemoryWriter(key = sysvKey)
+  reader = manager.getSharedMemoryReader()
+  try:
+    reader.release()
+    writer.writeFrame(makeFrame(9, 8, 4), 8, 4)
+    frame = reader.waitFrame(timeout = 1)
+    assert frame.data.shape == (4, 8, 3)
+    del frame
+  finally:
+    reader.close()
+    writer.close()
@@ -0,0 +1,66 @@
+import math
+
+from lmstest import load
+
+StateHistory = load('StateHistory')
+
+def newState(*fIds):
+  return {'filters': [{'id': fId, 'type': 'videoEncoder', 'bitrate': fId * 100} for fId in fIds], 'paths': []}
+
+def test_flatten_state():
+  values = StateHistory.flattenState({'filters': [{'id': 4, 'type': 'videoMixer', 'fps': 25,
+                                                  'channels': [{'id': 1}, {'id': 2}]}],
+                                      'paths': [{'id': 1}]})
+  assert values == {'filters': 1.0, 'paths': 1.0, 'channels': 2, 'sessions': 0.0,
+                    '4.fps': 25.0, '4.channels': 2.0}
+
+def test_ring_keeps_last_rows():
+  history = StateHistory.StateHistory(None, capacity = 3)
+  for t in range(5):
+    history.sample(newState(3), timestamp = t)
+
+  res = history.query()
+  assert list(res['time']) == [2, 3, 4]
+  assert list(history.query(start = 3)['time']) == [3, 4]
+  assert list(history.query(filterId = 3)) == ['time', '3.bitrate']
+
+def test_missing_filters_are_nan():
+  history = StateHistory.StateHistory(None, capacity = 4)
+  history.sample(newState(3, 4), timestamp = 0)
+  history.sample(newState(3), timestamp = 1)
+
+  column = history.query(fields = ['bitrate'])['4.bitrate']
+  assert column[0] == 400
+  assert math.isnan(column[1])
+
+def test_columns_of_gone_filters_are_reclaimed():
+  history = StateHistory.StateHistory(None, capacity = 2, maxColumns = 5)
+  history.sample(newState(3), timestamp = 0)
+  assert len(history.getColumnNames()) == 6
+
+  history.sample(newState(4), timestamp = 1)
+  assert '4.bitrate' in history.dropped
+
+  # Filter 3 is still in the ring, its column cannot be reclaimed yet
+  history.sample(newState(4), timestamp = 2)
+  assert '4.bitrate' not in history.getColumnNames()
+
+  # Once no stored row holds filter 3, its column is reused
+  history.sample(newState(4), timestamp = 3)
+  history.sample(newState(4), timestamp = 4)
+  assert '3.bitrate' not in history.getColumnNames()
+  assert '4.bitrate' in history.getColumnNames()
+  assert list(history.query()['4.bitrate'])[-1] == 400
+  assert not history.dropped
+
+def test_columns_of_the_same_row_are_not_reclaimed():
+  history = StateHistory.StateHistory(None, capacity = 1, maxColumns = 2)
+  history.append(0, {'1.x': 1.0, '1.y': 1.0})
+  history.append(1, {})
+
+  history.append(2, {'2.a': 1.0, '2.b': 2.0, '2.c': 3.0})
+  assert history.getColumnNames() == ['time', '2.a', '2.b']
+  assert history.dropped == set(['2.c'])
+  row = history.query()
+  assert row['2.a'][0] == 1.0
+  assert row['2.b'][0] == 2.0
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+from lmstest import load
+
+StateWatcher = load('StateWatcher')
+LMSManager = load('LMSManager')
+
+STATE = {'filters': [{'id': 4, 'type': 'videoMixer', 'channels': [{'id': 1, 'enabled': True}]}],
+         'paths': [{'id': 1, 'originFilter': 3, 'destinationFilter': 2}]}
+
+class CountingLMS:
+  def __init__(self, state):
+    self.state = state
+    self.calls = 0
+    self.active = 0
+    self.maxActive = 0
+    self.lock = threading.Lock()
+
+  def pollState(self):
+    with self.lock:
+      self.calls += 1
+      self.active += 1
+      self.maxActive = max(self.maxActive, self.active)
+    try:
+      return self.state
+    finally:
+      with self.lock:
+        self.active -= 1
+
+def test_diff():
+  old = StateWatcher.indexState(STATE)
+  new = StateWatcher.indexState({'filters': [{'id': 4, 'type': 'videoMixer', 'channels': [{'id': 1, 'enabled': False},
+                                                                                       {'id': 2, 'enabled': True}]}],
+                                 'paths': []})
+
+  changes = StateWatcher.diffRecords(old, new)
+  byKind = dict(((c['type'], c['kind'], c['id']), c) for c in changes)
+  assert byKind[('changed', 'channel', 1)] == {'type': 'changed', 'kind': 'channel', 'id': 1, 'filterId': 4,
+                                               'changes': {'enabled': [True, False]}}
+  assert ('added', 'channel', 2) in byKind
+  assert byKind[('removed', 'path', 1)] == {'type': 'removed', 'kind': 'path', 'id': 1}
+  assert len(changes) == 3
+  assert StateWatcher.diffRecords(new, new) == []
+
+def test_subscribe_gets_snapshot_and_changes():
+  lms = CountingLMS(STATE)
+  watcher = StateWatcher.StateWatcher(lms, interval = 0.01)
+  q = watcher.subscribe()
+  first = q.get(timeout = 1)
+  assert ('added', 'filter', 4) in [(c['type'], c['kind'], c['id']) for c in first]
+
+  other = watcher.subscribe()
+  assert other.get(timeout = 1) == StateWatcher.diffRecords({}, watcher.records)
+
+  watcher.unsubscribe(q)
+  watcher.unsubscribe(other)
+  assert watcher.thread == None
+
+def test_resubscribe_runs_a_single_thread():
+  lms = CountingLMS(STATE)
+  watcher = StateWatcher.StateWatcher(lms, interval = 0.01)
+  for i in range(20):
+    q = watcher.subscribe()
+    watcher.unsubscribe(q)
+
+  q = watcher.subscribe()
+  threads = [t for t in threading.enumerate() if t.name == 'StateWatcher']
+  assert len(threads) == 1
+  watcher.unsubscribe(q)
+  assert lms.maxActive == 1
+  assert [t for t in threading.enumerate() if t.name == 'StateWatcher'] == []
+
+def test_watchers_shared_per_interval(lms):
+  manager = LMSManager.LMSManager('127.0.0.1', lms.port)
+  manager.createFilter(4, 'videoMixer')
+  fast = manager.watch(0.01, timeout = 0.2)
+  slow = manager.watch(0.05, timeout = 0.2)
+  again = manager.watch(0.01, timeout = 0.2)
+  next(fast)
+  next(slow)
+  next(again)
+
+  assert sorted(manager.watchers) == [0.01, 0.05]
+  assert len(manager.watchers[0.01].subscribers) == 2
+  assert len(manager.watchers[0.05].subscribers) == 1
+  for gen in (fast, slow, again):
+    gen.close()
+  assert all(not watcher.subscribers for watcher in manager.watchers.values())
+
+def test_polls_print_nothing(lms, capsys):
+  StateHistory = load('StateHistory')
+  manager = LMSManager.LMSManager('127.0.0.1', lms.port)
+  manager.createFilter(4, 'videoMixer')
+  capsys.readouterr()
+
+  assert StateWatcher.StateWatcher(manager).poll()
+  assert StateHistory.StateHistory(manager).sample()
+  assert capsys.readouterr().out == ''
+  assert [event['action'] for event in lms.state.log] == ['createFilter', 'getState', 'getState']
+
+def test_awatch():
+  lms = CountingLMS(STATE)
+  watcher = StateWatcher.StateWatcher(lms, interval = 0.01)
+
+  async def first():
+    async for change in watcher.awatch():
+      return change
+
+  change = asyncio.run(first())
+  assert (change['kind'], change['id']) in [('filter', 4), ('channel', 1), ('path', 1)]
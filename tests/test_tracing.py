@@ -0,0 +1,76 @@
+import pytest
+
+from lmstest import load
+
+Tracing = load('Tracing')
+LMSManager = load('LMSManager')
+
+@pytest.fixture
+def tracer():
+  tracer = Tracing.enable()
+  yield tracer
+  Tracing.disable()
+
+class Traced:
+  @Tracing.traced
+  def run(self, fail = False):
+    if fail:
+      raise ValueError("failed")
+    return 1
+
+def test_traced_records_spans_and_errors(tracer):
+  assert Traced().run() == 1
+  with pytest.raises(ValueError):
+    Traced().run(fail = True)
+
+  events = tracer.getEvents()
+  assert [e['name'] for e in events] == ['Traced.run', 'Traced.run']
+  assert events[1]['args'] == {'error': 'failed'}
+
+def test_end_on_another_tracer_keeps_result():
+  Tracing.enable()
+  try:
+    span = Tracing.begin('outer')
+    Tracing.enable()
+    # The new tracer has no stack in this thread, ending must not raise
+    Tracing.end(span)
+  finally:
+    Tracing.disable()
+
+def test_foreign_span_keeps_the_stack():
+  Tracing.enable()
+  try:
+    foreign = Tracing.begin('foreign')
+    tracer = Tracing.enable()
+    outer = Tracing.begin('outer')
+    Tracing.end(foreign)
+    inner = Tracing.begin('inner')
+    Tracing.end(inner)
+    Tracing.end(outer)
+  finally:
+    Tracing.disable()
+
+  assert [e['name'] for e in tracer.getEvents()] == ['inner', 'outer']
+  assert tracer.local.stack == []
+
+def test_sampling_is_decided_on_roots():
+  tracer = Tracing.enable(sampleRate = 0)
+  try:
+    root = Tracing.begin('root')
+    child = Tracing.begin('child')
+    Tracing.end(child)
+    Tracing.end(root)
+  finally:
+    Tracing.disable()
+
+  assert tracer.getEvents() == []
+
+def test_batch_span_records_actions(lms, tracer):
+  manager = LMSManager.LMSManager('127.0.0.1', lms.port)
+  manager.sendEvents({'events': [{'action': 'createFilter', 'params': {'id': 3, 'type': 'videoEncoder'}},
+                                 {'action': 'createFilter', 'params': {'id': 4, 'type': 'videoMixer'}},
+                                 {'action': 'configure', 'filterId': 3, 'params': {'fps': 25}}]})
+
+  span = [e for e in tracer.getEvents() if e['cat'] == 'lms' and e['name'] != 'parse'][0]
+  assert span['name'] == 'createFilter+configure'
+  assert span['args']['actions'] == ['createFilter', 'createFilter', 'configure']
@@ -0,0 +1,66 @@
+import os
+import socket
+
+import pytest
+
+import lmstest
+from lmstest import load
+
+LMSManager = load('LMSManager')
+Transport = load('Transport')
+
+def test_plain_host():
+  transport = Transport.createTransport('10.0.0.1', 7777)
+  assert isinstance(transport, Transport.TCPTransport)
+  assert transport.getAddress() == ('10.0.0.1', 7777)
+  assert transport.nodelay and not transport.keepalive
+
+def test_tcp_options():
+  transport = Transport.createTransport('tcp://127.0.0.1:7777?nodelay=0&keepalive=yes&sndbuf=65536&rcvbuf=32768')
+  assert transport.getAddress() == ('127.0.0.1', 7777)
+  assert not transport.nodelay
+  assert transport.keepalive
+  assert (transport.sndbuf, transport.rcvbuf) == (65536, 32768)
+  assert str(transport) == 'tcp://127.0.0.1:7777'
+
+  sock = transport.createSocket()
+  try:
+    assert not sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+  finally:
+    sock.close()
+
+  sock = Transport.createTransport('tcp://127.0.0.1:7777').createSocket()
+  try:
+    assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+  finally:
+    sock.close()
+
+def test_unix_options():
+  transport = Transport.createTransport('unix:///run/lms.sock?sndbuf=4096')
+  assert isinstance(transport, Transport.UnixTransport)
+  assert transport.getAddress() == '/run/lms.sock'
+  assert (transport.sndbuf, transport.rcvbuf) == (4096, None)
+
+def test_invalid_addresses():
+  with pytest.raises(Exception, match = 'host and a port'):
+    Transport.createTransport('tcp://127.0.0.1')
+  with pytest.raises(Exception, match = 'host and a port'):
+    Transport.createTransport('tcp://:7777')
+  with pytest.raises(Exception, match = 'needs a path'):
+    Transport.createTransport('unix://')
+  with pytest.raises(Exception, match = 'Unsupported transport udp'):
+    Transport.createTransport('udp://127.0.0.1:7777')
+
+def test_unix_round_trip(tmp_path):
+  address = 'unix://' + os.path.join(str(tmp_path), 'lms.sock')
+  server = lmstest.FakeLMS(address)
+  try:
+    manager = LMSManager.LMSManager(address)
+    manager.createFilter(1, 'receiver')
+    state = manager.getState()
+  finally:
+    server.close()
+
+  assert [cFilter['id'] for cFilter in state['filters']] == [1]
+  assert [event['action'] for event in server.state.log] == ['createFilter', 'getState']